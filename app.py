@@ -2,13 +2,29 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 import time
-from generator import configure_genai, generate_outline, generate_chapter, generate_ebook_metadata
-from document_maker import create_ebook
-from io import BytesIO
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import generator
+from generator import configure_genai, set_error_handler, generate_chapters, generate_ebook_metadata
+from metrics import key_fingerprint
+from prompts import TONE_OPTIONS, CASE_STUDY_OPTIONS, EMOTIONAL_TONE_OPTIONS
+from job_journal import JobJournal
+from pipeline import build_ebook_pipeline, PipelineError
+from artifact_store import ArtifactStore
+from ooxml_writer import write_ebook
+import preview
+import tracing
 
 # Load environment variables
 load_dotenv()
 
+# The generator core only logs; surface its errors in the page when there is a page to show them on
+def show_generator_error(message):
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        st.error(message)
+
+set_error_handler(show_generator_error)
+
 st.set_page_config(page_title="Ebook Generator Gemini AI", layout="centered", page_icon="📚", initial_sidebar_state="collapsed")
 
 # Custom CSS for better UI
@@ -48,8 +64,15 @@ if "form_data" not in st.session_state:
 
 if "outline" not in st.session_state:
     st.session_state.outline = []
-if "ebook_buffer" not in st.session_state:
-    st.session_state.ebook_buffer = None
+# Finished ebooks live on disk; the session (and the URL) only hold the artifact ID
+artifact_store = ArtifactStore()
+if "artifact_id" not in st.session_state:
+    # A reconnecting user gets their ebook back from the ?artifact= link
+    st.session_state.artifact_id = st.query_params.get("artifact")
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+if "stage_timings" not in st.session_state:
+    st.session_state.stage_timings = {}
 
 # Sidebar for API Key
 with st.sidebar:
@@ -114,6 +137,58 @@ with st.sidebar:
     else:
         st.sidebar.error("❌ Gagal menghubungkan API Key.")
 
+    # Number of chapters written at the same time
+    max_workers = st.slider("Bab ditulis bersamaan", min_value=1, max_value=8, value=4, help="Semakin banyak, semakin cepat, tapi kuota API terpakai lebih cepat juga.")
+
+    # Identical requests are served from the response cache unless the user wants fresh output.
+    # The choice lives in this session and is passed to each call; other sessions keep their own.
+    st.checkbox("🔄 Paksa hasil baru (abaikan cache)", value=False, key="force_fresh", help="Centang jika ingin AI menulis ulang meskipun isian form sama persis dengan sebelumnya.")
+
+    # Usage of the API since the server started (all sessions share one process)
+    with st.expander("📊 Statistik API"):
+        summary = generator.call_metrics.summary()
+        m1, m2 = st.columns(2)
+        m1.metric("Panggilan API", summary["calls"])
+        m2.metric("Dari Cache", summary["cache_hits"])
+        m1.metric("Token Prompt", f"{summary['prompt_tokens']:,}")
+        m2.metric("Token Output", f"{summary['output_tokens']:,}")
+        if summary["latency_p50"] is not None:
+            m1.metric("Latensi p50", f"{summary['latency_p50']:.1f} dtk")
+            m2.metric("Latensi p95", f"{summary['latency_p95']:.1f} dtk")
+
+        # Headroom per key, so it is clear which key is closest to its quota
+        if generator.key_pool is not None:
+            rows = []
+            for slot in generator.key_pool.snapshot():
+                index = int(slot["key"].lstrip("#")) - 1
+                key_stats = summary["keys"].get(key_fingerprint(generator.key_pool.keys[index]), {})
+                rows.append({
+                    "Key": slot["key"],
+                    "Sisa Request/menit": slot["requests_left"],
+                    "Sisa Token/menit": slot["tokens_left"],
+                    "Panggilan": key_stats.get("calls", 0),
+                    "Kena 429": key_stats.get("quota_errors", 0),
+                    "Token": key_stats.get("tokens", 0),
+                    "Istirahat": ", ".join(slot["cooling_models"]) or "-",
+                })
+            st.dataframe(rows, hide_index=True)
+
+        if summary["continuations"]:
+            st.caption(f"Bab terpotong/kurang panjang yang dilanjutkan: {summary['continuations']}x")
+        if summary["cached_tokens"]:
+            st.caption(f"Token prompt dari cache konteks: {summary['cached_tokens']:,}")
+        if summary["finish_reasons"]:
+            st.caption("Alasan selesai: " + ", ".join(f"{k} {v}" for k, v in sorted(summary["finish_reasons"].items())))
+        if summary["errors"]:
+            st.caption("Error: " + ", ".join(f"{k} {v}" for k, v in sorted(summary["errors"].items())))
+
+        st.download_button(
+            "⬇️ Ekspor Metrik (Prometheus)",
+            data=generator.call_metrics.to_prometheus,
+            file_name="metrics.prom",
+            mime="text/plain"
+        )
+
 # Main UI
 st.markdown('<div class="main-header">Ebook Generator Gemini AI</div>', unsafe_allow_html=True)
 
@@ -131,7 +206,7 @@ with col2:
             st.error("Masukkan API Key di sidebar!")
         else:
             with st.spinner("Menganalisis topik..."):
-                metadata = generate_ebook_metadata(topic)
+                metadata = generate_ebook_metadata(topic, use_cache=not st.session_state.force_fresh)
                 if metadata:
                     st.session_state.form_data.update(metadata)
                     st.session_state.form_data["topic"] = topic
@@ -147,11 +222,11 @@ c1, c2 = st.columns(2)
 with c1:
     st.session_state.form_data["num_chapters"] = st.number_input("Jumlah Bab", min_value=1, max_value=20, value=st.session_state.form_data["num_chapters"])
 with c2:
-    st.session_state.form_data["word_count"] = st.number_input("Target Kata per Bab", min_value=500, max_value=5000, value=st.session_state.form_data["word_count"], help="Saran: 1500-2000 kata untuk pembahasan mendalam.")
+    st.session_state.form_data["word_count"] = st.number_input("Target Kata per Bab", min_value=500, max_value=5000, value=st.session_state.form_data["word_count"], help="Saran: 1500-2000 kata untuk pembahasan mendalam. Mulai 2500 kata, tiap bab ditulis per bagian secara bersamaan agar lebih cepat dan tidak terpotong.")
 
 st.session_state.form_data["tone"] = st.selectbox("Gaya Bahasa", 
-    ["Lucu, Santai, dan Mengena", "Formal & Profesional", "Motivasi Menggebu-gebu", "Sarkas & Humoris", "Empatik & Lembut"], 
-    index=0 if st.session_state.form_data["tone"] not in ["Lucu, Santai, dan Mengena", "Formal & Profesional", "Motivasi Menggebu-gebu", "Sarkas & Humoris", "Empatik & Lembut"] else ["Lucu, Santai, dan Mengena", "Formal & Profesional", "Motivasi Menggebu-gebu", "Sarkas & Humoris", "Empatik & Lembut"].index(st.session_state.form_data["tone"])
+    TONE_OPTIONS, 
+    index=0 if st.session_state.form_data["tone"] not in TONE_OPTIONS else TONE_OPTIONS.index(st.session_state.form_data["tone"])
 )
 
 # Advanced Settings
@@ -164,11 +239,171 @@ with st.expander("⚙️ Penguat Kualitas Naskah", expanded=True):
     
     ac1, ac2 = st.columns(2)
     with ac1:
-        st.session_state.form_data["case_study_type"] = st.selectbox("Jenis Studi Kasus", ["Kantoran umum (HR, atasan, tim)", "Bisnis Online / UMKM", "Kehidupan Rumah Tangga", "Mahasiswa / Akademik", "Freelancer / Remote Work"], index=0)
+        st.session_state.form_data["case_study_type"] = st.selectbox("Jenis Studi Kasus", CASE_STUDY_OPTIONS, index=0 if st.session_state.form_data["case_study_type"] not in CASE_STUDY_OPTIONS else CASE_STUDY_OPTIONS.index(st.session_state.form_data["case_study_type"]))
     with ac2:
-        st.session_state.form_data["emotional_tone"] = st.selectbox("Nada Emosional Dominan", ["Satir tajam (menyindir realitas)", "Optimis & Membangun", "Realistis & Logis", "Provokatif & Menantang"], index=0)
+        st.session_state.form_data["emotional_tone"] = st.selectbox("Nada Emosional Dominan", EMOTIONAL_TONE_OPTIONS, index=0 if st.session_state.form_data["emotional_tone"] not in EMOTIONAL_TONE_OPTIONS else EMOTIONAL_TONE_OPTIONS.index(st.session_state.form_data["emotional_tone"]))
+
+# Progress labels for the pipeline stages that take noticeable time
+STAGE_LABELS = {
+    "outline": "Merancang struktur ebook",
+    "preface": "Menulis Kata Pengantar",
+    "conclusion": "Menulis Penutup",
+    "chapters": "Menulis bab",
+    "ebook": "Menyusun Ebook",
+}
+
+# Ebook job runner: every artifact is journaled as soon as it exists, so a failed run can resume
+def run_ebook_job(job):
+    st.session_state.job_id = job.job_id
+    use_cache = not st.session_state.force_fresh
+    st.query_params["job"] = job.job_id
+    st.info(f"🆔 ID Pekerjaan: `{job.job_id}` (simpan untuk melanjutkan jika proses terhenti)")
+
+    status_text = st.empty()
+    active_stages = []
+
+    def on_stage_start(name):
+        if name in STAGE_LABELS:
+            active_stages.append(name)
+            status_text.text(" • ".join(STAGE_LABELS[n] for n in active_stages) + "...")
+
+    def on_stage_done(name, seconds, error):
+        print(f"Stage '{name}' finished in {seconds:.1f}s" + (f" with error: {error}" if error else ""))
+        if name in active_stages:
+            active_stages.remove(name)
+            status_text.text(" • ".join(STAGE_LABELS[n] for n in active_stages) + ("..." if active_stages else ""))
+
+    # Worker threads need the script context so st.error calls inside the generator still render
+    script_ctx = get_script_run_ctx()
+
+    def attach_script_ctx():
+        add_script_run_ctx(threading.current_thread(), script_ctx)
+
+    def chapters_stage(metadata, outline, on_chapter):
+        st.session_state.outline = outline
+        topic = metadata["topic"]
+        form_data = metadata["form_data"]
+
+        # Generate Content (chapters are independent, so write them concurrently)
+        existing_chapters = job.load_chapters(outline)
+        chapter_statuses = []
+        chapter_previews = []
+        for i, chapter_title in enumerate(outline):
+            if existing_chapters[i] is not None:
+                chapter_status = st.status(f"✅ Bab {i+1}: {chapter_title} (tersimpan)", state="complete", expanded=False)
+            else:
+                chapter_status = st.status(f"⏳ Bab {i+1}: {chapter_title}", expanded=False)
+            chapter_statuses.append(chapter_status)
+            chapter_previews.append(chapter_status.empty())
+            if existing_chapters[i] is not None:
+                chapter_previews[i].html(preview.wrap(preview.chapter_html(i + 1, *existing_chapters[i])))
+
+        # Streamed text is buffered by the worker threads and drawn on the script thread
+        chapter_buffers = [[] for _ in outline]
+        rendered_lengths = [0] * len(outline)
+
+        def on_chapter_chunk(i, text):
+            chapter_buffers[i].append(text)
+
+        def render_chapter_previews():
+            for i, buffer in enumerate(chapter_buffers):
+                if len(buffer) != rendered_lengths[i]:
+                    rendered_lengths[i] = len(buffer)
+                    chapter_previews[i].markdown("".join(buffer))
+
+        def on_chapter_result(i, chapter_title, content):
+            on_chapter(i, chapter_title, content)
+            # The finished chapter replaces its streamed draft with the formatted preview
+            rendered_lengths[i] = len(chapter_buffers[i])
+            chapter_previews[i].html(preview.wrap(preview.chapter_html(i + 1, chapter_title, content)))
+
+        def on_chapter_update(i, state):
+            label = f"Bab {i+1}: {outline[i]}"
+            if state == "running":
+                chapter_statuses[i].update(label=f"✍️ Menulis {label}...", state="running", expanded=True)
+            elif state == "retrying":
+                chapter_buffers[i].clear()
+                rendered_lengths[i] = 0
+                chapter_previews[i].empty()
+                chapter_statuses[i].update(label=f"🔁 Mengulang {label}...", state="running", expanded=True)
+            elif state == "complete":
+                chapter_statuses[i].update(label=f"✅ {label} Selesai!", state="complete", expanded=False)
+            elif state == "failed":
+                chapter_statuses[i].update(label=f"⚠️ {label} gagal, akan diulang...", state="running")
+            else:
+                chapter_statuses[i].update(label=f"❌ Gagal menulis {label}", state="error")
+
+        results = generate_chapters(
+            topic, outline, form_data,
+            max_workers=max_workers,
+            on_update=on_chapter_update,
+            initializer=attach_script_ctx,
+            on_chunk=on_chapter_chunk,
+            on_tick=render_chapter_previews,
+            existing=existing_chapters,
+            on_result=on_chapter_result,
+            use_cache=use_cache
+        )
+
+        failed_chapters = [i + 1 for i, result in enumerate(results) if result is None]
+        if failed_chapters:
+            raise RuntimeError(f"Gagal menghasilkan Bab {', '.join(map(str, failed_chapters))}.")
+        return results
+
+    # Preface and conclusion only need the form, so they are written alongside the outline and chapters.
+    # The .docx is only built when the user asks for the download.
+    pipeline = build_ebook_pipeline(
+        job, chapters_stage,
+        build_document=False,
+        use_cache=use_cache,
+        initializer=attach_script_ctx,
+        on_node_start=on_stage_start,
+        on_node_done=on_stage_done
+    )
+    # Parent span of the whole run; stages, chapters and API attempts nest under it
+    with tracing.span("ebook.job", job_id=job.job_id):
+        try:
+            pipeline.run()
+        except PipelineError as e:
+            st.error(f"{e} Bagian yang sudah selesai tersimpan; lanjutkan dengan ID Pekerjaan `{job.job_id}`.")
+            return
+
+    book = job.load_book()
+    if not book or not book["complete"]:
+        st.error(f"Ebook belum lengkap. Bagian yang sudah selesai tersimpan; lanjutkan dengan ID Pekerjaan `{job.job_id}`.")
+        return
+
+    st.session_state.artifact_id = None
+    st.query_params.pop("artifact", None)
+    st.session_state.stage_timings = dict(pipeline.timings)
+    st.success("Ebook Berhasil Dibuat!")
+    st.rerun()
+
+def prepare_download(book):
+    """Build the .docx from the journal straight into the artifact store"""
+    topic = book["topic"]
+    file_name = f"{topic.replace(' ', '_')}.docx" if topic else "ebook.docx"
+    started = time.monotonic()
+    with tracing.span("ebook.download", chapters=len(book["chapters"])):
+        artifact_id = artifact_store.put(
+            lambda f: write_ebook(f, topic, book["preface"], book["chapters"], book["conclusion"]),
+            file_name
+        )
+    st.session_state.stage_timings["ebook"] = time.monotonic() - started
+    st.session_state.artifact_id = artifact_id
+    st.query_params["artifact"] = artifact_id
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def preview_html(job_id, version):
+    """HTML preview of a finished job, or None; `version` (JobJournal.version) re-renders it after a change"""
+    job = JobJournal.open(job_id)
+    book = job.load_book() if job else None
+    if not book or not book["complete"]:
+        return None
+    return preview.book_html(book["topic"], book["preface"], book["chapters"], book["conclusion"])
 
 # Action Buttons
+job_to_run = None
 b1, b2 = st.columns([3, 1])
 with b1:
     if st.button("🚀 Buat Ebook", type="primary"):
@@ -177,51 +412,7 @@ with b1:
         elif not topic:
             st.error("Mohon masukkan topik.")
         else:
-            # Generate Outline First
-            with st.spinner("Merancang struktur ebook..."):
-                # Pass all params to generate_outline
-                outline = generate_outline(topic, st.session_state.form_data["num_chapters"])
-                if outline:
-                    st.session_state.outline = outline
-                    
-                    # Generate Preface
-                    status_text = st.empty()
-                    status_text.text("Menulis Kata Pengantar...")
-                    from generator import generate_preface, generate_conclusion
-                    preface = generate_preface(topic, st.session_state.form_data)
-                    
-                    # Generate Content
-                    chapters_content = []
-                    full_outline_str = "\n".join([f"{i+1}. {title}" for i, title in enumerate(outline)])
-
-                    for i, chapter_title in enumerate(outline):
-                        with st.status(f"✍️ Menulis Bab {i+1}: {chapter_title}...", expanded=True) as status:
-                            # Pass chapter_num (i+1) and full outline to generator
-                            content = generate_chapter(topic, chapter_title, st.session_state.form_data, i+1, full_outline_str)
-                            
-                            if content:
-                                chapters_content.append((chapter_title, content))
-                                status.update(label=f"✅ Bab {i+1} Selesai!", state="complete", expanded=False)
-                            else:
-                                status.update(label=f"❌ Gagal menulis Bab {i+1}", state="error")
-                                st.error("Gagal menghasilkan konten bab. Coba lagi.")
-                                st.stop()
-                    
-                    status_text.text("Menulis Penutup...")
-                    conclusion = generate_conclusion(topic, st.session_state.form_data)
-                    
-                    status_text.text("Menyusun Ebook...")
-                    doc = create_ebook(topic, preface, chapters_content, conclusion)
-                    
-                    # Save to buffer
-                    buffer = BytesIO()
-                    doc.save(buffer)
-                    buffer.seek(0)
-                    st.session_state.ebook_buffer = buffer
-                    st.success("Ebook Berhasil Dibuat!")
-                    st.rerun()
-                else:
-                    st.error("Gagal membuat outline.")
+            job_to_run = JobJournal.create(topic, st.session_state.form_data)
 
 with b2:
     if st.button("🔄 Reset"):
@@ -238,16 +429,64 @@ with b2:
             "emotional_tone": "Satir tajam (menyindir realitas)"
         }
         st.session_state.outline = []
-        st.session_state.ebook_buffer = None
+        st.session_state.artifact_id = None
+        st.session_state.job_id = None
+        st.query_params.clear()
         st.rerun()
 
+# Resume a job that stopped part-way (only the missing pieces are generated)
+with st.expander("♻️ Lanjutkan Pekerjaan Sebelumnya", expanded=bool(st.query_params.get("job")) and st.session_state.artifact_id is None):
+    resume_id = st.text_input("ID Pekerjaan", value=st.query_params.get("job", ""), placeholder="Contoh: 3f9a1c2b7d4e")
+    if st.button("▶️ Lanjutkan"):
+        resumed_job = JobJournal.open(resume_id)
+        if resumed_job is None:
+            st.error("ID Pekerjaan tidak ditemukan.")
+        elif not api_keys:
+            st.error("Mohon masukkan Gemini API Key di sidebar.")
+        else:
+            resumed_metadata = resumed_job.load_metadata()
+            st.session_state.form_data.update(resumed_metadata["form_data"])
+            st.session_state.form_data["topic"] = resumed_metadata["topic"]
+            job_to_run = resumed_job
+
+if job_to_run is not None:
+    run_ebook_job(job_to_run)
+
+# Preview of the finished book (also after reconnecting via ?job=); the .docx waits for the button
+preview_job_id = st.session_state.job_id or st.query_params.get("job")
+preview_job = JobJournal.open(preview_job_id) if preview_job_id and job_to_run is None else None
+# Rendered once per version of the journal, not on every rerun
+preview_content = preview_html(preview_job.job_id, preview_job.version()) if preview_job else None
+if preview_content:
+    st.markdown("---")
+    st.subheader("👀 Pratinjau Ebook")
+    with st.container(height=600):
+        st.html(preview_content)
+    if st.session_state.artifact_id is None:
+        if st.button("📦 Siapkan File Unduhan (.docx)"):
+            with st.spinner("Menyusun Ebook..."):
+                prepare_download(preview_job.load_book())
+            st.rerun()
+
 # Download Button - Only show if ebook has been generated
-if st.session_state.ebook_buffer is not None:
+artifact = artifact_store.get(st.session_state.artifact_id) if st.session_state.artifact_id else None
+if st.session_state.artifact_id and artifact is None:
+    st.warning("File ebook sudah kedaluwarsa dari server. Siapkan ulang dari pratinjau, atau lanjutkan dengan ID Pekerjaan.")
+    st.session_state.artifact_id = None
+    st.query_params.pop("artifact", None)
+
+if artifact is not None:
+    artifact_id = st.session_state.artifact_id
     st.markdown("---")
     st.success("✅ Ebook Anda siap diunduh!")
     st.download_button(
         label="📥 Unduh Ebook (.docx)",
-        data=st.session_state.ebook_buffer,
-        file_name=f"{topic.replace(' ', '_')}.docx" if topic else "ebook.docx",
+        # Read from disk only when the button is clicked
+        data=lambda: artifact_store.read(artifact_id),
+        file_name=artifact["file_name"],
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     )
+    if st.session_state.stage_timings:
+        with st.expander("⏱️ Waktu per Tahap"):
+            for stage_name, seconds in st.session_state.stage_timings.items():
+                st.text(f"{STAGE_LABELS.get(stage_name, stage_name)}: {seconds:.1f} detik")
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+DEFAULT_ROOT = ".artifacts"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 60 * 60  # seconds since the last download
+
+_ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactStore:
+    """Spool directory of finished files, addressed by content hash
+
+    Files are written straight to disk (never held whole in memory), survive the
+    Streamlit session, and are evicted after `ttl` seconds without a download or
+    when the spool grows past `max_bytes` (least recently used first). Safe to
+    share between processes: every write lands with an atomic rename.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, artifact_id, suffix):
+        return os.path.join(self.root, f"{artifact_id}{suffix}")
+
+    def _meta_path(self, artifact_id):
+        return self._path(artifact_id, ".json")
+
+    def put(self, write, file_name, suffix=".docx"):
+        """Store what `write(file)` writes; returns the artifact ID (same content, same ID)"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f"incoming-{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "w+b") as f:
+                write(f)
+                f.seek(0)
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                size = f.tell()
+
+            artifact_id = digest.hexdigest()[:32]
+            os.replace(tmp_path, self._path(artifact_id, suffix))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        meta = {"file_name": file_name, "suffix": suffix, "size": size, "created_at": time.time()}
+        meta_tmp = f"{self._meta_path(artifact_id)}.{os.getpid()}.tmp"
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_tmp, self._meta_path(artifact_id))
+
+        self.evict()
+        return artifact_id
+
+    def get(self, artifact_id):
+        """Metadata of a stored artifact plus its `path`, or None if it is unknown or evicted"""
+        if not _ARTIFACT_ID_PATTERN.match(artifact_id or ""):
+            return None
+        try:
+            with open(self._meta_path(artifact_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        path = self._path(artifact_id, meta.get("suffix", ".docx"))
+        if not os.path.exists(path):
+            return None
+        meta["path"] = path
+        return meta
+
+    def read(self, artifact_id):
+        """Bytes of an artifact (for the download itself); marks it as recently used"""
+        meta = self.get(artifact_id)
+        if meta is None:
+            raise FileNotFoundError(f"Artifact {artifact_id} is not in the store")
+        with open(meta["path"], "rb") as f:
+            data = f.read()
+        self._touch(meta["path"])
+        return data
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop artifacts past their TTL, then the least recently used until under max_bytes"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+
+        now = time.time()
+        entries = []
+        for name in names:
+            artifact_id, suffix = os.path.splitext(name)
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue  # Evicted by another process meanwhile
+
+            if suffix == ".tmp":
+                # Left behind by a writer that crashed mid-way
+                if now - stat.st_mtime > self.ttl:
+                    self._remove(os.path.join(self.root, name))
+                continue
+            if suffix == ".json" or not _ARTIFACT_ID_PATTERN.match(artifact_id):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, artifact_id, name))
+
+        entries.sort()
+        total = sum(size for _, size, _, _ in entries)
+        for last_used, size, artifact_id, name in entries:
+            if now - last_used <= self.ttl and total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.root, name))
+            self._remove(self._meta_path(artifact_id))
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
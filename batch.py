@@ -0,0 +1,214 @@
+"""Headless batch generation: build many ebooks from a CSV or JSONL job file
+
+Usage:
+    python batch.py jobs.csv --out output --workers 3
+
+Each row uses the same fields as the form in app.py (topic, target_audience,
+num_chapters, word_count, tone, ...); missing fields take the form defaults.
+API keys come from GEMINI_API_KEY_1..N (or .env), or from --keys-file.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import BaseManager
+
+from dotenv import load_dotenv
+
+from key_pool import KeyPool
+
+# Same defaults as the form in app.py
+DEFAULT_FORM_DATA = {
+    "topic": "",
+    "target_audience": "",
+    "num_chapters": 6,
+    "word_count": 1500,
+    "tone": "Lucu, Santai, dan Mengena",
+    "perspective": "Otomatis (disarankan)",
+    "core_problem": "",
+    "core_message": "",
+    "case_study_type": "Kantoran umum (HR, atasan, tim)",
+    "emotional_tone": "Satir tajam (menyindir realitas)"
+}
+
+INT_FIELDS = ("num_chapters", "word_count")
+
+
+class KeyPoolManager(BaseManager):
+    """Serves one KeyPool to every worker process, so quota is scheduled across all of them"""
+
+
+KeyPoolManager.register(
+    "KeyPool", KeyPool,
+    exposed=("acquire", "release", "report_success", "report_quota_exceeded", "cooldown_remaining", "snapshot", "__len__")
+)
+
+
+def load_keys(keys_file=None):
+    if keys_file:
+        with open(keys_file, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    load_dotenv()
+    keys = []
+    i = 1
+    while True:
+        key = os.getenv(f"GEMINI_API_KEY_{i}")
+        if not key:
+            break
+        keys.append(key)
+        i += 1
+    return keys
+
+
+def load_jobs(path):
+    """Read job rows from .csv or .jsonl and fill in the form defaults"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for row in rows:
+        form_data = dict(DEFAULT_FORM_DATA)
+        form_data.update({k: v for k, v in row.items() if v not in (None, "")})
+        for field in INT_FIELDS:
+            form_data[field] = int(form_data[field])
+        jobs.append(form_data)
+    return jobs
+
+
+def _slug(text):
+    return re.sub(r"[^\w\-]+", "_", text).strip("_")[:60] or "ebook"
+
+
+# ========== WORKER PROCESS ==========
+def _init_worker(keys, pool, metrics_log=None, trace_file=None):
+    import generator
+    import tracing
+    if trace_file:
+        tracing.configure(trace_file)
+    generator.configure_genai(keys)
+    generator.use_key_pool(pool)
+    generator.call_metrics.log_path = metrics_log
+
+
+def _used_tokens(call_metrics):
+    # Cached tokens are already part of the prompt count; adding their own series would count them twice
+    return call_metrics.total("gemini_tokens_total", kind="prompt") + call_metrics.total("gemini_tokens_total", kind="output")
+
+
+def _run_job(index, form_data, out_dir, chapter_workers):
+    from generator import call_metrics, generate_chapters
+    from job_journal import JobJournal
+    from pipeline import build_ebook_pipeline
+    import tracing
+
+    started = time.monotonic()
+    # A worker process runs one book at a time, so the token delta belongs to this book
+    tokens_before = _used_tokens(call_metrics)
+    topic = form_data["topic"]
+    job = JobJournal.create(topic, form_data)
+
+    def chapters_stage(metadata, outline, on_chapter):
+        results = generate_chapters(
+            topic, outline, metadata["form_data"],
+            max_workers=chapter_workers,
+            existing=job.load_chapters(outline),
+            on_result=on_chapter
+        )
+        failed = [i + 1 for i, result in enumerate(results) if result is None]
+        if failed:
+            raise RuntimeError(f"Chapters failed: {failed}")
+        return results
+
+    record = {"index": index, "topic": topic, "job_id": job.job_id}
+    with tracing.span("ebook.job", job_id=job.job_id, topic=topic):
+        try:
+            results = build_ebook_pipeline(job, chapters_stage).run()
+            output = os.path.join(out_dir, f"{index:04d}_{_slug(topic)}.docx")
+            results["ebook"].save(output)
+            record.update(status="ok", output=output, chapters=len(results["chapters"]))
+        except Exception as e:
+            record.update(status="failed", error=str(e), chapters=0)
+    record["seconds"] = round(time.monotonic() - started, 1)
+    record["tokens"] = _used_tokens(call_metrics) - tokens_before
+    return record
+
+
+# ========== MAIN ==========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ebooks in bulk from a CSV or JSONL job file.")
+    parser.add_argument("jobs", help="Path to a .csv or .jsonl file of jobs")
+    parser.add_argument("--out", default="output", help="Directory for .docx files and manifest.jsonl")
+    parser.add_argument("--workers", type=int, default=2, help="Books generated at the same time (processes)")
+    parser.add_argument("--chapter-workers", type=int, default=4, help="Chapters written at the same time per book")
+    parser.add_argument("--keys-file", help="File with one Gemini API key per line")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute allowed per key")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens per minute allowed per key")
+    parser.add_argument("--metrics-log", help="Append one JSON line per API call to this file")
+    parser.add_argument("--trace", help="Append tracing spans (JSONL) to this file")
+    args = parser.parse_args(argv)
+
+    keys = load_keys(args.keys_file)
+    if not keys:
+        print("No API keys found (set GEMINI_API_KEY_1..N or pass --keys-file).", file=sys.stderr)
+        return 2
+
+    jobs = load_jobs(args.jobs)
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.jsonl")
+
+    # Probe models once here; workers then hit the on-disk registry cache
+    import generator
+    generator.configure_genai(keys)
+
+    limits = {k: v for k, v in (("rpm", args.rpm), ("tpm", args.tpm)) if v}
+    manager = KeyPoolManager()
+    manager.start()
+    pool = manager.KeyPool(keys, **limits)
+
+    print(f"Running {len(jobs)} job(s) on {args.workers} worker(s) with {len(keys)} key(s)")
+    started = time.monotonic()
+    done_books = 0
+    done_chapters = 0
+
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest, \
+                ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(keys, pool, args.metrics_log, args.trace)) as executor:
+            futures = [
+                executor.submit(_run_job, i, form_data, args.out, args.chapter_workers)
+                for i, form_data in enumerate(jobs)
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+                manifest.flush()
+
+                if record["status"] == "ok":
+                    done_books += 1
+                    done_chapters += record["chapters"]
+                elapsed = time.monotonic() - started
+                print(
+                    f"[{record['status']}] #{record['index']} {record['topic']} ({record['seconds']}s, {record['tokens']} tokens) | "
+                    f"{done_books / elapsed * 3600:.1f} books/h, {done_chapters / elapsed * 60:.1f} chapters/min"
+                )
+    finally:
+        manager.shutdown()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Done: {done_books}/{len(jobs)} book(s) in {elapsed:.0f}s | "
+        f"{done_books / elapsed * 3600:.1f} books/h, {done_chapters / elapsed * 60:.1f} chapters/min"
+    )
+    print(f"Manifest: {manifest_path}")
+    return 0 if done_books == len(jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Build time, save time, peak memory and size of the ebook writers across book sizes
+
+Usage:
+    python benchmarks/bench_ebook.py [--sizes small default large extreme] [--runs 3]
+    python benchmarks/bench_ebook.py --builders python-docx ooxml-stream
+
+Chapters are synthetic markdown shaped like Gemini output (filler opener, meta
+headings, subheadings, bullet and numbered lists, a golden quote and a LANGKAH
+NYATA action plan). Every case runs in a fresh process so peak RSS is its own.
+Each run is appended to benchmarks/results/bench_ebook.jsonl and compared with
+the previous run, so regressions show up between versions.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "bench_ebook.jsonl")
+
+# (chapters, words per chapter); "extreme" is the form's maximum in app.py
+SIZES = {
+    "small": (3, 800),
+    "default": (6, 1500),
+    "large": (12, 3000),
+    "extreme": (20, 5000),
+}
+
+VOCABULARY = (
+    "atasan tim kerja ide proposal rapat target waktu strategi data fokus energi kebiasaan "
+    "langkah hasil masalah solusi komunikasi karier pagi disiplin prioritas kantor deadline "
+    "email notifikasi kopi senin lembur presentasi klien revisi"
+).split()
+
+
+def _words(rng, count):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def _sentence(rng):
+    text = _words(rng, rng.randint(8, 18)).capitalize()
+    if rng.random() < 0.3:
+        # Inline bold, like the model's emphasis
+        cut = text.split(" ")
+        at = rng.randint(1, len(cut) - 1)
+        text = " ".join(cut[:at]) + f" **{rng.choice(VOCABULARY)}** " + " ".join(cut[at:])
+    return text + rng.choice([".", ".", ".", "?", "!"])
+
+
+def synthetic_chapter(word_count, rng):
+    """Markdown with the structure and quirks of a real chapter answer"""
+    blocks = [f"Tentu, berikut adalah bab tentang {_words(rng, 3)}:", "## A. THE HOOK"]
+    written = 0
+    while written < word_count:
+        roll = rng.random()
+        if roll < 0.08:
+            blocks.append(f"### {_words(rng, 4).title()}")
+            written += 4
+        elif roll < 0.16:
+            blocks.append("\n".join(f"- **{_words(rng, 2).title()}:** {_sentence(rng)}" for _ in range(rng.randint(3, 5))))
+            written += 60
+        elif roll < 0.22:
+            blocks.append("\n".join(f"{n}. {_sentence(rng)}" for n in range(1, rng.randint(3, 5))))
+            written += 40
+        else:
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+            blocks.append(paragraph)
+            written += len(paragraph.split())
+        if rng.random() < 0.05:
+            blocks.append("")  # Models often leave runs of blank lines
+    blocks.append("## C. GOLDEN QUOTE")
+    blocks.append(f"**{_words(rng, 10).capitalize()}.**")
+    blocks.append("**LANGKAH NYATA:**")
+    blocks.append("\n".join(f"- {_sentence(rng)}" for _ in range(3)))
+    return "\n\n".join(blocks)
+
+
+def synthetic_book(chapters, words, seed=7):
+    rng = random.Random(seed)
+    preface = "Kata Pengantar\n\n" + "\n\n".join(" ".join(_sentence(rng) for _ in range(4)) for _ in range(4))
+    conclusion = "\n\n".join(" ".join(_sentence(rng) for _ in range(4)) for _ in range(4))
+    chapters_content = [
+        (f"{_words(rng, 4).title()}", synthetic_chapter(words, rng))
+        for _ in range(chapters)
+    ]
+    return preface, chapters_content, conclusion
+
+
+# ========== MEASUREMENT (runs in a fresh process per case) ==========
+def build_python_docx(title, preface, chapters_content, conclusion, buffer):
+    """The path app.py takes: build the python-docx tree, then save it into memory
+
+    Every builder returns (build seconds, save seconds, output bytes).
+    """
+    from document_maker import create_ebook
+
+    started = time.perf_counter()
+    doc = create_ebook(title, preface, chapters_content, conclusion)
+    built = time.perf_counter()
+    doc.save(buffer)
+    return built - started, time.perf_counter() - built, buffer.tell()
+
+
+def build_ooxml_stream(title, preface, chapters_content, conclusion, buffer):
+    """ooxml_writer: body XML streamed into the zip, so building and saving are one step"""
+    from ooxml_writer import write_ebook
+
+    started = time.perf_counter()
+    write_ebook(buffer, title, preface, chapters_content, conclusion)
+    return time.perf_counter() - started, 0.0, buffer.tell()
+
+
+def build_ooxml_stream_file(title, preface, chapters_content, conclusion, buffer):
+    """Like ooxml-stream, but into a real file, the way batch.py writes books"""
+    with tempfile.TemporaryFile() as f:
+        return build_ooxml_stream(title, preface, chapters_content, conclusion, f)
+
+
+BUILDERS = {
+    "python-docx": build_python_docx,
+    "ooxml-stream": build_ooxml_stream,
+    "ooxml-file": build_ooxml_stream_file,
+}
+
+
+def measure_case(builder_name, size_name, runs):
+    chapters, words = SIZES[size_name]
+    preface, chapters_content, conclusion = synthetic_book(chapters, words)
+    builder = BUILDERS[builder_name]
+    title = "Buku Benchmark"
+
+    # Warm-up, so one-time costs (imports, the streaming writer's skeleton) are not timed
+    builder(title, preface, chapters_content[:1], conclusion, BytesIO())
+
+    build_times, save_times = [], []
+    for _ in range(runs):
+        build_seconds, save_seconds, size = builder(title, preface, chapters_content, conclusion, BytesIO())
+        build_times.append(build_seconds)
+        save_times.append(save_seconds)
+
+    # A separate traced run, since tracemalloc slows everything down. It only sees the
+    # Python heap; lxml's C allocations for the document tree show up in peak RSS
+    tracemalloc.start()
+    builder(title, preface, chapters_content, conclusion, BytesIO())
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "builder": builder_name,
+        "size": size_name,
+        "chapters": chapters,
+        "words": sum(len(content.split()) for _, content in chapters_content),
+        "build_ms": round(statistics.median(build_times) * 1000, 1),
+        "save_ms": round(statistics.median(save_times) * 1000, 1),
+        "peak_traced_mb": round(peak_traced / 1024 / 1024, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "output_kb": round(size / 1024, 1),
+    }
+
+
+# ========== REPORTING ==========
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous_results():
+    try:
+        with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return {}
+    if not lines:
+        return {}
+    return {(case["builder"], case["size"]): case for case in json.loads(lines[-1])["cases"]}
+
+
+def _change(current, previous, field):
+    if not previous or not previous.get(field):
+        return ""
+    delta = (current[field] - previous[field]) / previous[field] * 100
+    return f" ({delta:+.0f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="*", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--builders", nargs="*", default=list(BUILDERS), choices=list(BUILDERS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the results file")
+    args = parser.parse_args()
+
+    previous = _previous_results()
+    cases = []
+    # Spawned workers, one case each, so every case starts from a clean heap
+    context = multiprocessing.get_context("spawn")
+    for size_name in args.sizes:
+        for builder_name in args.builders:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                case = executor.submit(measure_case, builder_name, size_name, args.runs).result()
+            cases.append(case)
+            before = previous.get((builder_name, size_name))
+            print(
+                f"{size_name:<8} {builder_name:<13} {case['chapters']:>2} ch {case['words']:>6} words | "
+                f"build {case['build_ms']:8.1f} ms{_change(case, before, 'build_ms')}  "
+                f"save {case['save_ms']:7.1f} ms{_change(case, before, 'save_ms')}  "
+                f"traced {case['peak_traced_mb']:6.1f} MB  rss {case['peak_rss_mb']:6.1f} MB{_change(case, before, 'peak_rss_mb')}  "
+                f"{case['output_kb']:7.1f} KB"
+            )
+
+    if not args.no_save:
+        record = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+            "cases": cases,
+        }
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Saved to {os.path.relpath(RESULTS_PATH, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Cold-start import time of the generation core, measured in fresh interpreters
+
+Usage:
+    python benchmarks/bench_import.py [module ...] [--runs 7]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = (
+    "import time, sys; started = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - started) * 1000); "
+    "print(int('streamlit' in sys.modules), int('google.generativeai' in sys.modules))"
+)
+
+
+def measure(module, runs):
+    timings = []
+    loaded = None
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", SNIPPET.format(module=module)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        loaded = {"streamlit": output[1] == "1", "google.generativeai": output[2] == "1"}
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["generator", "pipeline"])
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        timings, loaded = measure(module, args.runs)
+        heavy = ", ".join(name for name, is_loaded in loaded.items() if is_loaded) or "none"
+        print(
+            f"{module:<12} median {statistics.median(timings):7.1f} ms  "
+            f"min {min(timings):7.1f} ms  heavy deps loaded: {heavy}"
+        )
+
+
+if __name__ == "__main__":
+    main()
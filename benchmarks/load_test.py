@@ -0,0 +1,149 @@
+"""Load-test key rotation, model routing and fallback against the local Gemini stand-in
+
+Usage:
+    python benchmarks/load_test.py --books 4 --chapters 8 --keys 3 --time-scale 0.01
+    python benchmarks/load_test.py --quota-error-rate 0.1 --server-error-rate 0.05 --missing gemini-2.0-flash
+
+Runs whole books (outline + chapters) through generator.py with FakeGeminiBackend
+installed, in a temporary directory so no real caches are touched. Latencies are
+reported in simulated seconds (wall time divided by --time-scale).
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARAMS = {
+    "target_audience": "Pekerja muda",
+    "word_count": 1500,
+    "tone": "Lucu, Santai, dan Mengena",
+    "perspective": "Otomatis (disarankan)",
+    "core_problem": "Sering menunda pekerjaan",
+    "core_message": "Mulai dari langkah kecil",
+    "case_study_type": "Kantoran umum (HR, atasan, tim)",
+    "emotional_tone": "Optimis & Membangun"
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(args):
+    import generator
+    import retry_policy
+    from fake_gemini import FakeGeminiBackend
+    from key_pool import KeyPool
+
+    fake = FakeGeminiBackend(
+        missing_models=args.missing,
+        rpm_per_key=args.rpm,
+        median_latency=args.latency,
+        quota_error_rate=args.quota_error_rate,
+        server_error_rate=args.server_error_rate,
+        empty_rate=args.empty_rate,
+        blocked_rate=args.blocked_rate,
+        time_scale=args.time_scale,
+        seed=args.seed
+    )
+    generator.set_backend(fake)
+    generator.set_cache_enabled(False)
+
+    keys = [f"fake-key-{i + 1}" for i in range(args.keys)]
+    if not generator.configure_genai(keys):
+        return 1
+    # The pool sees the same (time-scaled) limits as the fake service
+    pool_rpm = (args.pool_rpm or args.rpm) / args.time_scale
+    generator.use_key_pool(KeyPool(keys, rpm=pool_rpm, cooldown=60 * args.time_scale))
+    # Backoff delays and the retry budget are wall seconds too
+    generator.set_retry_policy(retry_policy.RetryPolicy(
+        base_delay=retry_policy.BASE_DELAY * args.time_scale,
+        max_delay=retry_policy.MAX_DELAY * args.time_scale,
+        budget=retry_policy.RETRY_BUDGET * args.time_scale,
+        seed=args.seed
+    ))
+
+    latencies = []
+    failures = []
+    call_content = generator.generate_content_with_fallback
+
+    def timed_call(prompt, use_cache=None, **kwargs):
+        started = time.monotonic()
+        try:
+            return call_content(prompt, use_cache, **kwargs)
+        except Exception:
+            failures.append(prompt[:40])
+            raise
+        finally:
+            latencies.append((time.monotonic() - started) / args.time_scale)
+
+    generator.generate_content_with_fallback = timed_call
+
+    def run_book(index):
+        topic = f"Buku simulasi {index + 1}"
+        outline = generator.generate_outline(topic, args.chapters)
+        if not outline:
+            return 0
+        results = generator.generate_chapters(topic, outline, PARAMS, max_workers=args.chapter_workers)
+        return sum(1 for result in results if result is not None)
+
+    started = time.monotonic()
+    # generator.py logs every call; keep the report readable unless asked for it
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with log, ThreadPoolExecutor(max_workers=args.concurrent_books) as executor:
+        chapters_done = sum(executor.map(run_book, range(args.books)))
+    elapsed = (time.monotonic() - started) / args.time_scale
+
+    total_chapters = args.books * args.chapters
+    print(f"Books: {args.books} x {args.chapters} chapters, {args.keys} key(s), {args.concurrent_books} book(s) at once")
+    print(f"Simulated time: {elapsed:.0f}s  ({chapters_done}/{total_chapters} chapters, {chapters_done / elapsed * 60:.1f} chapters/min)")
+    print(
+        f"Request latency (s): p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}  "
+        f"p99 {percentile(latencies, 0.99):.1f}  mean {statistics.fmean(latencies) if latencies else 0:.1f}"
+    )
+    print(f"Requests: {len(latencies)} made, {len(failures)} failed after every fallback")
+    print("Backend calls: " + ", ".join(f"{name}={count}" for name, count in sorted(fake.stats.items())))
+    print("Model health: " + ", ".join(
+        f"{model}={health['state']}" for model, health in generator.model_router.snapshot().items()
+    ))
+    return 0 if chapters_done == total_chapters else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=4)
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--concurrent-books", type=int, default=2)
+    parser.add_argument("--chapter-workers", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--rpm", type=int, default=15, help="Requests per minute the fake allows per key and model")
+    parser.add_argument("--pool-rpm", type=float, default=None, help="Limit the key pool schedules with (default: --rpm)")
+    parser.add_argument("--latency", type=float, default=20.0, help="Median call latency in simulated seconds")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Wall seconds per simulated second")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--empty-rate", type=float, default=0.0)
+    parser.add_argument("--blocked-rate", type=float, default=0.0)
+    parser.add_argument("--missing", nargs="*", default=[], help="Models the fake reports as not found")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Show generator.py's log output")
+    args = parser.parse_args()
+
+    # Model and response caches are relative paths; keep them out of the real ones
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Input tokens per book with the book context sent inline vs. cached
+
+Usage:
+    python benchmarks/prompt_tokens.py --chapters 8 --word-count 1500
+    python benchmarks/prompt_tokens.py --chapters 6 --word-count 3000   # long chapters, written in sections
+
+Writes one book (outline, chapters, preface and conclusion) through generator.py
+with FakeGeminiBackend twice: once with context caching off, where every chapter
+request carries the system prompt and the full book context (as before), and once
+with it on. Token counts come from the fake's usage metadata, as recorded in
+generator.call_metrics; "billed" counts cached tokens at --cached-rate.
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARAMS = {
+    "target_audience": "Pekerja muda",
+    "tone": "Lucu, Santai, dan Mengena",
+    "perspective": "Otomatis (disarankan)",
+    "core_problem": "Sering menunda pekerjaan",
+    "core_message": "Mulai dari langkah kecil",
+    "case_study_type": "Kantoran umum (HR, atasan, tim)",
+    "emotional_tone": "Optimis & Membangun"
+}
+
+
+def run_book(args, cache_context):
+    import generator
+    import metrics
+    from fake_gemini import FakeGeminiBackend
+    from key_pool import KeyPool
+
+    fake = FakeGeminiBackend(median_latency=0.5, time_scale=0.001, seed=args.seed)
+    generator.set_backend(fake)
+    generator.set_cache_enabled(False)
+    generator.context_cache_enabled = cache_context
+    generator.call_metrics = metrics.Metrics()
+    keys = [f"fake-key-{i + 1}" for i in range(args.keys)]
+    generator.configure_genai(keys)
+    generator.use_key_pool(KeyPool(keys, rpm=100000))
+
+    params = dict(PARAMS, word_count=args.word_count)
+    topic = "Mengatasi kebiasaan menunda"
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        outline = generator.generate_outline(topic, args.chapters)
+        generator.generate_chapters(topic, outline, params, max_workers=args.chapter_workers)
+        generator.generate_preface(topic, params)
+        generator.generate_conclusion(topic, params)
+
+    summary = generator.call_metrics.summary()
+    return {
+        "calls": summary["calls"],
+        "prompt": summary["prompt_tokens"],
+        "cached": summary["cached_tokens"],
+        "uncached": summary["prompt_tokens"] - summary["cached_tokens"],
+        "caches": fake.stats.get("cache_create", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--word-count", type=int, default=1500)
+    parser.add_argument("--keys", type=int, default=1)
+    parser.add_argument("--chapter-workers", type=int, default=4)
+    parser.add_argument("--cached-rate", type=float, default=0.25, help="Price of a cached token relative to a normal one")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Model and response caches are relative paths; keep them out of the real ones
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        before = run_book(args, cache_context=False)
+        after = run_book(args, cache_context=True)
+
+    print(f"Book: {args.chapters} chapters x {args.word_count} words, {args.keys} key(s)")
+    print(f"{'':<10}{'calls':>7}{'input':>10}{'cached':>10}{'uncached':>10}{'billed':>10}{'caches':>8}")
+    for name, result in (("inline", before), ("cached", after)):
+        billed = result["uncached"] + result["cached"] * args.cached_rate
+        result["billed"] = billed
+        print(
+            f"{name:<10}{result['calls']:>7}{result['prompt']:>10}{result['cached']:>10}"
+            f"{result['uncached']:>10}{billed:>10.0f}{result['caches']:>8}"
+        )
+    if before["billed"]:
+        print(f"Uncached input tokens: {1 - after['uncached'] / before['uncached']:.0%} fewer, "
+              f"billed input: {1 - after['billed'] / before['billed']:.0%} less")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Compare the retry policy with plain failover on simulated failure schedules
+
+Usage:
+    python benchmarks/retry_sim.py
+    python benchmarks/retry_sim.py --requests 120 --time-scale 0.005 --scenario blips quota
+
+Each scenario sends the same requests through generate_content_with_fallback
+against FakeGeminiBackend twice: with retry_policy.NO_RETRY (rotate keys and
+models at once, never wait, as before) and with the default RetryPolicy. It
+reports the success rate, the share answered by the preferred model, latency in
+simulated seconds (wall time divided by --time-scale) and calls per request.
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PREFERRED = "gemini-2.0-flash"
+ONLY_PREFERRED = ["gemini-2.0-flash-exp", "gemini-2.5-flash", "gemini-2.0-flash-lite-preview-02-05"]
+
+# name -> (description, FakeGeminiBackend options, number of keys)
+SCENARIOS = {
+    "clean": ("no faults", {}, 3),
+    "transient": ("15% random 503s", {"server_error_rate": 0.15}, 3),
+    "blips": (
+        "preferred model down for 2s three times (503, 504, 500)",
+        {"outages": [(10, 12, 503, PREFERRED), (25, 27, 504, PREFERRED), (40, 42, 500, PREFERRED)]},
+        3,
+    ),
+    "quota": (
+        "one model, 2 keys, 10% random 429s with retry hints",
+        {"missing_models": ONLY_PREFERRED, "quota_error_rate": 0.1, "retry_hints": True},
+        2,
+    ),
+    "quota-nohint": (
+        "one model, 2 keys, 10% random 429s without retry hints (60s cooldowns)",
+        {"missing_models": ONLY_PREFERRED, "quota_error_rate": 0.1},
+        2,
+    ),
+    "rpm": (
+        "one model, 2 keys at 6 requests/min, with retry hints",
+        {"missing_models": ONLY_PREFERRED, "rpm_per_key": 6, "retry_hints": True},
+        2,
+    ),
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(args, options, key_count, use_policy):
+    import generator
+    import metrics
+    import retry_policy
+    from fake_gemini import FakeGeminiBackend
+    from key_pool import KeyPool
+    from model_router import ModelRouter
+
+    scale = args.time_scale
+    fake_options = {"median_latency": args.latency, "time_scale": scale, "seed": args.seed}
+    fake_options.update(options)
+    fake = FakeGeminiBackend(**fake_options)
+    generator.set_backend(fake)
+    generator.set_cache_enabled(False)
+    generator.call_metrics = metrics.Metrics()
+    # Every wait the generator does is in wall seconds, so the simulated ones are scaled down
+    generator.model_router = ModelRouter(base_backoff=30 * scale, max_backoff=600 * scale)
+    if use_policy:
+        generator.set_retry_policy(retry_policy.RetryPolicy(
+            base_delay=retry_policy.BASE_DELAY * scale,
+            max_delay=retry_policy.MAX_DELAY * scale,
+            budget=retry_policy.RETRY_BUDGET * scale,
+            seed=args.seed
+        ))
+    else:
+        generator.set_retry_policy(retry_policy.NO_RETRY)
+
+    keys = [f"fake-key-{i + 1}" for i in range(key_count)]
+    generator.configure_genai(keys)
+    rpm = fake_options.get("rpm_per_key", 15)
+    generator.use_key_pool(KeyPool(keys, rpm=rpm / scale, cooldown=60 * scale))
+
+    latencies = []
+    outcomes = []
+
+    def one_request(index):
+        started = time.monotonic()
+        try:
+            generator.generate_content_with_fallback(f"Permintaan {index}\nTarget Panjang: 200 kata")
+            outcomes.append(True)
+        except Exception:
+            outcomes.append(False)
+        latencies.append((time.monotonic() - started) / scale)
+
+    def staggered(index):
+        # Requests arrive over time, so scheduled outages hit some of them and not others
+        time.sleep(index * args.interval * scale)
+        one_request(index)
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(staggered, range(args.requests)))
+
+    summary = generator.call_metrics.summary()
+    return {
+        "success": sum(outcomes) / len(outcomes),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "mean": statistics.fmean(latencies),
+        "attempts": summary["calls"] / len(outcomes),
+        # Answers from the first-choice model; failover trades a transient error for a weaker model
+        "preferred": generator.call_metrics.total("gemini_calls_total", model=PREFERRED, outcome="ok") / len(outcomes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=1.0, help="Simulated seconds between request arrivals")
+    parser.add_argument("--latency", type=float, default=5.0, help="Median call latency in simulated seconds")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Wall seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests per run, {args.concurrency} at a time, one every {args.interval:g}s (simulated)")
+    print(f"{'scenario':<14}{'policy':<10}{'success':>9}{'preferred':>11}{'p50 s':>8}{'p95 s':>8}{'mean s':>8}{'calls/req':>11}")
+    # Model and response caches are relative paths; keep them out of the real ones
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        for name in args.scenario:
+            description, options, key_count = SCENARIOS[name]
+            for label, use_policy in (("failover", False), ("retry", True)):
+                result = run_scenario(args, options, key_count, use_policy)
+                print(
+                    f"{name:<14}{label:<10}{result['success']:>9.0%}{result['preferred']:>11.0%}{result['p50']:>8.1f}"
+                    f"{result['p95']:>8.1f}{result['mean']:>8.1f}{result['attempts']:>11.2f}"
+                )
+            print(f"{'':<14}({description})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
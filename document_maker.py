@@ -1,76 +1,25 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import zipfile
+from io import BytesIO
+
+import docx
 from docx import Document
 from docx.shared import Pt, Mm, RGBColor, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 
-def create_ebook(title, preface_content, chapters_content, conclusion_content):
-    doc = Document()
-    
-    # Set A5 Size (148mm x 210mm)
-    section = doc.sections[0]
-    section.page_height = Mm(210)
-    section.page_width = Mm(148)
-    section.left_margin = Mm(15)
-    section.right_margin = Mm(15)
-    section.top_margin = Mm(20)
-    section.bottom_margin = Mm(20)
+import markdown_ir
+import ooxml_writer
+import tracing
 
-    # ========== TYPOGRAPHY SETUP ==========
-    # Normal text style
-    normal_style = doc.styles['Normal']
-    normal_font = normal_style.font
-    normal_font.name = 'Calibri'
-    normal_font.size = Pt(11)
-    
-    # Set paragraph format for normal style
-    normal_para_format = normal_style.paragraph_format
-    normal_para_format.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-    normal_para_format.line_spacing = 1.15
-    normal_para_format.space_after = Pt(6)
-    normal_para_format.first_line_indent = Inches(0)  # NO indent - flush left for all
-    normal_para_format.alignment = WD_ALIGN_PARAGRAPH.LEFT  # Explicitly LEFT
-    
-    # Heading styles
-    heading_configs = {
-        'Heading 1': {'size': Pt(16), 'bold': True, 'color': RGBColor(0, 51, 102)},
-        'Heading 2': {'size': Pt(14), 'bold': True, 'color': RGBColor(0, 51, 102)},
-        'Heading 3': {'size': Pt(12), 'bold': True, 'color': RGBColor(0, 51, 102)},
-    }
-    
-    for style_name, config in heading_configs.items():
-        try:
-            heading_style = doc.styles[style_name]
-            heading_font = heading_style.font
-            heading_font.name = 'Calibri'
-            heading_font.size = config['size']
-            heading_font.bold = config['bold']
-            heading_font.color.rgb = config['color']
-            
-            # Heading spacing and alignment
-            heading_para = heading_style.paragraph_format
-            heading_para.space_before = Pt(12)
-            heading_para.space_after = Pt(6)
-            
-            # Center-align Heading 1 (chapter titles), others LEFT
-            if style_name == 'Heading 1':
-                heading_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            else:
-                heading_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        except:
-            pass
-    
-    # List Bullet style
-    try:
-        list_style = doc.styles['List Bullet']
-        list_font = list_style.font
-        list_font.name = 'Calibri'
-        list_font.size = Pt(11)
-        # Ensure left alignment for lists
-        list_para = list_style.paragraph_format
-        list_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    except:
-        pass
+@tracing.traced("docx.create_ebook")
+def create_ebook(title, preface_content, chapters_content, conclusion_content):
+    doc = new_styled_document()
     
     # ========== TITLE PAGE ==========
     title_heading = doc.add_heading(title, 0)
@@ -103,11 +52,8 @@ def create_ebook(title, preface_content, chapters_content, conclusion_content):
         spacer = doc.add_paragraph()
         spacer.paragraph_format.space_after = Pt(12)
         
-        # Clean content before parsing (remove excessive blank lines)
-        cleaned_content = _clean_excessive_spacing(content)
-        
-        # Parse and add chapter content
-        _parse_and_add_content(doc, cleaned_content, is_first_chapter_para=True)
+        # Parse and add chapter content (underscores are dropped from chapter text)
+        _render_blocks(doc, markdown_ir.parse(content, strip_underscores=True))
 
     # ========== PENUTUP ==========
     doc.add_page_break()
@@ -115,6 +61,227 @@ def create_ebook(title, preface_content, chapters_content, conclusion_content):
 
     return doc
 
+class EbookBuilder:
+    """Builds an ebook piece by piece: open, add the preface, chapters (any order) and conclusion, save
+
+    Each part is parsed and rendered to WordprocessingML as soon as it is added, so
+    the work overlaps with generating the remaining parts and save() only has to
+    stitch the fragments into the zip. The result is the same document create_ebook
+    makes. Safe to call from several threads.
+    """
+
+    def __init__(self, title, num_chapters=None):
+        self.title = title
+        self.num_chapters = num_chapters
+        self._preface = None
+        self._conclusion = None
+        self._chapters = {}
+        self._lock = threading.Lock()
+
+    @tracing.traced("docx.add_preface")
+    def add_preface(self, content):
+        xml = ooxml_writer.section_xml("Kata Pengantar", content)
+        with self._lock:
+            self._preface = xml
+
+    @tracing.traced("docx.add_conclusion")
+    def add_conclusion(self, content):
+        xml = ooxml_writer.section_xml("Penutup", content)
+        with self._lock:
+            self._conclusion = xml
+
+    @tracing.traced("docx.add_chapter")
+    def add_chapter(self, number, chapter_title, content):
+        """Add chapter `number` (1-based); adding a number again replaces it"""
+        tracing.annotate(chapter=number)
+        xml = ooxml_writer.chapter_xml(number, chapter_title, content)
+        with self._lock:
+            self._chapters[number] = xml
+
+    def has_chapter(self, number):
+        with self._lock:
+            return number in self._chapters
+
+    def missing(self):
+        """Names of the parts save() still needs"""
+        with self._lock:
+            count = self.num_chapters if self.num_chapters is not None else max(self._chapters, default=0)
+            missing = [f"Bab {n}" for n in range(1, count + 1) if n not in self._chapters]
+            if self._preface is None:
+                missing.insert(0, "Kata Pengantar")
+            if self._conclusion is None:
+                missing.append("Penutup")
+            return missing
+
+    def finalize(self):
+        """Check every part is in; returns the builder, ready to save"""
+        missing = self.missing()
+        if missing:
+            raise ValueError(f"Ebook belum lengkap: {', '.join(missing)}")
+        return self
+
+    @tracing.traced("docx.save")
+    def save(self, target):
+        """Write the .docx to a path or binary file"""
+        self.finalize()
+        with self._lock:
+            chapters = [self._chapters[number] for number in sorted(self._chapters)]
+            preface, conclusion = self._preface, self._conclusion
+        ooxml_writer.write_package(target, self.title, preface, chapters, conclusion)
+
+# ========== STYLE CONFIG ==========
+# A5 page (148mm x 210mm) and margins
+PAGE_SETUP = {
+    'page_height': Mm(210),
+    'page_width': Mm(148),
+    'left_margin': Mm(15),
+    'right_margin': Mm(15),
+    'top_margin': Mm(20),
+    'bottom_margin': Mm(20),
+}
+
+HEADING_COLOR = RGBColor(0, 51, 102)
+
+HEADING_CONFIGS = {
+    'Heading 1': {'size': Pt(16), 'bold': True, 'color': HEADING_COLOR},
+    'Heading 2': {'size': Pt(14), 'bold': True, 'color': HEADING_COLOR},
+    'Heading 3': {'size': Pt(12), 'bold': True, 'color': HEADING_COLOR},
+}
+
+TEMPLATE_CACHE_DIR = os.path.join(".cache", "templates")
+
+_template = None  # (fingerprint, bytes) of the styled base document
+_template_lock = threading.Lock()
+
+def template_fingerprint():
+    """Hash of everything that shapes the base document; a change rebuilds the template"""
+    config = {
+        'python-docx': docx.__version__,
+        'page': PAGE_SETUP,
+        'headings': HEADING_CONFIGS,
+        'setup': _SETUP_SOURCE,
+    }
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def _apply_base_styles(doc):
+    """Page setup and typography every ebook starts from"""
+    section = doc.sections[0]
+    for name, value in PAGE_SETUP.items():
+        setattr(section, name, value)
+
+    # ========== TYPOGRAPHY SETUP ==========
+    # Normal text style
+    normal_style = doc.styles['Normal']
+    normal_font = normal_style.font
+    normal_font.name = 'Calibri'
+    normal_font.size = Pt(11)
+    
+    # Set paragraph format for normal style
+    normal_para_format = normal_style.paragraph_format
+    normal_para_format.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
+    normal_para_format.line_spacing = 1.15
+    normal_para_format.space_after = Pt(6)
+    normal_para_format.first_line_indent = Inches(0)  # NO indent - flush left for all
+    normal_para_format.alignment = WD_ALIGN_PARAGRAPH.LEFT  # Explicitly LEFT
+    
+    # Heading styles
+    for style_name, config in HEADING_CONFIGS.items():
+        try:
+            heading_style = doc.styles[style_name]
+        except KeyError:
+            print(f"Template has no '{style_name}' style; leaving it unstyled")
+            continue
+        
+        heading_font = heading_style.font
+        heading_font.name = 'Calibri'
+        heading_font.size = config['size']
+        heading_font.bold = config['bold']
+        heading_font.color.rgb = config['color']
+        
+        # Heading spacing and alignment
+        heading_para = heading_style.paragraph_format
+        heading_para.space_before = Pt(12)
+        heading_para.space_after = Pt(6)
+        
+        # Center-align Heading 1 (chapter titles), others LEFT
+        if style_name == 'Heading 1':
+            heading_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        else:
+            heading_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    
+    # List Bullet style
+    try:
+        list_style = doc.styles['List Bullet']
+    except KeyError:
+        print("Template has no 'List Bullet' style; leaving it unstyled")
+        return
+    
+    list_font = list_style.font
+    list_font.name = 'Calibri'
+    list_font.size = Pt(11)
+    # Ensure left alignment for lists
+    list_para = list_style.paragraph_format
+    list_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
+
+try:
+    _SETUP_SOURCE = inspect.getsource(_apply_base_styles)
+except OSError:  # No source available (e.g. a frozen build)
+    _SETUP_SOURCE = repr(_apply_base_styles.__code__.co_consts)
+
+def _read_template_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_template_file(path, data):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write template cache: {e}")
+
+@tracing.traced("docx.build_template")
+def _build_template():
+    doc = Document()
+    _apply_base_styles(doc)
+    buffer = BytesIO()
+    doc.save(buffer)
+
+    # Stored uncompressed: every new ebook opens it, and inflating is a fifth of that cost
+    stored = BytesIO()
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(stored, 'w', zipfile.ZIP_STORED) as target:
+        for info in source.infolist():
+            target.writestr(info.filename, source.read(info.filename))
+    return stored.getvalue()
+
+def template_bytes():
+    """The styled base document as .docx bytes, built once per style config
+
+    Kept in memory and under .cache/templates, keyed by template_fingerprint(),
+    so new processes (batch workers) skip the style setup as well.
+    """
+    global _template
+    fingerprint = template_fingerprint()
+    with _template_lock:
+        if _template is None or _template[0] != fingerprint:
+            path = os.path.join(TEMPLATE_CACHE_DIR, f"ebook-{fingerprint}.docx")
+            data = _read_template_file(path)
+            if data is None:
+                data = _build_template()
+                _write_template_file(path, data)
+            _template = (fingerprint, data)
+        return _template[1]
+
+def new_styled_document():
+    """Empty A5 document with the ebook's typography applied, opened from the cached template"""
+    return Document(BytesIO(template_bytes()))
+
 def _add_section_with_content(doc, section_title, content):
     """Add a section (Preface/Conclusion) with proper formatting"""
     heading = doc.add_heading(section_title, level=1)
@@ -124,20 +291,8 @@ def _add_section_with_content(doc, section_title, content):
     spacer = doc.add_paragraph()
     spacer.paragraph_format.space_after = Pt(12)
     
-    # Clean duplicate section titles from content
-    # AI sometimes writes "Kata Pengantar" or "Penutup" again in the content
-    cleaned_content = content
-    if section_title.lower() in content.lower()[:100]:  # Check first 100 chars
-        # Remove lines that are just the section title (with or without quotes/formatting)
-        lines = content.split('\n')
-        filtered_lines = []
-        for line in lines:
-            clean_line = line.strip().replace('"', '').replace('*', '').replace(':', '').strip()
-            if clean_line.lower() != section_title.lower():
-                filtered_lines.append(line)
-        cleaned_content = '\n'.join(filtered_lines)
-    
-    _parse_and_add_content(doc, cleaned_content, is_first_chapter_para=True)
+    # AI sometimes writes "Kata Pengantar" or "Penutup" again in the content; the parser drops it
+    _render_blocks(doc, markdown_ir.parse(content, section_title=section_title))
 
 def _add_table_of_contents(doc, chapters_content):
     """Add automatic Table of Contents"""
@@ -194,82 +349,25 @@ def _add_page_numbers(doc):
     run._r.append(instrText)
     run._r.append(fldChar2)
 
-def _clean_excessive_spacing(content):
-    """Remove excessive blank lines and underscores from content"""
-    # First, remove all underscores
-    content = content.replace('_', '')
-    
-    lines = content.split('\n')
-    cleaned_lines = []
-    consecutive_blanks = 0
-    
-    for line in lines:
-        if line.strip() == '':
-            consecutive_blanks += 1
-            # Allow maximum 1 consecutive blank line
-            if consecutive_blanks <= 1:
-                cleaned_lines.append(line)
-        else:
-            consecutive_blanks = 0
-            cleaned_lines.append(line)
-    
-    return '\n'.join(cleaned_lines)
-
-def _parse_and_add_content(doc, content, is_first_chapter_para=False):
-    """Parse Markdown content and add to document with professional formatting"""
-    lines = content.split('\n')
-    i = 0
-    first_paragraph = is_first_chapter_para
-    in_action_plan = False
-    
-    while i < len(lines):
-        line = lines[i].strip()
-        i += 1
-        
-        if not line:
-            continue
-        
-        # Skip conversational filler
-        lower_line = line.lower()
-        if (lower_line.startswith("tentu") or lower_line.startswith("ini dia") or 
-            lower_line.startswith("berikut") or lower_line.startswith("baik")):
-            continue
+def _render_blocks(doc, blocks):
+    """Add parsed markdown blocks (see markdown_ir) to the document with professional formatting"""
+    for block in blocks:
+        kind = block.kind
 
         # ========== HEADINGS ==========
-        if line.startswith('#'):
-            level = 0
-            while level < len(line) and line[level] == '#':
-                level += 1
-            text = line[level:].strip()
-            
-            # Skip structural meta-headings AND duplicate section titles
-            text_upper = text.upper()
-            skip_headings = [
-                "THE HOOK", "THE BODY", "GOLDEN QUOTE", "ACTION PLAN", 
-                "A. THE HOOK", "B. THE BODY", "C. GOLDEN QUOTE", "D. ACTION PLAN",
-                "HOOK", "BODY", "ISI", "PEMBUKAAN", "ISI UTAMA",
-                "KATA PENGANTAR", "PENUTUP", "CONCLUSION", "PREFACE"
-            ]
-            if any(skip in text_upper for skip in skip_headings):
-                continue
-            
-            # Clean asterisks from heading text
-            text = text.replace('**', '').replace('*', '').strip()
-            
-            word_level = min(level + 1, 3)
-            doc.add_heading(text, level=word_level)
-            first_paragraph = True  # Reset for next paragraph
+        if kind == markdown_ir.HEADING:
+            doc.add_heading(block.text, level=block.level)
             continue
-        
-        # ========== ACTION PLAN DETECTION ==========
-        if "LANGKAH NYATA" in line.upper() or "MISI HARI INI" in line.upper() or "RENCANA AKSI" in line.upper():
+
+        # ========== ACTION PLAN ==========
+        if kind == markdown_ir.ACTION_PLAN:
             # Add horizontal separator before action plan
             _add_horizontal_line(doc)
             
             # Action plan heading with shaded background
             action_heading = doc.add_paragraph()
             action_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            run = action_heading.add_run(line.replace('*', '').upper())
+            run = action_heading.add_run(block.text)
             run.bold = True
             run.font.size = Pt(13)
             run.font.color.rgb = RGBColor(0, 51, 102)
@@ -281,33 +379,21 @@ def _parse_and_add_content(doc, content, is_first_chapter_para=False):
             
             action_heading.paragraph_format.space_before = Pt(12)
             action_heading.paragraph_format.space_after = Pt(8)
-            
-            in_action_plan = True
             continue
         
         # ========== NUMBERED/BULLET LISTS ==========
-        is_list_item = False
-        list_content = line
-        
-        if len(line) > 2 and line[0].isdigit() and line[1] in ['.', ')']:
-            is_list_item = True
-            list_content = line.split('.', 1)[1].strip() if '.' in line else line.split(')', 1)[1].strip()
-        elif line.startswith('- ') or line.startswith('• ') or line.startswith('* '):
-            is_list_item = True
-            list_content = line[2:].strip()
-        
-        if is_list_item:
+        if kind == markdown_ir.LIST_ITEM:
             p = doc.add_paragraph(style='List Bullet')
             
             # Add checkbox for action plan items
-            if in_action_plan:
+            if block.action:
                 checkbox_run = p.add_run('☐ ')
                 checkbox_run.font.size = Pt(12)
             
-            _add_formatted_text(p, list_content)
+            _add_spans(p, block.spans)
             
             # Shading for action plan lists
-            if in_action_plan:
+            if block.action:
                 shading_elm = OxmlElement('w:shd')
                 shading_elm.set(qn('w:fill'), 'F5F5F5')  # Light gray
                 p._element.get_or_add_pPr().append(shading_elm)
@@ -317,23 +403,19 @@ def _parse_and_add_content(doc, content, is_first_chapter_para=False):
         # ========== REGULAR PARAGRAPHS ==========
         p = doc.add_paragraph()
         
-        # First paragraph: NO indent + Drop cap (if first of chapter)
-        if first_paragraph and not in_action_plan:
+        # First paragraph: NO indent
+        if block.first:
             p.paragraph_format.first_line_indent = Inches(0)  # Already 0 by default now
-            first_paragraph = False
         
-        # Check if it's a Golden Quote (standalone bold text)
-        if line.count('**') == 2 and len(line) < 200:
+        if kind == markdown_ir.QUOTE:
             # Golden Quote Box
-            clean_text = line.replace('**', '').strip()
-            
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
             p.paragraph_format.space_before = Pt(12)
             p.paragraph_format.space_after = Pt(12)
             p.paragraph_format.left_indent = Inches(0.5)
             p.paragraph_format.right_indent = Inches(0.5)
             
-            run = p.add_run(f'"{clean_text}"')
+            run = p.add_run(f'"{block.text}"')
             run.italic = True
             run.font.size = Pt(12)
             run.font.color.rgb = RGBColor(0, 51, 102)
@@ -356,7 +438,7 @@ def _parse_and_add_content(doc, content, is_first_chapter_para=False):
             continue
         
         # Regular paragraph with formatting
-        _add_formatted_text(p, line)
+        _add_spans(p, block.spans)
 
 def _add_horizontal_line(doc):
     """Add a horizontal line separator"""
@@ -373,20 +455,11 @@ def _add_horizontal_line(doc):
     pBdr.append(bottom)
     pPr.append(pBdr)
 
-def _add_formatted_text(paragraph, text):
-    """Add text to paragraph with bold formatting support"""
-    # Remove underscores first
-    text = text.replace('_', '')
-    text = text.strip()
-    parts = text.split("**")
-    
-    for i, part in enumerate(parts):
-        if not part:
-            continue
-        
-        clean_part = part.replace('*', '').replace('"', '"').replace('"', '"')
-        run = paragraph.add_run(clean_part)
+def _add_spans(paragraph, spans):
+    """Add (text, bold) spans to paragraph; bold spans get the heading color"""
+    for text, bold in spans:
+        run = paragraph.add_run(text)
         
-        if i % 2 == 1:
+        if bold:
             run.bold = True
             run.font.color.rgb = RGBColor(0, 51, 102)
@@ -0,0 +1,335 @@
+import enum
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+DEFAULT_MODELS = (
+    'gemini-2.0-flash',
+    'gemini-2.0-flash-exp',
+    'gemini-2.5-flash',
+    'gemini-2.0-flash-lite-preview-02-05',
+)
+
+
+class FinishReason(enum.Enum):
+    STOP = 1
+    MAX_TOKENS = 2
+    SAFETY = 3
+
+
+OUTAGE_MESSAGES = {
+    500: "Internal error encountered.",
+    503: "The service is currently unavailable.",
+    504: "Deadline Exceeded",
+}
+
+
+class FakeGeminiError(Exception):
+    """Raised like google.api_core errors: the message starts with the HTTP status code"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+        # Like the real API, prompt_token_count includes the tokens read from a cache
+        self.prompt_token_count = prompt_tokens
+        self.cached_content_token_count = cached_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _Candidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+
+class _Chunk:
+    def __init__(self, text, finish_reason=None):
+        self._text = text
+        self.candidates = [_Candidate(finish_reason)] if finish_reason else []
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("The `response.text` quick accessor requires the response to contain a valid `Part`.")
+        return self._text
+
+
+class FakeResponse:
+    """Mimics google.generativeai's GenerateContentResponse closely enough for generator.py"""
+
+    def __init__(self, text, finish_reason, usage, chunk_delay=0.0, chunk_words=40):
+        self._text = text
+        self.candidates = [_Candidate(finish_reason)]
+        self.usage_metadata = usage
+        self._chunk_delay = chunk_delay
+        self._chunk_words = chunk_words
+
+    @property
+    def text(self):
+        if self.candidates[0].finish_reason == FinishReason.SAFETY:
+            raise ValueError(
+                "The `response.text` quick accessor requires the response to contain a valid `Part`, "
+                "but none were returned. The candidate's finish_reason is SAFETY."
+            )
+        return self._text
+
+    def __iter__(self):
+        finish_reason = self.candidates[0].finish_reason
+        if finish_reason != FinishReason.SAFETY and self._text:
+            words = self._text.split(" ")
+            for start in range(0, len(words), self._chunk_words):
+                if self._chunk_delay:
+                    time.sleep(self._chunk_delay)
+                piece = " ".join(words[start:start + self._chunk_words])
+                yield _Chunk(piece if start == 0 else " " + piece)
+        # The closing chunk only carries the finish reason
+        yield _Chunk(None, finish_reason)
+
+
+class FakeGeminiBackend:
+    """Local stand-in for the Gemini API with per-key rate limits and injected faults
+
+    Pass it to generator.set_backend to load-test the key pool, routing and fallback
+    without network or quota. Latency is lognormal around `median_latency` seconds.
+    `time_scale` shrinks both the latencies and the one-minute rate-limit window, so a
+    run that would take an hour against the real API finishes in seconds.
+    """
+
+    def __init__(self, models=DEFAULT_MODELS, missing_models=(), rpm_per_key=15,
+                 median_latency=20.0, latency_sigma=0.5, first_token_latency=2.0,
+                 quota_error_rate=0.0, server_error_rate=0.0, empty_rate=0.0,
+                 blocked_rate=0.0, truncate_rate=0.0, miscount_rate=0.0, time_scale=1.0, cache_supported=True,
+                 retry_hints=False, outages=(), seed=None):
+        self.models = tuple(models)
+        self.missing_models = set(missing_models)
+        self.rpm_per_key = rpm_per_key
+        self.median_latency = median_latency
+        self.latency_sigma = latency_sigma
+        self.first_token_latency = first_token_latency
+        self.quota_error_rate = quota_error_rate
+        self.server_error_rate = server_error_rate
+        self.empty_rate = empty_rate
+        self.blocked_rate = blocked_rate
+        self.truncate_rate = truncate_rate
+        self.miscount_rate = miscount_rate
+        self.time_scale = time_scale
+        self.cache_supported = cache_supported
+        # 429s say "Please retry in Ns." like the real API does when this is on
+        self.retry_hints = retry_hints
+        # (start, end, status[, model]) in simulated seconds from creation: scheduled failures of
+        # every call (or of one model's calls) in that window, e.g. (30, 45, 503)
+        self.outages = [tuple(outage) for outage in outages]
+        self.started = time.monotonic()
+        self.stats = defaultdict(int)
+        self._caches = {}  # handle -> (model, api_key, text)
+        self._random = random.Random(seed)
+        self._calls = defaultdict(deque)  # (api_key, model) -> request timestamps in the window
+        self._lock = threading.Lock()
+
+    # ========== BACKEND INTERFACE ==========
+    def list_models(self, api_key):
+        self._count("list_models")
+        return [f"models/{name}" for name in self.models if name not in self.missing_models]
+
+    def generate(self, model_name, api_key, prompt, generation_config, safety_settings, stream=False,
+                 system_instruction=None, cached_content=None):
+        self._count("calls")
+
+        if model_name in self.missing_models or model_name not in self.models:
+            self._count("not_found")
+            raise FakeGeminiError(404, f"models/{model_name} is not found for API version v1beta, or is not supported for generateContent.")
+
+        cached_text = ""
+        if cached_content:
+            with self._lock:
+                cache = self._caches.get(cached_content)
+            if cache is None or cache[:2] != (model_name, api_key):
+                self._count("cache_miss")
+                raise FakeGeminiError(403, f"CachedContent not found (or permission denied): {cached_content}")
+            cached_text = cache[2]
+        full_prompt = "\n\n".join(part for part in (system_instruction, cached_text, prompt) if part)
+
+        outage = self._outage(model_name)
+        if outage:
+            self._count(f"outage_{outage}")
+            time.sleep(self._latency() * 0.05)
+            raise FakeGeminiError(outage, OUTAGE_MESSAGES.get(outage, "Internal error encountered."))
+
+        window_wait = self._admit(api_key, model_name)
+        if window_wait or self._roll(self.quota_error_rate):
+            self._count("quota_exceeded")
+            message = "Resource has been exhausted (e.g. check quota)."
+            if self.retry_hints:
+                with self._lock:
+                    # A random 429 (e.g. a burst limit) clears in a few seconds
+                    wait = window_wait or self._random.uniform(1.0, 5.0) * self.time_scale
+                message += f" Please retry in {wait:.3f}s."
+            raise FakeGeminiError(429, message)
+
+        latency = self._latency()
+        if self._roll(self.server_error_rate):
+            time.sleep(latency * self._random.random() * 0.2)
+            self._count("server_error")
+            raise FakeGeminiError(503, "The service is currently unavailable.")
+
+        max_tokens = (generation_config or {}).get("max_output_tokens", 8192)
+        finish_reason = FinishReason.STOP
+        if self._roll(self.blocked_rate):
+            self._count("blocked")
+            text, finish_reason = "", FinishReason.SAFETY
+        elif self._roll(self.empty_rate):
+            self._count("empty")
+            text = ""
+        else:
+            json_mode = (generation_config or {}).get("response_mime_type") == "application/json"
+            text = self._compose(full_prompt, json_mode)
+            words = text.split(" ")
+            limit = int(max_tokens * 0.75)
+            if len(words) > limit or self._roll(self.truncate_rate):
+                self._count("truncated")
+                keep = min(limit, max(1, int(len(words) * self._random.uniform(0.4, 0.9))))
+                text = " ".join(words[:keep])
+                finish_reason = FinishReason.MAX_TOKENS
+            self._count("ok")
+
+        usage = _UsageMetadata(len(full_prompt) // 4 + 1, len(text) // 4, len(cached_text) // 4)
+        if stream:
+            chunk_count = max(1, len(text.split(" ")) // 40)
+            time.sleep(min(latency, self.first_token_latency * self.time_scale))
+            chunk_delay = max(0.0, latency - self.first_token_latency * self.time_scale) / chunk_count
+            return FakeResponse(text, finish_reason, usage, chunk_delay=chunk_delay)
+
+        time.sleep(latency)
+        return FakeResponse(text, finish_reason, usage)
+
+    def create_cache(self, model_name, api_key, system_instruction, contents, ttl):
+        self._count("cache_create")
+        if not self.cache_supported:
+            raise FakeGeminiError(400, "Cached content is not supported for this model.")
+        with self._lock:
+            handle = f"cachedContents/fake-{len(self._caches) + 1}"
+            self._caches[handle] = (model_name, api_key, f"{system_instruction}\n\n{contents}")
+        return handle
+
+    def delete_cache(self, api_key, handle):
+        self._count("cache_delete")
+        with self._lock:
+            self._caches.pop(handle, None)
+
+    def count_tokens(self, model_name, api_key, prompt, system_instruction=None):
+        return len(f"{system_instruction}\n\n{prompt}" if system_instruction else prompt) // 4 + 1
+
+    # ========== SIMULATION ==========
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _roll(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _latency(self):
+        with self._lock:
+            sample = self._random.lognormvariate(0.0, self.latency_sigma)
+        return self.median_latency * sample * self.time_scale
+
+    def _admit(self, api_key, model_name):
+        """Sliding one-minute window per key and model, like the real per-model quota
+
+        Returns 0 when the call is admitted, or the (wall) seconds until it would be.
+        """
+        window = 60.0 * self.time_scale
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls[(api_key, model_name)]
+            while calls and now - calls[0] > window:
+                calls.popleft()
+            if len(calls) >= self.rpm_per_key:
+                return max(1e-3, window - (now - calls[0]))
+            calls.append(now)
+            return 0
+
+    def _outage(self, model_name):
+        elapsed = (time.monotonic() - self.started) / self.time_scale
+        for start, end, status, *model in self.outages:
+            if start <= elapsed < end and (not model or model[0] == model_name):
+                return status
+        return None
+
+    def _compose(self, prompt, json_mode=False):
+        """Synthetic output shaped like the real model's answer to each prompt type"""
+        chapters = re.search(r"Jumlah Bab: (\d+)", prompt)
+        if chapters:
+            count = int(chapters.group(1))
+            if self._roll(self.miscount_rate):
+                # Real models often ignore the requested chapter count
+                self._count("miscounted")
+                count += 1
+            titles = [f"Judul Bab Simulasi Nomor {i}" for i in range(1, count + 1)]
+            if json_mode:
+                return json.dumps({"chapters": titles})
+            return "\n".join(f"Bab {i}: {title}" for i, title in enumerate(titles, 1))
+
+        sections = re.search(r"Jumlah Bagian: (\d+)", prompt)
+        if sections:
+            return "\n".join(f"Bagian {i}: Subjudul Simulasi Nomor {i}" for i in range(1, int(sections.group(1)) + 1))
+
+        if "format JSON" in prompt:
+            return json.dumps({
+                "target_audience": "Pekerja muda",
+                "tone": "Lucu, Santai, dan Mengena",
+                "core_problem": "Masalah simulasi.",
+                "core_message": "Pesan simulasi.",
+                "case_study_type": "Kantoran umum (HR, atasan, tim)",
+                "emotional_tone": "Optimis & Membangun"
+            })
+
+        target = (
+            re.search(r"Target tambahan: MINIMAL (\d+) kata", prompt)
+            or re.search(r"Target panjang bagian ini: MINIMAL (\d+) kata", prompt)
+            or re.search(r"Target Panjang: (\d+) kata", prompt)
+        )
+        word_count = int(target.group(1)) if target else 250
+        return make_chapter_text(word_count, self._random)
+
+
+def make_chapter_text(word_count, rng=None):
+    """Markdown with the structure Gemini returns for a chapter: paragraphs, list, quote, action plan"""
+    rng = rng or random.Random()
+    vocabulary = (
+        "atasan tim kerja ide proposal rapat target waktu strategi data fokus energi kebiasaan "
+        "langkah hasil masalah solusi komunikasi karier pagi disiplin prioritas"
+    ).split()
+    blocks = []
+    written = 0
+    while written < word_count:
+        if blocks and rng.random() < 0.15:
+            blocks.append("\n".join(
+                f"- **Poin {j}:** " + " ".join(rng.choice(vocabulary) for _ in range(8)) for j in range(1, 4)
+            ))
+            written += 30
+        elif blocks and rng.random() < 0.08:
+            blocks.append(f"## {' '.join(rng.choice(vocabulary) for _ in range(4)).title()}")
+            written += 4
+        else:
+            sentences = [
+                " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 16))).capitalize() + "."
+                for _ in range(rng.randint(2, 4))
+            ]
+            paragraph = " ".join(sentences)
+            blocks.append(paragraph)
+            written += len(paragraph.split())
+    blocks.append("**" + " ".join(rng.choice(vocabulary) for _ in range(8)).capitalize() + ".**")
+    blocks.append("LANGKAH NYATA:\n" + "\n".join(
+        "- " + " ".join(rng.choice(vocabulary) for _ in range(7)) for _ in range(3)
+    ))
+    return "\n\n".join(blocks)
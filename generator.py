@@ -1,252 +1,1144 @@
-import google.generativeai as genai
-from prompts import SYSTEM_PROMPT, OUTLINE_PROMPT_TEMPLATE, CHAPTER_PROMPT_TEMPLATE
-import streamlit as st
+from prompts import (
+    SYSTEM_PROMPT, OUTLINE_PROMPT_TEMPLATE, OUTLINE_REPAIR_PROMPT_TEMPLATE, METADATA_PROMPT_TEMPLATE,
+    TONE_OPTIONS, CASE_STUDY_OPTIONS, EMOTIONAL_TONE_OPTIONS, BOOK_CONTEXT_TEMPLATE, CHAPTER_PROMPT_TEMPLATE, SECTION_PLAN_PROMPT_TEMPLATE,
+    SECTION_PROMPT_TEMPLATE, SECTION_POSITION_FIRST, SECTION_POSITION_MIDDLE, SECTION_POSITION_LAST,
+    CONTINUATION_PROMPT_TEMPLATE, CONTINUATION_TRUNCATED_INSTRUCTION, CONTINUATION_SHORT_INSTRUCTION
+)
+from key_pool import KeyPool
+import model_registry
+from model_router import ModelRouter
+from retry_policy import (
+    RetryPolicy, classify as classify_error, retry_after,
+    QUOTA as RETRY_QUOTA, TRANSIENT as RETRY_TRANSIENT, PERMANENT as RETRY_PERMANENT
+)
+import response_cache
+import markdown_ir
+import metrics
+import tracing
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Global state for API keys
 api_keys = []
-current_key_index = 0
+key_pool = None
+
+# Called with a message whenever a generate_* function fails; the UI installs its own
+error_handler = None
+
+class GeminiBackend:
+    """Default LLM backend: the Gemini API through google.generativeai
+
+    A backend provides list_models(api_key) -> model names supporting generateContent,
+    and generate(model_name, api_key, prompt, generation_config, safety_settings, stream,
+    system_instruction, cached_content) -> a response shaped like google.generativeai's
+    (.text, .usage_metadata, .candidates, and iterable chunks when stream=True).
+    Backends that can cache context also provide create_cache(model_name, api_key,
+    system_instruction, contents, ttl) -> handle and delete_cache(api_key, handle).
+    Swap it with set_backend, e.g. for the local stand-in in fake_gemini.py.
+    """
+
+    def __init__(self):
+        # google.generativeai takes about a second to import, so it is loaded on first use
+        self._genai = None
+        # One client manager per API key, so concurrent calls can use different keys
+        # (genai.configure only holds a single process-wide key)
+        self._key_clients = {}
+        # GenerativeModel instances bound to a key's client, reused across calls
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get_genai(self):
+        with self._lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                self._genai = genai
+            return self._genai
+
+    def _client_for_key(self, api_key, service="generative"):
+        self._get_genai()
+        from google.generativeai.client import _ClientManager
+        with self._lock:
+            manager = self._key_clients.get(api_key)
+            if manager is None:
+                manager = _ClientManager()
+                manager.configure(api_key=api_key)
+                self._key_clients[api_key] = manager
+            return manager.get_default_client(service)
+
+    def _model_for_key(self, model_name, api_key, system_instruction=None, cached_content=None):
+        genai = self._get_genai()
+        client = self._client_for_key(api_key)
+        with self._lock:
+            model = self._models.get((model_name, api_key, system_instruction, cached_content))
+            if model is None:
+                if cached_content:
+                    # The cache already holds the system instruction; from_cached_content
+                    # would look the cache up through the process-wide client instead
+                    model = genai.GenerativeModel(model_name)
+                    model._cached_content = cached_content
+                else:
+                    model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                model._client = client
+                self._models[(model_name, api_key, system_instruction, cached_content)] = model
+            return model
+
+    def list_models(self, api_key):
+        client = self._client_for_key(api_key, "model")
+        return [m.name for m in self._get_genai().list_models(client=client) if 'generateContent' in m.supported_generation_methods]
+
+    def generate(self, model_name, api_key, prompt, generation_config, safety_settings, stream=False,
+                 system_instruction=None, cached_content=None):
+        model = self._model_for_key(model_name, api_key, system_instruction, cached_content)
+        return model.generate_content(
+            prompt,
+            safety_settings=safety_settings,
+            generation_config=generation_config,
+            stream=stream
+        )
+
+    def create_cache(self, model_name, api_key, system_instruction, contents, ttl):
+        from google.generativeai import caching
+        client = self._client_for_key(api_key, "cache")
+        request = caching.CachedContent._prepare_create_request(
+            model=model_name,
+            system_instruction=system_instruction,
+            contents=[contents],
+            ttl=ttl
+        )
+        return client.create_cached_content(request).name
+
+    def delete_cache(self, api_key, handle):
+        self._client_for_key(api_key, "cache").delete_cached_content(name=handle)
+        with self._lock:
+            for model_key in [k for k in self._models if k[3] == handle]:
+                del self._models[model_key]
+
+    def count_tokens(self, model_name, api_key, prompt, system_instruction=None):
+        model = self._model_for_key(model_name, api_key, system_instruction)
+        return model.count_tokens(prompt).total_tokens
+
+backend = GeminiBackend()
+
+def set_backend(new_backend):
+    """Send all model traffic to another backend (see GeminiBackend for the interface)"""
+    global backend
+    backend = new_backend
+
+# Tracks per-model health so calls skip models that keep failing
+model_router = ModelRouter()
+
+# How long a call may back off and wait for quota before giving up (see retry_policy.py)
+retry_policy = RetryPolicy()
+
+# Counters and histograms of every call to the API (see metrics.py)
+call_metrics = metrics.Metrics()
+
+# Persistent cache of model responses; set cache_enabled to False to force fresh output
+response_store = response_cache.ResponseCache()
+cache_enabled = True
+
+# Model preference order, smartest first
+MODELS_TO_TRY = [
+    'gemini-2.0-flash',
+    'gemini-2.0-flash-exp',
+    'gemini-2.5-flash',
+    'gemini-2.0-flash-lite-preview-02-05',
+]
+
+def set_error_handler(handler):
+    """Route error messages to `handler` (e.g. st.error) in addition to the log"""
+    global error_handler
+    error_handler = handler
+
+def _report_error(message):
+    print(message)
+    if error_handler:
+        error_handler(message)
 
 def configure_genai(keys):
-    global api_keys, current_key_index
+    global api_keys, key_pool
     
     # Ensure keys is a list
     if isinstance(keys, str):
         keys = [keys]
         
-    valid_keys = [k for k in keys if k and k.strip()]
+    valid_keys = [k.strip() for k in keys if k and k.strip()]
     
     if not valid_keys:
-        st.error("No valid API keys provided.")
+        _report_error("No valid API keys provided.")
         return False
         
+    # Keep the existing pool (and its quota accounting) across Streamlit reruns
+    if key_pool is None or key_pool.keys != valid_keys:
+        key_pool = KeyPool(valid_keys)
     api_keys = valid_keys
-    current_key_index = 0
     
     try:
-        # Configure with the first key
-        genai.configure(api_key=api_keys[current_key_index])
+        print(f"Configured key pool with {len(api_keys)} API key(s)")
         
-        # Debug: List available models
-        print(f"Configured with API Key #{current_key_index + 1}")
-        print("Checking available models...")
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                print(f"Available model: {m.name}")
-                
+        # Probe the available models once per key set (cached in memory and on disk)
+        if model_registry.get_available_models(api_keys, _probe_models) is None:
+            _report_error("Error configuring Gemini API: could not list available models.")
+            return False
         return True
     except Exception as e:
-        st.error(f"Error configuring Gemini API: {e}")
+        _report_error(f"Error configuring Gemini API: {e}")
         return False
 
-def rotate_api_key():
-    global current_key_index
-    
-    if len(api_keys) <= 1:
-        print("Only one API key available, cannot rotate.")
+def _probe_models(api_key):
+    return backend.list_models(api_key)
+
+def set_cache_enabled(enabled):
+    """Toggle reading cached responses (fresh responses are still written to the cache)"""
+    global cache_enabled
+    cache_enabled = bool(enabled)
+
+def use_key_pool(pool):
+    """Share an existing key pool (e.g. a proxy from another process) instead of building one"""
+    global key_pool
+    key_pool = pool
+
+def set_retry_policy(policy):
+    """Use another RetryPolicy, e.g. retry_policy.NO_RETRY to fail over without waiting"""
+    global retry_policy
+    retry_policy = policy
+
+def _backoff(budget, delay, model_name):
+    # Sleep before retrying the same model; False when the call's retry budget cannot cover it
+    call_metrics.inc("gemini_retries_total", model=model_name)
+    with tracing.span("retry.backoff", model=model_name, delay=round(delay, 3)):
+        return retry_policy.wait(budget, delay)
+
+def _wait_for_key(budget, models):
+    # After a round where every key hit its quota: wait for the first one back, if the budget allows
+    delay = key_pool.cooldown_remaining(models)
+    if delay <= 0 or not budget.can_wait(delay):
         return False
-        
-    # Move to next key
-    current_key_index = (current_key_index + 1) % len(api_keys)
-    new_key = api_keys[current_key_index]
+    print(f"Every API key is resting; waiting {delay:.1f}s for the first one to come back...")
+    call_metrics.inc("gemini_quota_waits_total")
+    with tracing.span("retry.quota_wait", delay=round(delay, 3)):
+        return retry_policy.wait(budget, delay)
+
+def _is_model_unavailable(error_str):
+    return "404" in error_str or "not found" in error_str.lower() or "is not supported" in error_str
+
+def _estimate_tokens(text):
+    # Roughly 4 characters per token; corrected with the real usage after the call
+    return len(text) // 4 + 1
+
+def _is_quota_error(error_str):
+    return "429" in error_str or "Resource has been exhausted" in error_str or "Quota exceeded" in error_str
+
+def _finish_reason(response):
+    # Name of the first candidate's finish reason (STOP, MAX_TOKENS, SAFETY, ...), if known
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return None
+    if reason is None:
+        return None
+    return getattr(reason, "name", str(reason))
+
+def _error_class(error_str, response=None):
+    if _finish_reason(response) == "SAFETY":
+        return metrics.BLOCKED
+    if _is_quota_error(error_str):
+        return metrics.QUOTA
+    if _is_model_unavailable(error_str):
+        return metrics.UNAVAILABLE
+    if classify_error(error_str) == RETRY_TRANSIENT:
+        return metrics.TRANSIENT
+    return metrics.OTHER
+
+def _record_call(model_name, api_key, attempt, started, response, error, stream=False):
+    try:
+        usage = response.usage_metadata
+        prompt_tokens, output_tokens = usage.prompt_token_count, usage.candidates_token_count
+        cached_tokens = getattr(usage, "cached_content_token_count", None)
+    except (AttributeError, ValueError):
+        prompt_tokens = output_tokens = cached_tokens = None
+    finish_reason = _finish_reason(response)
+    call_metrics.record_call(
+        model_name, api_key, attempt, time.monotonic() - started,
+        prompt_tokens=prompt_tokens, output_tokens=output_tokens, cached_tokens=cached_tokens,
+        finish_reason=finish_reason, error=error, stream=stream
+    )
+    tracing.start_span(
+        "llm.attempt", start=started, model=model_name, key=metrics.key_fingerprint(api_key),
+        attempt=attempt, stream=stream, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, output_tokens=output_tokens,
+        finish_reason=finish_reason
+    ).end(error)
+
+# Generation config for better quality
+GENERATION_CONFIG = {
+    'temperature': 0.7,  # Balanced creativity and coherence
+    'top_p': 0.95,
+    'top_k': 40,
+    'max_output_tokens': 8192,
+}
+
+# Safety settings to block as little as possible
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+def _generation_config(response_schema=None):
+    # JSON mode constrained to `response_schema`; the schema is part of the response cache key too
+    if response_schema is None:
+        return GENERATION_CONFIG
+    return dict(GENERATION_CONFIG, response_mime_type="application/json", response_schema=response_schema)
+
+def _candidate_models():
+    # Prioritize the SMARTEST models first, skipping models the keys cannot use
+    available = model_registry.cached_models(api_keys)
+    if available:
+        return [m for m in MODELS_TO_TRY if m in available] or MODELS_TO_TRY
+    return MODELS_TO_TRY
+
+def _cached_response(prompt, models_to_try, use_cache, generation_config=GENERATION_CONFIG):
+    if use_cache is None:
+        use_cache = cache_enabled
+    if not use_cache:
+        return None
     
-    print(f"Rotating to API Key #{current_key_index + 1}...")
+    # Any model in the list is an acceptable answer for a repeat
+    for model_name in models_to_try:
+        cached = response_store.get(response_cache.make_key(prompt, model_name, generation_config))
+        if cached:
+            print(f"Cache hit for model: {model_name}")
+            call_metrics.inc("gemini_cache_hits_total", model=model_name)
+            return cached
+    return None
+
+def _store_response(prompt, model_name, generation_config, text, finish_reason):
+    # A cut-off answer is not kept: from the cache it would come without its finish reason and never be continued
+    if finish_reason == "MAX_TOKENS":
+        return
+    response_store.put(response_cache.make_key(prompt, model_name, generation_config), text)
+
+# ========== BOOK CONTEXT ==========
+# Cached contexts live this long on the API side; BookContext.close deletes them sooner
+CONTEXT_CACHE_TTL = 3 * 60 * 60
+# The API refuses to cache less than this many tokens, so smaller contexts are not tried
+CONTEXT_CACHE_MIN_TOKENS = 1024
+context_cache_enabled = True
+
+class BookContext:
+    """Prompt prefix shared by every chapter of one book (form, outline and writing rules)
+
+    Sent once per model and key as a cached-content handle, together with the
+    system instruction, when the backend can cache context. Otherwise it is put
+    in front of each prompt, where it still forms an identical prefix the API can
+    reuse implicitly. Call close() when the book is done to drop the caches.
+    """
+
+    def __init__(self, text, system_instruction=SYSTEM_PROMPT, cacheable=True):
+        self.text = text
+        self.system_instruction = system_instruction
+        self.cacheable = (
+            cacheable and context_cache_enabled
+            and _estimate_tokens(system_instruction + text) >= CONTEXT_CACHE_MIN_TOKENS
+        )
+        # (model, key) -> cache handle, or None once creating one failed
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def handle(self, model_name, api_key):
+        """Cache handle for this model and key, created on first use; None means send it inline"""
+        create_cache = getattr(backend, "create_cache", None)
+        if not self.cacheable or create_cache is None:
+            return None
+        with self._lock:
+            if (model_name, api_key) not in self._handles:
+                try:
+                    with tracing.span("context_cache.create", model=model_name):
+                        handle = create_cache(model_name, api_key, self.system_instruction, self.text, CONTEXT_CACHE_TTL)
+                    print(f"Cached book context for {model_name} (key {metrics.key_fingerprint(api_key)})")
+                except Exception as e:
+                    print(f"Context caching unavailable for {model_name}, sending it inline: {e}")
+                    handle = None
+                self._handles[(model_name, api_key)] = handle
+            return self._handles[(model_name, api_key)]
+
+    def invalidate(self, model_name, api_key):
+        """Stop using a handle the API rejected (e.g. expired); later calls send the context inline"""
+        with self._lock:
+            if self._handles.get((model_name, api_key)):
+                self._handles[(model_name, api_key)] = None
+
+    def close(self):
+        with self._lock:
+            handles = [(key, handle) for (_, key), handle in self._handles.items() if handle]
+            self._handles.clear()
+            self.cacheable = False
+        for api_key, handle in handles:
+            try:
+                backend.delete_cache(api_key, handle)
+            except Exception as e:
+                print(f"Could not delete cached context {handle}: {e}")
+
+def book_context(topic, outline, params, cacheable=True):
+    """BookContext for the chapters of a book; `outline` is the numbered outline text"""
+    return BookContext(BOOK_CONTEXT_TEMPLATE.format(
+        topic=topic,
+        outline=outline,
+        target_audience=params.get("target_audience", "Profesional Muda / Pemula"),
+        tone=params.get("tone", "Profesional, Hangat, Memotivasi"),
+        word_count=params.get("word_count", 800),
+        case_study_type=params.get("case_study_type", "Studi Kasus Nyata"),
+        perspective=params.get("perspective", "Otomatis"),
+        core_problem=params.get("core_problem", ""),
+        core_message=params.get("core_message", ""),
+        emotional_tone=params.get("emotional_tone", "Netral")
+    ), cacheable=cacheable)
+
+def _full_prompt(prompt, system_instruction, context):
+    # Everything the model reads, for the response cache key and the token estimate
+    if context:
+        return f"{context.system_instruction}\n\n{context.text}\n\n{prompt}"
+    if system_instruction:
+        return f"{system_instruction}\n\n{prompt}"
+    return prompt
+
+def _send(model_name, api_key, prompt, system_instruction, context, handle, stream=False, generation_config=GENERATION_CONFIG):
+    if handle:
+        # The system instruction and book context are in the cache; only the request travels
+        return backend.generate(model_name, api_key, prompt, generation_config, SAFETY_SETTINGS, stream=stream, cached_content=handle)
+    if context:
+        system_instruction = context.system_instruction
+        prompt = f"{context.text}\n\n{prompt}"
+    return backend.generate(model_name, api_key, prompt, generation_config, SAFETY_SETTINGS, stream=stream, system_instruction=system_instruction)
+
+def _chunk_text(chunk):
+    # The closing chunk of a stream may carry only the finish reason, where .text raises
     try:
-        genai.configure(api_key=new_key)
-        return True
-    except Exception as e:
-        print(f"Failed to rotate key: {e}")
-        return False
+        return chunk.text
+    except ValueError:
+        return ""
+
+def _read_response(response):
+    # A whole answer arrives at once; .text raises if it was blocked
+    text = response.text
+    if text:
+        yield text
+
+def _read_stream(response):
+    for chunk in response:
+        text = _chunk_text(chunk)
+        if text:
+            yield text
 
-def generate_content_with_fallback(prompt):
-    # Prioritize the SMARTEST models first
-    models_to_try = [
-        'gemini-2.0-flash',
-        'gemini-2.0-flash-exp',
-        'gemini-2.5-flash',
-        'gemini-2.0-flash-lite-preview-02-05',
-    ]
+def _generate_with_fallback(prompt, read, stream, use_cache, system_instruction, context, response_schema, on_finish):
+    """Text of the first model and key that answers `prompt`, yielded as `read(response)` delivers it
+
+    The one attempt loop behind generate_content_with_fallback and
+    generate_content_stream: response cache, key leases, model order and circuit
+    breaker, retries within the call's budget, cache-handle fallback, metrics and
+    tracing. Once text has been yielded, an error is raised to the caller instead
+    of moving on, since another answer could not be spliced onto it.
+    """
+    models_to_try = _candidate_models()
+    full_prompt = _full_prompt(prompt, system_instruction, context)
+    generation_config = _generation_config(response_schema)
     
-    # Generation config for better quality
-    generation_config = {
-        'temperature': 0.7,  # Balanced creativity and coherence
-        'top_p': 0.95,
-        'top_k': 40,
-        'max_output_tokens': 8192,
-    }
+    cached = _cached_response(full_prompt, models_to_try, use_cache, generation_config)
+    if cached:
+        yield cached
+        if on_finish:
+            on_finish(None)
+        return
     
-    # Safety settings to block as little as possible
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
+    if key_pool is None:
+        raise Exception("Gemini API is not configured. Call configure_genai first.")
     
-    for model_name in models_to_try:
-        # Retry loop for API key rotation
-        max_retries = len(api_keys) if api_keys else 1
+    # Healthiest model first; models behind an open circuit go last
+    models_to_try = model_router.order(models_to_try)
+    
+    estimated_tokens = _estimate_tokens(full_prompt)
+    attempt = 0
+    budget = retry_policy.budget()
+    
+    while True:
+        quota_limited = False
         
-        for attempt in range(max_retries):
-            try:
-                print(f"Trying model: {model_name} (Key #{current_key_index + 1})")
-                model = genai.GenerativeModel(model_name)
-                response = model.generate_content(
-                    prompt,
-                    safety_settings=safety_settings,
-                    generation_config=generation_config
-                )
+        for model_name in models_to_try:
+            # Each key may be tried once per model before falling back to the next model
+            tried_keys = set()
+            transient_retries = 0
+            
+            while len(tried_keys) < len(key_pool) and not budget.exhausted:
+                # Time spent waiting for quota shows up separately from the attempts themselves
+                with tracing.span("key_pool.acquire", model=model_name):
+                    lease = key_pool.acquire(estimated_tokens, model=model_name, exclude=tried_keys)
+                if lease is None:
+                    print(f"No API key has quota left for {model_name} right now.")
+                    quota_limited = True
+                    break # Try next model
+                key_index, api_key = lease
+                tried_keys.add(key_index)
+                budget.use_attempt()
+                actual_tokens = None
+                parts = []
+                attempt += 1
+                response = None
+                error = None
+                retry_delay = None
+                started = time.monotonic()
+                handle = context.handle(model_name, api_key) if context else None
                 
-                if response.text:
-                    print(f"Success with model: {model_name}")
-                    return response.text
-                else:
-                    print(f"Empty response from {model_name}, trying next...")
-                    break # Break retry loop to try next model
+                try:
+                    print(f"{'Streaming' if stream else 'Trying'} model: {model_name} (Key #{key_index + 1})")
+                    response = _send(
+                        model_name, api_key, prompt, system_instruction, context, handle,
+                        stream=stream, generation_config=generation_config
+                    )
+                    for text in read(response):
+                        parts.append(text)
+                        yield text
                     
-            except Exception as e:
-                error_str = str(e)
-                # Check for Quota Exceeded / Resource Exhausted (429)
-                if "429" in error_str or "Resource has been exhausted" in error_str or "Quota exceeded" in error_str:
-                    print(f"Quota exceeded for Key #{current_key_index + 1}. Rotating key...")
-                    if rotate_api_key():
-                        continue # Retry with new key
+                    usage = getattr(response, "usage_metadata", None)
+                    if usage is not None and usage.total_token_count:
+                        actual_tokens = usage.total_token_count
+                    key_pool.report_success(key_index, model_name)
+                    
+                    full_text = "".join(parts)
+                    if full_text:
+                        print(f"Success with model: {model_name}")
+                        model_router.record_success(model_name, time.monotonic() - started)
+                        _store_response(full_prompt, model_name, generation_config, full_text, _finish_reason(response))
+                        call_metrics.record_request(attempt, "ok")
+                        if on_finish:
+                            on_finish(_finish_reason(response))
+                        return
                     else:
-                        print("Cannot rotate key (no more keys or rotation failed).")
+                        # A blocked stream ends quietly with a SAFETY finish reason instead of raising
+                        error = metrics.BLOCKED if _finish_reason(response) == "SAFETY" else metrics.EMPTY
+                        print(f"Empty response from {model_name}, trying next...")
+                        model_router.record_failure(model_name)
                         break # Try next model
+                        
+                except Exception as e:
+                    error_str = str(e)
+                    error = _error_class(error_str, response)
+                    error_kind = classify_error(e)
+                    if parts:
+                        # Text already reached the caller; switching model now would splice two answers
+                        model_router.record_failure(model_name)
+                        call_metrics.record_request(attempt, "failed")
+                        raise
+                    
+                    if handle and error_kind == RETRY_PERMANENT:
+                        # The cache was rejected (e.g. expired), not the model: resend with the context inline
+                        error = metrics.OTHER
+                        context.invalidate(model_name, api_key)
+                        tried_keys.discard(key_index)
+                        print(f"Cached context rejected for {model_name}, sending it inline: {e}")
+                        continue
+                    
+                    # Quota belongs to the key, not the model, so it doesn't count against model health
+                    if error_kind == RETRY_QUOTA:
+                        print(f"Quota exceeded for Key #{key_index + 1}. Cooling it down and trying another key...")
+                        key_pool.report_quota_exceeded(key_index, model_name, retry_after=retry_after(e))
+                        quota_limited = True
+                        continue # Retry with the next best key
+                    
+                    if not retry_policy.should_retry(error_kind, transient_retries):
+                        print(f"Error with {model_name}: {e}")
+                        model_router.record_failure(model_name, permanent=_is_model_unavailable(error_str))
+                        break # Try next model
+                    
+                    # A transient fault is the service's, not the key's: any key may take the retry
+                    retry_delay = retry_policy.backoff(transient_retries, retry_after(e))
+                    transient_retries += 1
+                    tried_keys.discard(key_index)
+                    print(f"Transient error with {model_name}: {e}. Retrying in {retry_delay:.1f}s...")
+                finally:
+                    key_pool.release(key_index, estimated_tokens, actual_tokens)
+                    _record_call(model_name, api_key, attempt, started, response, error, stream=stream)
                 
-                print(f"Error with {model_name}: {e}")
-                break # Try next model
+                # Only a transient error that is worth retrying gets here
+                if not _backoff(budget, retry_delay, model_name):
+                    model_router.record_failure(model_name)
+                    break # Out of retry budget: try next model
+        
+        # Every model was tried; keys resting after a 429 may be back soon enough to wait for
+        if not quota_limited or not _wait_for_key(budget, models_to_try):
+            break
+        models_to_try = model_router.order(models_to_try)
     
+    call_metrics.record_request(attempt, "failed")
     raise Exception("All models failed to generate content (or all keys exhausted)")
 
-def generate_ebook_metadata(topic):
+def generate_content_with_fallback(prompt, use_cache=None, system_instruction=None, context=None, response_schema=None,
+                                   on_finish=None):
+    """Text of the first model and key that answers `prompt`
+
+    system_instruction goes to the model's system instruction; a BookContext
+    brings its own system instruction and shared prefix (cached when possible).
+    With response_schema (an OpenAPI-style dict) the answer is JSON matching it.
+    on_finish(reason) receives the answer's finish reason (STOP, MAX_TOKENS, ...),
+    or None for an answer from the response cache.
+    """
+    return "".join(_generate_with_fallback(
+        prompt, _read_response, False, use_cache, system_instruction, context, response_schema, on_finish
+    ))
+
+def generate_content_stream(prompt, use_cache=None, system_instruction=None, context=None, response_schema=None,
+                            on_finish=None):
+    """Yield the response text in chunks as the model writes it
+
+    Falls back across keys and models like generate_content_with_fallback, but only
+    until the first chunk arrives; an error after that is raised to the caller.
+    on_finish(reason) is called once the stream has ended, as there.
+    """
+    yield from _generate_with_fallback(
+        prompt, _read_stream, True, use_cache, system_instruction, context, response_schema, on_finish
+    )
+
+# ========== STRUCTURED OUTPUT ==========
+METADATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "target_audience": {"type": "string"},
+        "tone": {"type": "string", "enum": TONE_OPTIONS},
+        "core_problem": {"type": "string"},
+        "core_message": {"type": "string"},
+        "case_study_type": {"type": "string", "enum": CASE_STUDY_OPTIONS},
+        "emotional_tone": {"type": "string", "enum": EMOTIONAL_TONE_OPTIONS},
+    },
+    "required": ["target_audience", "tone", "core_problem", "core_message", "case_study_type", "emotional_tone"],
+}
+
+# Longest chapter title accepted from the model; the outline prompt asks for at most 10 words
+MAX_TITLE_WORDS = 20
+
+def _outline_schema(num_chapters):
+    return {
+        "type": "object",
+        "properties": {
+            "chapters": {"type": "array", "items": {"type": "string"}, "min_items": num_chapters, "max_items": num_chapters},
+        },
+        "required": ["chapters"],
+    }
+
+def _load_json(text):
+    """The JSON object in a model answer, tolerating code fences, surrounding prose and trailing commas"""
+    text = (text or "").strip()
     try:
-        prompt = f"""
-        Analisis topik ebook ini: "{topic}"
-        
-        Berikan rekomendasi metadata dalam format JSON:
-        {{
-            "target_audience": "Siapa target pembaca spesifiknya?",
-            "tone": "Pilih satu: Lucu, Santai, dan Mengena | Formal & Profesional | Motivasi Menggebu-gebu | Sarkas & Humoris | Empatik & Lembut",
-            "core_problem": "Apa masalah utama yang diselesaikan (1-2 kalimat)?",
-            "core_message": "Apa pesan utama ebook ini (1 kalimat)?",
-            "case_study_type": "Pilih satu: Kantoran umum (HR, atasan, tim) | Bisnis Online / UMKM | Kehidupan Rumah Tangga | Mahasiswa / Akademik | Freelancer / Remote Work",
-            "emotional_tone": "Pilih satu: Satir tajam (menyindir realitas) | Optimis & Membangun | Realistis & Logis | Provokatif & Menantang"
-        }}
-        """
-        response = generate_content_with_fallback(prompt)
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Models without JSON mode wrap the object in ```json fences or a sentence of prose
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return None
+    candidate = match.group(0)
+    for attempt in (candidate, re.sub(r',\s*([}\]])', r'\1', candidate)):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            continue
+    return None
+
+def _clean_title(title):
+    # Drop "Bab 3:", "Chapter 3 -", "3." prefixes and bold markers the model adds despite the prompt
+    title = str(title).replace('**', '').strip()
+    title = re.sub(r'^(?:(?:bab|chapter)\s*\d+\s*[:.\-–]?|\d+\s*[.):\-])\s*', '', title, flags=re.IGNORECASE)
+    return title.strip()
+
+def _outline_titles(text_response):
+    """Chapter titles from a JSON outline, or from a plain list when the model ignored JSON mode"""
+    data = _load_json(text_response)
+    if isinstance(data, dict) and isinstance(data.get("chapters"), list):
+        titles = [_clean_title(title) for title in data["chapters"]]
+    else:
+        titles = _parse_list_lines(text_response or "")
+    return [title for title in titles if title and len(title.split()) <= MAX_TITLE_WORDS]
+
+@tracing.traced("generate.metadata")
+def generate_ebook_metadata(topic, use_cache=None):
+    try:
+        prompt = METADATA_PROMPT_TEMPLATE.format(
+            topic=topic,
+            tone_options=" | ".join(TONE_OPTIONS),
+            case_study_options=" | ".join(CASE_STUDY_OPTIONS),
+            emotional_tone_options=" | ".join(EMOTIONAL_TONE_OPTIONS)
+        )
+        response = generate_content_with_fallback(prompt, use_cache=use_cache, response_schema=METADATA_SCHEMA)
         
-        # Simple JSON parsing (robustness improvement needed for prod)
-        import json
-        import re
+        data = _load_json(response)
+        if not isinstance(data, dict):
+            tracing.annotate(response_preview=(response or "")[:200])
+            _report_error("Error generating metadata: the answer was not valid JSON")
+            return None
         
-        # Extract JSON from response
-        match = re.search(r'\{.*\}', response, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            return json.loads(json_str)
-        return None
+        # Keep only known fields with usable values, so a bad field leaves the form's own value alone
+        metadata = {}
+        for field, spec in METADATA_SCHEMA["properties"].items():
+            value = data.get(field)
+            if not isinstance(value, str) or not value.strip():
+                continue
+            if "enum" in spec and value.strip() not in spec["enum"]:
+                continue
+            metadata[field] = value.strip()
+        tracing.annotate(fields=sorted(metadata))
+        return metadata or None
     except Exception as e:
-        st.error(f"Error generating metadata: {e}")
+        _report_error(f"Error generating metadata: {e}")
         return None
 
-def generate_outline(topic, num_chapters=6):
+def _parse_list_lines(text_response):
+    """Titles from a numbered, bulleted or 'Bab X:' list, with the numbering and bold stripped"""
+    # Robust parsing: look for lines starting with numbers, dashes, or 'Bab'/'Bagian'/'Chapter'
+    titles = []
+    for line in text_response.split('\n'):
+        clean_line = line.strip()
+        # Remove markdown bolding for checking
+        check_line = clean_line.replace('*', '').strip()
+        
+        if not check_line:
+            continue
+
+        # Check for various list formats
+        is_list_item = (
+            check_line[0].isdigit() or 
+            check_line.startswith('-') or 
+            check_line.lower().startswith('bab') or 
+            check_line.lower().startswith('bagian') or 
+            check_line.lower().startswith('chapter')
+        )
+        
+        if is_list_item:
+            # Remove leading markdown/bullets and numbering
+            content = clean_line.lstrip('*1234567890.- ').strip()
+            
+            # Remove "Bab X:" or "Chapter X:" prefix if present
+            if ':' in content:
+                parts = content.split(':', 1)
+                if len(parts[0]) < 15: 
+                    content = parts[1].strip()
+            
+            # Final cleanup of bold markers
+            content = content.replace('**', '').strip()
+            
+            if content:
+                titles.append(content)
+    return titles
+
+def _repair_outline(topic, num_chapters, outline, use_cache=None):
+    """One short follow-up call that fixes the chapter count of an existing outline"""
+    prompt = OUTLINE_REPAIR_PROMPT_TEMPLATE.format(
+        topic=topic,
+        num_chapters=num_chapters,
+        actual=len(outline),
+        outline="\n".join(f"{i}. {title}" for i, title in enumerate(outline, 1))
+    )
+    with tracing.span("outline.repair", actual=len(outline), expected=num_chapters):
+        return _outline_titles(generate_content_with_fallback(
+            prompt, use_cache=use_cache, response_schema=_outline_schema(num_chapters)
+        ))
+
+@tracing.traced("generate.outline")
+def generate_outline(topic, num_chapters=6, use_cache=None):
+    """Exactly `num_chapters` chapter titles, or [] when no usable outline came back
+
+    Every title costs a full chapter call later, so a wrong count is fixed here:
+    by one repair call, then by dropping extra titles if the repair missed too.
+    An outline that is still short is reported and rejected.
+    """
     try:
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{OUTLINE_PROMPT_TEMPLATE.format(topic=topic, num_chapters=num_chapters)}"
-        text_response = generate_content_with_fallback(full_prompt)
+        prompt = OUTLINE_PROMPT_TEMPLATE.format(topic=topic, num_chapters=num_chapters)
+        text_response = generate_content_with_fallback(
+            prompt, use_cache=use_cache, system_instruction=SYSTEM_PROMPT, response_schema=_outline_schema(num_chapters)
+        )
         
-        print(f"DEBUG: Raw response for topic '{topic}':\n{text_response}") # Debug print
+        tracing.annotate(topic=topic, response_chars=len(text_response or ""), response_preview=(text_response or "")[:200])
 
         if not text_response:
-            print("DEBUG: Empty response received")
             return []
 
-        # Robust parsing: look for lines starting with numbers, dashes, or 'Bab'/'Chapter'
-        outline = []
-        for line in text_response.split('\n'):
-            clean_line = line.strip()
-            # Remove markdown bolding for checking
-            check_line = clean_line.replace('*', '').strip()
-            
-            if not check_line:
-                continue
-
-            # Check for various list formats
-            is_list_item = (
-                check_line[0].isdigit() or 
-                check_line.startswith('-') or 
-                check_line.lower().startswith('bab') or 
-                check_line.lower().startswith('chapter')
-            )
-            
-            if is_list_item:
-                # Remove numbering, bullets, and "Bab X" prefixes
-                import re
-                # Remove leading markdown/bullets
-                content = clean_line.lstrip('*1234567890.- ').strip()
-                
-                # Remove "Bab X:" or "Chapter X:" prefix if present
-                if ':' in content:
-                    parts = content.split(':', 1)
-                    if len(parts[0]) < 15: 
-                        content = parts[1].strip()
-                
-                # Final cleanup of bold markers
-                content = content.replace('**', '').strip()
-                
-                if content:
-                    outline.append(content)
-        
-        print(f"DEBUG: Parsed outline: {outline}")
+        outline = _outline_titles(text_response)
+        if outline and len(outline) != num_chapters:
+            print(f"Outline has {len(outline)} chapters instead of {num_chapters}, repairing it...")
+            try:
+                repaired = _repair_outline(topic, num_chapters, outline, use_cache)
+            except Exception as e:
+                print(f"Outline repair failed: {e}")
+                repaired = []
+            # Whichever is closer to the requested count wins; extra titles are then dropped
+            if repaired and abs(len(repaired) - num_chapters) < abs(len(outline) - num_chapters):
+                outline = repaired
+            if len(outline) > num_chapters:
+                outline = outline[:num_chapters]
+            elif len(outline) < num_chapters:
+                tracing.annotate(chapters=len(outline), outline=outline)
+                _report_error(f"Error generating outline: got {len(outline)} of {num_chapters} chapters")
+                return []
+        tracing.annotate(chapters=len(outline), outline=outline)
         return outline
     except Exception as e:
-        st.error(f"Error generating outline: {e}")
+        _report_error(f"Error generating outline: {e}")
         return []
 
-def generate_chapter(topic, chapter_title, params, chapter_num, outline):
-    try:
-        # Determine special instructions based on chapter number
-        if chapter_num == 1:
-            special_instruction = (
-                "⚠️ KHUSUS BAB 1: FOKUS PADA 'PROBLEM AGITATION' & 'WHY'.\n"
-                "- JANGAN berikan langkah-langkah teknis atau listicle (misal: 5 Cara, 7 Tips) di sini.\n"
-                "- Gali keresahan/pain points pembaca sedalam-dalamnya. Buat mereka merasa 'Ini gue banget!'.\n"
-                "- Jelaskan konsekuensi fatal jika masalah ini tidak diatasi (Hell Scenario).\n"
-                "- Tujuannya: Membangun urgensi dan koneksi emosional sebelum masuk ke solusi di bab berikutnya."
-            )
+def _special_instruction(chapter_num):
+    # Determine special instructions based on chapter number
+    if chapter_num == 1:
+        return (
+            "⚠️ KHUSUS BAB 1: FOKUS PADA 'PROBLEM AGITATION' & 'WHY'.\n"
+            "- JANGAN berikan langkah-langkah teknis atau listicle (misal: 5 Cara, 7 Tips) di sini.\n"
+            "- Gali keresahan/pain points pembaca sedalam-dalamnya. Buat mereka merasa 'Ini gue banget!'.\n"
+            "- Jelaskan konsekuensi fatal jika masalah ini tidak diatasi (Hell Scenario).\n"
+            "- Tujuannya: Membangun urgensi dan koneksi emosional sebelum masuk ke solusi di bab berikutnya."
+        )
+    return (
+        "FOKUS PADA SOLUSI PRAKTIS (HOW-TO).\n"
+        "- Berikan langkah-langkah konkret yang bisa langsung dipraktikkan.\n"
+        "- Gunakan studi kasus atau contoh nyata.\n"
+        "- Pastikan pembaca tahu apa yang harus dilakukan setelah membaca bab ini."
+    )
+
+def _chapter_prompt(chapter_title, chapter_num):
+    # What differs per chapter; the rest comes from the BookContext
+    return CHAPTER_PROMPT_TEMPLATE.format(
+        chapter_title=chapter_title,
+        chapter_num=chapter_num,
+        special_instruction=_special_instruction(chapter_num)
+    )
+
+# ========== SECTION MODE ==========
+# Chapters at or above this target are written as sections in parallel: one long
+# call is slow and runs into max_output_tokens, several short ones finish together
+SECTION_MODE_MIN_WORDS = 2500
+SECTION_TARGET_WORDS = 1000
+MAX_SECTIONS = 6
+
+# ========== CONTINUATION ==========
+# Follow-up requests per chapter (or section) that was cut off or came back too short
+MAX_CONTINUATIONS = 2
+# A finished chapter below this share of the requested words is extended as well
+MIN_LENGTH_RATIO = 0.7
+# How much of the text so far a continuation request carries
+CONTINUATION_TAIL_CHARS = 2000
+CONTINUATION_MIN_WORDS = 300
+
+def _continuation_reason(text, finish_reason, target_words=None):
+    if finish_reason == "MAX_TOKENS":
+        return "truncated"
+    if target_words and len(text.split()) < target_words * MIN_LENGTH_RATIO:
+        return "short"
+    return None
+
+def _merge_continuation(text, addition, new_paragraph=False):
+    """`text` with `addition` appended, minus any of its own tail the model repeated; also returns what was added
+
+    With new_paragraph (a finished text being extended) the addition starts a
+    paragraph of its own; otherwise it picks up mid-sentence, as after a cut-off.
+    """
+    addition = addition.lstrip() if new_paragraph else addition.lstrip(" ")
+    overlap = False
+    for size in range(min(len(text), len(addition), CONTINUATION_TAIL_CHARS), 15, -1):
+        if text.endswith(addition[:size]):
+            # What is left picks up exactly where the text stopped, even mid-word
+            addition = addition[size:]
+            overlap = True
+            break
+    if not addition.strip():
+        return text, ""
+    if new_paragraph and not overlap:
+        text = text.rstrip()
+        return text + "\n\n" + addition, "\n\n" + addition
+    joined = overlap or text.endswith((" ", "\n")) or addition.startswith(("\n", ",", ".", ";", ":", "!", "?"))
+    separator = "" if joined else " "
+    return text + separator + addition, separator + addition
+
+def _continue_text(prompt, text, finish_reason, context, target_words=None, on_chunk=None, use_cache=None):
+    """Extend `text` while it was cut off by the output limit or falls short of target_words
+
+    Each continuation sends `prompt` again with only the tail of the text and appends
+    just the new part, at most MAX_CONTINUATIONS times. A failed continuation, or
+    one that would leave the text shorter than before, keeps the text as it is.
+    """
+    if not text:
+        return text
+    for _ in range(MAX_CONTINUATIONS):
+        reason = _continuation_reason(text, finish_reason, target_words)
+        if reason is None:
+            break
+        words = len(text.split())
+        base = text
+        if reason == "short":
+            # A finished but short chapter is reopened before its quote and action plan; the continuation closes it again.
+            # The ending is only dropped once something comes back to replace it
+            base = _strip_chapter_ending(text)
+            instruction = CONTINUATION_SHORT_INSTRUCTION.format(words=words, target=target_words)
         else:
-            special_instruction = (
-                "FOKUS PADA SOLUSI PRAKTIS (HOW-TO).\n"
-                "- Berikan langkah-langkah konkret yang bisa langsung dipraktikkan.\n"
-                "- Gunakan studi kasus atau contoh nyata.\n"
-                "- Pastikan pembaca tahu apa yang harus dilakukan setelah membaca bab ini."
-            )
+            instruction = CONTINUATION_TRUNCATED_INSTRUCTION
+        continuation_prompt = CONTINUATION_PROMPT_TEMPLATE.format(
+            prompt=prompt,
+            tail=base[-CONTINUATION_TAIL_CHARS:],
+            instruction=instruction,
+            word_count=max(CONTINUATION_MIN_WORDS, (target_words or 0) - words)
+        )
+        print(f"Continuing text ({reason}, {words} words so far)...")
+        call_metrics.inc("gemini_continuations_total", reason=reason)
+        finish = []
+        try:
+            with tracing.span("generate.continuation", reason=reason, words=words):
+                addition = generate_content_with_fallback(
+                    continuation_prompt, use_cache=use_cache, context=context, on_finish=finish.append
+                )
+        except Exception as e:
+            print(f"Continuation failed, keeping the text as it is: {e}")
+            break
+        merged, added = _merge_continuation(base, addition or "", new_paragraph=reason == "short")
+        # The removed ending has to be made up for, or the extended text would be shorter
+        if not added or len(merged.split()) <= words:
+            break
+        text = merged
+        if on_chunk:
+            on_chunk(added)
+        finish_reason = finish[0] if finish else None
+    return text
 
-        detailed_prompt = CHAPTER_PROMPT_TEMPLATE.format(
-            topic=topic,
-            chapter_title=chapter_title,
-            chapter_num=chapter_num,
-            special_instruction=special_instruction,
-            outline=outline,
-            target_audience=params.get("target_audience", "Profesional Muda / Pemula"),
-            tone=params.get("tone", "Profesional, Hangat, Memotivasi"),
-            word_count=params.get("word_count", 800),
-            case_study_type=params.get("case_study_type", "Studi Kasus Nyata"),
-            perspective=params.get("perspective", "Otomatis"),
-            core_problem=params.get("core_problem", ""),
-            core_message=params.get("core_message", ""),
-            emotional_tone=params.get("emotional_tone", "Netral")
+def _use_sections(params):
+    # params["section_mode"] forces the mode on or off; by default it follows the length
+    mode = params.get("section_mode")
+    if mode is None:
+        return int(params.get("word_count", 800)) >= SECTION_MODE_MIN_WORDS
+    return bool(mode)
+
+def _section_count(word_count):
+    return min(MAX_SECTIONS, max(2, round(word_count / SECTION_TARGET_WORDS)))
+
+@tracing.traced("generate.section_plan")
+def generate_section_plan(context, chapter_title, chapter_num, section_count, use_cache=None):
+    """Section headings for one chapter, in reading order ([] if the model gives fewer than two or the call fails)"""
+    prompt = SECTION_PLAN_PROMPT_TEMPLATE.format(
+        chapter_title=chapter_title,
+        chapter_num=chapter_num,
+        section_count=section_count,
+        special_instruction=_special_instruction(chapter_num)
+    )
+    try:
+        response = generate_content_with_fallback(prompt, use_cache=use_cache, context=context)
+    except Exception as e:
+        # The chapter is then written in a single call instead
+        print(f"Section plan failed for chapter {chapter_num}: {e}")
+        tracing.annotate(error=str(e)[:200])
+        return []
+    headings = _parse_list_lines(response or "")[:section_count]
+    tracing.annotate(sections=headings)
+    return headings if len(headings) >= 2 else []
+
+# Longest line still read as an action-plan heading ("LANGKAH NYATA:") rather than a sentence
+PLAN_HEADING_MAX_CHARS = 60
+_LIST_ITEM_RE = re.compile(r"([-•*☐]|\d+[.)]|\[ ?\])\s")
+
+def _is_plan_heading(line):
+    # A heading or a short "...:" line; a sentence that merely mentions "langkah nyata" is body text
+    bare = line.strip().strip('*_').strip()
+    heading_like = line.startswith('#') or (bare.endswith(':') and len(bare) <= PLAN_HEADING_MAX_CHARS)
+    return heading_like and markdown_ir.is_action_plan_title(bare)
+
+def _is_standalone_quote(line):
+    # The whole line is one bold sentence; a paragraph with some bold words in it is not a quote
+    return line.startswith('**') and line.endswith('**') and markdown_ir.is_golden_quote(line)
+
+def _strip_chapter_ending(text):
+    """Drop a golden quote or action plan the model wrote into a section before the last
+
+    The plan is only looked for at the end: from the last line back over its list
+    items to a plan heading. Then at most one line goes with it, the standalone
+    bold quote right before the plan (or at the very end); body paragraphs stay.
+    """
+    lines = text.rstrip().split('\n')
+    for i in range(len(lines) - 1, -1, -1):
+        line = lines[i].strip()
+        if _is_plan_heading(line):
+            lines = lines[:i]
+            break
+        if line and not _LIST_ITEM_RE.match(line):
+            break
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if lines and _is_standalone_quote(lines[-1].strip()):
+        lines.pop()
+        while lines and not lines[-1].strip():
+            lines.pop()
+    return '\n'.join(lines)
+
+def _generate_section(prompt, context, index, section_count, heading, use_cache=None):
+    with tracing.span("generate.section", section=index + 1, heading=heading):
+        finish = []
+        text = generate_content_with_fallback(prompt, use_cache=use_cache, context=context, on_finish=finish.append)
+        if not text:
+            raise Exception(f"Empty response for section {index + 1}")
+        # Sections are sized well under the output limit, so only a cut-off one is continued
+        text = _continue_text(prompt, text, finish[0] if finish else None, context, use_cache=use_cache)
+        if index < section_count - 1:
+            text = _strip_chapter_ending(text)
+        # The opening section follows the chapter title directly; the others get their heading
+        return text if index == 0 else f"# {heading}\n\n{text.strip()}"
+
+def _generate_chapter_sections(context, chapter_title, params, chapter_num, on_chunk=None, use_cache=None):
+    """Write a chapter as parallel sections and stitch them; None if no section plan came back"""
+    word_count = int(params.get("word_count", 800))
+    headings = generate_section_plan(context, chapter_title, chapter_num, _section_count(word_count), use_cache)
+    if not headings:
+        return None
+
+    # Every section shares the book context and the chapter prompt (with its Bab 1 rule); only the tail differs
+    section_words = max(300, word_count // len(headings))
+    chapter_prompt = _chapter_prompt(chapter_title, chapter_num)
+    section_list = "\n".join(f"{i + 1}. {heading}" for i, heading in enumerate(headings))
+    prompts = []
+    for i, heading in enumerate(headings):
+        if i == len(headings) - 1:
+            position_instruction = SECTION_POSITION_LAST
+        elif i == 0:
+            position_instruction = SECTION_POSITION_FIRST
+        else:
+            position_instruction = SECTION_POSITION_MIDDLE
+        section_prompt = SECTION_PROMPT_TEMPLATE.format(
+            section_list=section_list,
+            section_num=i + 1,
+            section_count=len(headings),
+            section_title=heading,
+            word_count=section_words,
+            position_instruction=position_instruction
         )
-        
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{detailed_prompt}"
-        content = generate_content_with_fallback(full_prompt)
-        print(f"DEBUG: Content for chapter '{chapter_title}':\n{content[:200]}...") # Debug print
+        prompts.append(f"{chapter_prompt}\n{section_prompt}")
+
+    sections = []
+    with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+        futures = [
+            executor.submit(tracing.bind(_generate_section), prompt, context, i, len(headings), heading, use_cache)
+            for i, (prompt, heading) in enumerate(zip(prompts, headings))
+        ]
+        # Collected in order, so a streaming caller sees each section once those before it are done
+        for future in futures:
+            section = future.result()
+            if on_chunk:
+                on_chunk(section if not sections else "\n\n" + section)
+            sections.append(section)
+    return "\n\n".join(sections)
+
+@tracing.traced("generate.chapter")
+def generate_chapter(topic, chapter_title, params, chapter_num, outline, on_chunk=None, context=None, use_cache=None):
+    """Write one chapter; pass the book's `context` (see book_context) to share it across chapters
+
+    `use_cache` (here and in the other generate_* functions) overrides the
+    process-wide cache_enabled for this call only, e.g. per user session.
+    """
+    try:
+        tracing.annotate(chapter=chapter_num, title=chapter_title, streamed=on_chunk is not None)
+        if context is None:
+            # A lone chapter is not worth creating a cache for
+            context = book_context(topic, outline, params, cacheable=False)
+
+        content = None
+        if _use_sections(params):
+            content = _generate_chapter_sections(context, chapter_title, params, chapter_num, on_chunk, use_cache)
+            tracing.annotate(sectioned=content is not None)
+
+        if content is None:
+            prompt = _chapter_prompt(chapter_title, chapter_num)
+            finish = []
+            if on_chunk:
+                # Stream the text out as it arrives, still returning the assembled chapter
+                parts = []
+                for text in generate_content_stream(prompt, use_cache=use_cache, context=context, on_finish=finish.append):
+                    parts.append(text)
+                    on_chunk(text)
+                content = "".join(parts)
+            else:
+                content = generate_content_with_fallback(prompt, use_cache=use_cache, context=context, on_finish=finish.append)
+            # A cut-off or short chapter is continued rather than written again
+            content = _continue_text(
+                prompt, content, finish[0] if finish else None, context,
+                target_words=int(params.get("word_count", 800)), on_chunk=on_chunk, use_cache=use_cache
+            )
+        tracing.annotate(words=len(content.split()), preview=content[:200])
         return content
     except Exception as e:
-        st.error(f"Error generating chapter '{chapter_title}': {e}")
+        _report_error(f"Error generating chapter '{chapter_title}': {e}")
         return ""
 
-def generate_preface(topic, params):
+@tracing.traced("generate.chapters")
+def generate_chapters(topic, outline, params, max_workers=4, max_attempts=2, on_update=None, initializer=None,
+                      on_chunk=None, on_tick=None, tick_interval=0.3, existing=None, on_result=None, use_cache=None):
+    """Generate every chapter of the outline concurrently, returning them in outline order
+
+    Chapters already present in `existing` (a list aligned with the outline) are kept
+    as they are. on_update(index, state), on_result(index, title, content) and on_tick()
+    run on the calling thread; on_chunk(index, text) runs on the worker threads as
+    streamed text arrives, so it should only buffer.
+    """
+    full_outline_str = "\n".join([f"{i+1}. {title}" for i, title in enumerate(outline)])
+    results = list(existing) if existing else [None] * len(outline)
+    pending = [i for i, result in enumerate(results) if result is None]
+    # Form, outline and writing rules are sent once per book instead of once per chapter
+    context = book_context(topic, full_outline_str, params, cacheable=bool(pending))
+
+    def notify(index, state):
+        if on_update:
+            on_update(index, state)
+
+    try:
+        for attempt in range(1, max_attempts + 1):
+            if not pending:
+                break
+
+            failed = []
+            workers = max(1, min(max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+                futures = {}
+                for i in pending:
+                    notify(i, "running" if attempt == 1 else "retrying")
+                    chunk_callback = (lambda text, i=i: on_chunk(i, text)) if on_chunk else None
+                    future = executor.submit(
+                        tracing.bind(generate_chapter), topic, outline[i], params, i + 1, full_outline_str, chunk_callback, context,
+                        use_cache
+                    )
+                    futures[future] = i
+
+                not_done = set(futures)
+                while not_done:
+                    done, not_done = wait(not_done, timeout=tick_interval, return_when=FIRST_COMPLETED)
+                    if on_tick:
+                        on_tick()
+
+                    for future in done:
+                        i = futures[future]
+                        try:
+                            content = future.result()
+                        except Exception as e:
+                            print(f"Chapter {i + 1} raised: {e}")
+                            content = ""
+
+                        if content:
+                            results[i] = (outline[i], content)
+                            if on_result:
+                                on_result(i, outline[i], content)
+                            notify(i, "complete")
+                        else:
+                            failed.append(i)
+                            notify(i, "error" if attempt == max_attempts else "failed")
+
+            pending = sorted(failed)
+    finally:
+        context.close()
+
+    return results
+
+@tracing.traced("generate.preface")
+def generate_preface(topic, params, use_cache=None):
     try:
         from prompts import PREFACE_PROMPT_TEMPLATE
         detailed_prompt = PREFACE_PROMPT_TEMPLATE.format(
@@ -255,15 +1147,15 @@ def generate_preface(topic, params):
             tone=params.get("tone", "Santai")
         )
         
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{detailed_prompt}"
-        content = generate_content_with_fallback(full_prompt)
-        print(f"DEBUG: Preface generated:\n{content[:200]}...")
+        content = generate_content_with_fallback(detailed_prompt, use_cache=use_cache, system_instruction=SYSTEM_PROMPT)
+        tracing.annotate(words=len(content.split()), preview=content[:200])
         return content
     except Exception as e:
-        st.error(f"Error generating preface: {e}")
+        _report_error(f"Error generating preface: {e}")
         return ""
 
-def generate_conclusion(topic, params):
+@tracing.traced("generate.conclusion")
+def generate_conclusion(topic, params, use_cache=None):
     try:
         from prompts import CONCLUSION_PROMPT_TEMPLATE
         detailed_prompt = CONCLUSION_PROMPT_TEMPLATE.format(
@@ -272,10 +1164,9 @@ def generate_conclusion(topic, params):
             tone=params.get("tone", "Santai")
         )
         
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{detailed_prompt}"
-        content = generate_content_with_fallback(full_prompt)
-        print(f"DEBUG: Conclusion generated:\n{content[:200]}...")
+        content = generate_content_with_fallback(detailed_prompt, use_cache=use_cache, system_instruction=SYSTEM_PROMPT)
+        tracing.annotate(words=len(content.split()), preview=content[:200])
         return content
     except Exception as e:
-        st.error(f"Error generating conclusion: {e}")
+        _report_error(f"Error generating conclusion: {e}")
         return ""
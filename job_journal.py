@@ -0,0 +1,142 @@
+import json
+import os
+import re
+import time
+import uuid
+
+JOBS_DIR = ".jobs"
+
+_JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _write_atomic(path, data):
+    """Write text so a crash never leaves a half-written artifact behind"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class JobJournal:
+    """On-disk record of every artifact of one ebook job, so a failed run can resume"""
+
+    def __init__(self, job_id, root=JOBS_DIR):
+        if not _JOB_ID_PATTERN.match(job_id or ""):
+            raise ValueError(f"Invalid job ID: {job_id!r}")
+        self.job_id = job_id
+        self.path = os.path.join(root, job_id)
+        self.chapters_path = os.path.join(self.path, "chapters")
+
+    @classmethod
+    def create(cls, topic, form_data, root=JOBS_DIR):
+        journal = cls(uuid.uuid4().hex[:12], root)
+        os.makedirs(journal.chapters_path, exist_ok=True)
+        journal.save_metadata(topic, form_data)
+        return journal
+
+    @classmethod
+    def open(cls, job_id, root=JOBS_DIR):
+        """Open an existing job; returns None if there is no such job"""
+        try:
+            journal = cls(job_id.strip(), root)
+        except ValueError:
+            return None
+        if journal.load_metadata() is None:
+            return None
+        return journal
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # ========== METADATA ==========
+    def save_metadata(self, topic, form_data):
+        payload = {"topic": topic, "form_data": dict(form_data), "created_at": time.time()}
+        _write_atomic(self._file("metadata.json"), json.dumps(payload, ensure_ascii=False, indent=2))
+
+    def load_metadata(self):
+        data = _read(self._file("metadata.json"))
+        return json.loads(data) if data else None
+
+    # ========== OUTLINE ==========
+    def save_outline(self, outline):
+        _write_atomic(self._file("outline.json"), json.dumps(list(outline), ensure_ascii=False, indent=2))
+
+    def load_outline(self):
+        data = _read(self._file("outline.json"))
+        return json.loads(data) if data else None
+
+    # ========== PREFACE / CONCLUSION ==========
+    def save_preface(self, content):
+        _write_atomic(self._file("preface.md"), content)
+
+    def load_preface(self):
+        return _read(self._file("preface.md"))
+
+    def save_conclusion(self, content):
+        _write_atomic(self._file("conclusion.md"), content)
+
+    def load_conclusion(self):
+        return _read(self._file("conclusion.md"))
+
+    # ========== CHAPTERS ==========
+    def _chapter_file(self, index):
+        return os.path.join(self.chapters_path, f"{index + 1:03d}.json")
+
+    def save_chapter(self, index, chapter_title, content):
+        payload = {"title": chapter_title, "content": content}
+        _write_atomic(self._chapter_file(index), json.dumps(payload, ensure_ascii=False))
+
+    def load_chapters(self, outline):
+        """Saved chapters as a list aligned with the outline, None where a chapter is missing"""
+        chapters = []
+        for i, chapter_title in enumerate(outline):
+            data = _read(self._chapter_file(i))
+            entry = json.loads(data) if data else None
+            # A chapter written for a different outline entry does not count
+            if entry and entry.get("title") == chapter_title and entry.get("content"):
+                chapters.append((chapter_title, entry["content"]))
+            else:
+                chapters.append(None)
+        return chapters
+
+    # ========== WHOLE BOOK ==========
+    def version(self):
+        """Name and modification time of every saved file; changes whenever something is saved"""
+        entries = []
+        for directory in (self.path, self.chapters_path):
+            try:
+                with os.scandir(directory) as scan:
+                    entries.extend((entry.name, entry.stat().st_mtime_ns) for entry in scan if entry.is_file())
+            except FileNotFoundError:
+                pass
+        return tuple(sorted(entries))
+
+    def load_book(self):
+        """Everything written so far, or None before the outline exists
+
+        Returns {"topic", "preface", "chapters", "conclusion", "complete"}, with the
+        chapters aligned with the outline (None where one is missing).
+        """
+        metadata = self.load_metadata()
+        outline = self.load_outline()
+        if not metadata or not outline:
+            return None
+
+        book = {
+            "topic": metadata["topic"],
+            "preface": self.load_preface(),
+            "chapters": self.load_chapters(outline),
+            "conclusion": self.load_conclusion(),
+        }
+        book["complete"] = bool(
+            book["preface"] and book["conclusion"] and all(book["chapters"])
+        )
+        return book
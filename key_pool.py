@@ -0,0 +1,170 @@
+import threading
+import time
+
+# Default per-key limits (Gemini free tier); pass different values to KeyPool for paid keys
+DEFAULT_RPM = 15
+DEFAULT_TPM = 1_000_000
+DEFAULT_COOLDOWN = 60  # seconds a key rests (for that model) after a 429
+MAX_COOLDOWN = 300
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units per minute"""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.refill_rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.level = min(self.capacity, self.level + elapsed * self.refill_rate)
+            self.updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.level
+
+    def seconds_until(self, amount, now):
+        """Seconds until `amount` units are available (0 if they already are)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+
+class _KeySlot:
+    def __init__(self, key, rpm, tpm):
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # Gemini enforces quota per model, so a 429 only rests the key for that model
+        self.cooldown_until = {}
+        self.strikes = {}
+        self.in_flight = 0
+
+
+class KeyPool:
+    """Thread-safe scheduler that hands each request to the API key with the most quota headroom"""
+
+    def __init__(self, keys, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, cooldown=DEFAULT_COOLDOWN):
+        self.keys = list(keys)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.cooldown = cooldown
+        self._slots = [_KeySlot(key, rpm, tpm) for key in self.keys]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def acquire(self, estimated_tokens=0, model=None, max_wait=60.0, exclude=()):
+        """Reserve one request on the best key; returns (index, key) or None if nothing frees up in time
+
+        Waits (up to max_wait) for the rate buckets to refill, but never for a 429
+        cooldown: when every key is cooling down for `model` it returns None at once
+        so the caller can move on to another model.
+        """
+        deadline = time.monotonic() + max_wait
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                best_index = None
+                best_score = None
+                soonest = None
+
+                for i, slot in enumerate(self._slots):
+                    if i in exclude:
+                        continue
+
+                    if slot.cooldown_until.get(model, 0.0) > now:
+                        continue
+
+                    wait = max(
+                        slot.requests.seconds_until(1, now),
+                        slot.tokens.seconds_until(estimated_tokens, now)
+                    )
+
+                    if wait > 0:
+                        soonest = wait if soonest is None else min(soonest, wait)
+                        continue
+
+                    # Headroom is the scarcer of the two budgets; break ties on fewer in-flight calls
+                    headroom = min(
+                        slot.requests.available(now) / slot.requests.capacity,
+                        slot.tokens.available(now) / slot.tokens.capacity
+                    )
+                    score = (headroom, -slot.in_flight)
+                    if best_score is None or score > best_score:
+                        best_index, best_score = i, score
+
+                if best_index is not None:
+                    slot = self._slots[best_index]
+                    slot.requests.consume(1, now)
+                    slot.tokens.consume(estimated_tokens, now)
+                    slot.in_flight += 1
+                    return best_index, slot.key
+
+            if soonest is None:
+                return None
+
+            remaining = deadline - time.monotonic()
+            if soonest > remaining:
+                return None
+            time.sleep(soonest)
+
+    def release(self, index, estimated_tokens=0, actual_tokens=None):
+        """Finish a request, correcting the token bucket once the real usage is known"""
+        with self._lock:
+            slot = self._slots[index]
+            slot.in_flight = max(0, slot.in_flight - 1)
+            if actual_tokens is not None:
+                slot.tokens.consume(actual_tokens - estimated_tokens, time.monotonic())
+
+    def report_success(self, index, model=None):
+        with self._lock:
+            self._slots[index].strikes.pop(model, None)
+
+    def report_quota_exceeded(self, index, model=None, retry_after=None):
+        """Rest a key that returned 429 for `model`, backing off longer on repeated strikes"""
+        with self._lock:
+            now = time.monotonic()
+            slot = self._slots[index]
+            strikes = slot.strikes[model] = slot.strikes.get(model, 0) + 1
+            if retry_after is None:
+                retry_after = min(self.cooldown * (2 ** (strikes - 1)), MAX_COOLDOWN)
+            slot.cooldown_until[model] = max(slot.cooldown_until.get(model, 0.0), now + retry_after)
+
+    def cooldown_remaining(self, models):
+        """Seconds until some key is out of its 429 cooldown for one of `models` (0 if one already is)"""
+        with self._lock:
+            now = time.monotonic()
+            return min(
+                max(0.0, slot.cooldown_until.get(model, 0.0) - now)
+                for slot in self._slots for model in models
+            ) if self._slots and models else 0.0
+
+    def snapshot(self):
+        """Current headroom of every key, for display and debugging"""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "key": f"#{i + 1}",
+                    "requests_left": round(slot.requests.available(now), 1),
+                    "tokens_left": int(slot.tokens.available(now)),
+                    "cooling_models": sorted(
+                        str(model) for model, until in slot.cooldown_until.items() if until > now
+                    ),
+                    "in_flight": slot.in_flight,
+                }
+                for i, slot in enumerate(self._slots)
+            ]
@@ -0,0 +1,145 @@
+"""One-pass parser from model markdown to a small block/inline IR
+
+The rules are exactly the ones document_maker.py has always applied line by line
+(filler lines, meta headings, action plans, golden quotes, lists); they are kept
+here once so every output (docx, HTML preview, ...) reads the same blocks.
+"""
+import re
+
+# Block kinds
+HEADING = "heading"
+PARAGRAPH = "paragraph"
+LIST_ITEM = "list_item"
+QUOTE = "quote"
+ACTION_PLAN = "action_plan"
+
+# Conversational filler the model opens with ("Tentu, berikut ...")
+FILLER_PREFIXES = ("tentu", "ini dia", "berikut", "baik")
+
+# Structural meta-headings and duplicate section titles; matched anywhere in the heading
+SKIP_HEADINGS = [
+    "THE HOOK", "THE BODY", "GOLDEN QUOTE", "ACTION PLAN",
+    "A. THE HOOK", "B. THE BODY", "C. GOLDEN QUOTE", "D. ACTION PLAN",
+    "HOOK", "BODY", "ISI", "PEMBUKAAN", "ISI UTAMA",
+    "KATA PENGANTAR", "PENUTUP", "CONCLUSION", "PREFACE"
+]
+
+_SKIP_HEADING_RE = re.compile("|".join(re.escape(skip) for skip in SKIP_HEADINGS))
+_ACTION_PLAN_RE = re.compile("LANGKAH NYATA|MISI HARI INI|RENCANA AKSI")
+_BULLET_PREFIXES = ("- ", "• ", "* ")
+
+
+class Block:
+    """One rendered unit: a heading, paragraph, list item, golden quote or action-plan title
+
+    `text` holds the display text of headings, quotes and action-plan titles;
+    paragraphs and list items carry `spans`, a list of (text, bold) pairs.
+    `first` marks the opening paragraph of a section, `action` a list item
+    inside an action plan.
+    """
+
+    __slots__ = ("kind", "text", "level", "spans", "first", "action")
+
+    def __init__(self, kind, text="", level=0, spans=None, first=False, action=False):
+        self.kind = kind
+        self.text = text
+        self.level = level
+        self.spans = spans
+        self.first = first
+        self.action = action
+
+    def __repr__(self):
+        body = self.text or "".join(f"**{t}**" if bold else t for t, bold in self.spans or ())
+        return f"Block({self.kind}, {body[:40]!r})"
+
+
+def inline_spans(text):
+    """Split text on ** into (text, bold) spans, dropping stray * and underscores"""
+    parts = text.replace('_', '').strip().split("**")
+    return [
+        (part.replace('*', ''), i % 2 == 1)
+        for i, part in enumerate(parts)
+        if part
+    ]
+
+
+def is_action_plan_title(line):
+    """True for a line that opens the action plan ("LANGKAH NYATA:" and friends)"""
+    return bool(_ACTION_PLAN_RE.search(line.upper()))
+
+
+def is_golden_quote(line):
+    """True for a stripped paragraph line that is one standalone bold sentence"""
+    return line.count('**') == 2 and len(line) < 200
+
+
+def _is_section_title(line, title_lower):
+    # The model sometimes repeats "Kata Pengantar" / "Penutup" at the top of the section
+    return line.strip().replace('"', '').replace('*', '').replace(':', '').strip().lower() == title_lower
+
+
+def parse(content, strip_underscores=False, section_title=None, first_paragraph=True):
+    """Parse markdown into a list of Blocks in a single pass over the lines
+
+    strip_underscores drops every underscore first (chapter text); section_title
+    drops lines that only repeat that title when it appears in the first 100
+    characters. first_paragraph marks the first plain paragraph as the opener.
+    """
+    if strip_underscores:
+        content = content.replace('_', '')
+
+    title_lower = None
+    if section_title and section_title.lower() in content.lower()[:100]:
+        title_lower = section_title.lower()
+
+    blocks = []
+    in_action_plan = False
+
+    for raw_line in content.split('\n'):
+        if title_lower is not None and _is_section_title(raw_line, title_lower):
+            continue
+
+        line = raw_line.strip()
+        if not line or line.lower().startswith(FILLER_PREFIXES):
+            continue
+
+        # ========== HEADINGS ==========
+        if line[0] == '#':
+            text = line.lstrip('#')
+            level = len(line) - len(text)
+            text = text.strip()
+            if _SKIP_HEADING_RE.search(text.upper()):
+                continue
+            text = text.replace('**', '').replace('*', '').strip()
+            blocks.append(Block(HEADING, text, level=min(level + 1, 3)))
+            first_paragraph = True
+            continue
+
+        # ========== ACTION PLAN ==========
+        if is_action_plan_title(line):
+            blocks.append(Block(ACTION_PLAN, line.replace('*', '').upper()))
+            in_action_plan = True
+            continue
+
+        # ========== NUMBERED/BULLET LISTS ==========
+        if len(line) > 2 and line[0].isdigit() and line[1] in ('.', ')'):
+            # Splits on the first '.' even for "1)" items that contain one
+            item = line.split('.', 1)[1].strip() if '.' in line else line.split(')', 1)[1].strip()
+            blocks.append(Block(LIST_ITEM, spans=inline_spans(item), action=in_action_plan))
+            continue
+        if line.startswith(_BULLET_PREFIXES):
+            blocks.append(Block(LIST_ITEM, spans=inline_spans(line[2:].strip()), action=in_action_plan))
+            continue
+
+        # ========== PARAGRAPHS ==========
+        first = first_paragraph and not in_action_plan
+        if first:
+            first_paragraph = False
+
+        # A standalone bold line is a golden quote
+        if is_golden_quote(line):
+            blocks.append(Block(QUOTE, line.replace('**', '').strip(), first=first))
+        else:
+            blocks.append(Block(PARAGRAPH, spans=inline_spans(line), first=first))
+
+    return blocks
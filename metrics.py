@@ -0,0 +1,256 @@
+"""In-process metrics for Gemini calls: counters, histograms and a per-call log
+
+generator.py records one entry per attempt (model, key fingerprint, attempt number,
+latency, token usage, finish reason, error class). The totals are exported as
+Prometheus text or JSONL, and summarized in the app's sidebar.
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+# Error classes recorded for failed attempts
+QUOTA = "quota"
+UNAVAILABLE = "unavailable"
+TRANSIENT = "transient"
+EMPTY = "empty"
+BLOCKED = "blocked"
+OTHER = "other"
+
+
+def key_fingerprint(api_key):
+    """Short stable ID for an API key that is safe to log and export"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate of the q-quantile, interpolated inside its bucket like histogram_quantile()"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms
+
+    With `log_path` set, every recorded call is also appended to that file as one
+    JSON line, so several processes (e.g. batch workers) can share one log.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_call(self, model, api_key, attempt, latency, prompt_tokens=None, output_tokens=None,
+                    finish_reason=None, error=None, stream=False, cached_tokens=None):
+        """Record one attempt against the API; `error` is one of the error classes or None"""
+        key = key_fingerprint(api_key)
+        outcome = "error" if error else "ok"
+        self.inc("gemini_calls_total", model=model, key=key, outcome=outcome, error=error)
+        self.observe("gemini_call_latency_seconds", latency, model=model, outcome=outcome)
+        if prompt_tokens:
+            self.inc("gemini_tokens_total", prompt_tokens, model=model, key=key, kind="prompt")
+        if cached_tokens:
+            # Part of the prompt tokens, served from a context cache at a lower rate
+            self.inc("gemini_tokens_total", cached_tokens, model=model, key=key, kind="cached")
+        if output_tokens:
+            self.inc("gemini_tokens_total", output_tokens, model=model, key=key, kind="output")
+            self.observe("gemini_output_tokens", output_tokens, TOKEN_BUCKETS, model=model)
+        if finish_reason:
+            self.inc("gemini_finish_reasons_total", model=model, reason=finish_reason)
+
+        if self.log_path:
+            entry = {
+                "time": time.time(), "model": model, "key": key, "attempt": attempt,
+                "latency": round(latency, 3), "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+                "output_tokens": output_tokens, "finish_reason": finish_reason,
+                "error": error, "stream": stream,
+            }
+            self._append(self.log_path, entry)
+
+    def record_request(self, attempts, outcome):
+        """Record one logical request (all its attempts across keys and models)"""
+        self.inc("gemini_requests_total", outcome=outcome)
+        self.observe("gemini_request_attempts", attempts, ATTEMPT_BUCKETS)
+
+    def _append(self, path, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    # ========== QUERIES ==========
+    def total(self, name, **labels):
+        """Sum of a counter over every series matching the given labels"""
+        wanted = set(self._labels(labels))
+        with self._lock:
+            return sum(
+                value for (series, series_labels), value in self._counters.items()
+                if series == name and wanted <= set(series_labels)
+            )
+
+    def merged_histogram(self, name, **labels):
+        """One histogram combining every series of `name` matching the given labels"""
+        wanted = set(self._labels(labels))
+        merged = None
+        with self._lock:
+            for (series, series_labels), histogram in self._histograms.items():
+                if series != name or not wanted <= set(series_labels):
+                    continue
+                if merged is None:
+                    merged = Histogram(histogram.buckets)
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+        return merged
+
+    def summary(self):
+        """Headline numbers for display: calls, tokens, latency percentiles, per-key and per-reason counts"""
+        with self._lock:
+            counters = list(self._counters.items())
+
+        per_key = {}
+        finish_reasons = {}
+        errors = {}
+        for (name, labels), value in counters:
+            labels = dict(labels)
+            if name == "gemini_calls_total":
+                stats = per_key.setdefault(labels["key"], {"calls": 0, "errors": 0, "quota_errors": 0, "tokens": 0})
+                stats["calls"] += value
+                if labels["outcome"] == "error":
+                    stats["errors"] += value
+                    errors[labels["error"]] = errors.get(labels["error"], 0) + value
+                if labels.get("error") == QUOTA:
+                    stats["quota_errors"] += value
+            elif name == "gemini_tokens_total" and labels["kind"] != "cached":
+                stats = per_key.setdefault(labels["key"], {"calls": 0, "errors": 0, "quota_errors": 0, "tokens": 0})
+                stats["tokens"] += value
+            elif name == "gemini_finish_reasons_total":
+                finish_reasons[labels["reason"]] = finish_reasons.get(labels["reason"], 0) + value
+
+        latency = self.merged_histogram("gemini_call_latency_seconds", outcome="ok")
+        return {
+            "calls": self.total("gemini_calls_total"),
+            "requests": self.total("gemini_requests_total"),
+            "cache_hits": self.total("gemini_cache_hits_total"),
+            "continuations": self.total("gemini_continuations_total"),
+            "prompt_tokens": self.total("gemini_tokens_total", kind="prompt"),
+            "output_tokens": self.total("gemini_tokens_total", kind="output"),
+            "cached_tokens": self.total("gemini_tokens_total", kind="cached"),
+            "latency_p50": latency.quantile(0.5) if latency else None,
+            "latency_p95": latency.quantile(0.95) if latency else None,
+            "errors": errors,
+            "finish_reasons": finish_reasons,
+            "keys": per_key,
+        }
+
+    # ========== EXPORT ==========
+    def to_prometheus(self):
+        """All series in the Prometheus text exposition format"""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            inner = ",".join(f'{k}="{v}"' for k, v in pairs)
+            return "{" + inner + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(h.counts), h.count, h.sum, h.buckets) for key, h in self._histograms.items()
+            )
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+
+        for (name, labels), counts, count, total, buckets in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text atomically, e.g. for node_exporter's textfile collector"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def write_jsonl(self, path):
+        """Append a snapshot of every series to `path`, one JSON object per series"""
+        now = time.time()
+        with self._lock:
+            entries = [
+                {"time": now, "type": "counter", "name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ] + [
+                {
+                    "time": now, "type": "histogram", "name": name, "labels": dict(labels),
+                    "buckets": list(h.buckets), "counts": list(h.counts), "count": h.count, "sum": h.sum,
+                }
+                for (name, labels), h in sorted(self._histograms.items(), key=lambda item: item[0])
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# How long a probe result stays valid before list_models() is called again
+DEFAULT_TTL = 6 * 60 * 60
+# How long a failed probe is remembered, so reruns while offline or with a bad key don't each wait for a timeout
+FAILURE_TTL = 60
+CACHE_PATH = os.path.join(".cache", "models.json")
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+
+def key_set_fingerprint(keys):
+    """Stable hash of a key set, so keys themselves never hit the disk"""
+    digest = hashlib.sha256("\n".join(sorted(keys)).encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+def _read_disk_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_disk_cache(cache_path, data):
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write model cache: {e}")
+
+
+def _store(fingerprint, entry, cache_path):
+    _memory_cache[fingerprint] = entry
+    disk = _read_disk_cache(cache_path)
+    disk[fingerprint] = entry
+    _write_disk_cache(cache_path, disk)
+
+
+def get_available_models(keys, probe, ttl=DEFAULT_TTL, cache_path=CACHE_PATH, failure_ttl=FAILURE_TTL):
+    """Return the set of model names usable with `keys`, probing at most once per TTL
+
+    `probe` is called with a single API key and returns the model names that support
+    generateContent. Returns None if the models cannot be determined; a failed
+    probe is not retried for `failure_ttl` seconds.
+    """
+    if not keys:
+        return None
+
+    fingerprint = key_set_fingerprint(keys)
+
+    with _lock:
+        now = time.time()
+        entry = _memory_cache.get(fingerprint)
+        if entry is None:
+            entry = _read_disk_cache(cache_path).get(fingerprint)
+        if entry is not None and "failed_at" in entry and now - entry["failed_at"] < failure_ttl:
+            _memory_cache[fingerprint] = entry
+            return None
+        if entry is not None and "probed_at" in entry and now - entry["probed_at"] < ttl:
+            _memory_cache[fingerprint] = entry
+            return set(entry["models"])
+
+        try:
+            names = probe(keys[0])
+        except Exception as e:
+            print(f"Model probe failed, not retrying for {failure_ttl}s: {e}")
+            _store(fingerprint, {"failed_at": now}, cache_path)
+            return None
+
+        models = sorted(name.split("/", 1)[-1] for name in names)
+        print(f"Model probe found {len(models)} model(s) supporting generateContent")
+        _store(fingerprint, {"probed_at": now, "models": models}, cache_path)
+        return set(models)
+
+
+def cached_models(keys, ttl=DEFAULT_TTL):
+    """In-memory lookup only; None when the key set has not been probed"""
+    if not keys:
+        return None
+    entry = _memory_cache.get(key_set_fingerprint(keys))
+    if entry is None or "probed_at" not in entry or time.time() - entry["probed_at"] >= ttl:
+        return None
+    return set(entry["models"])
+
+
+def invalidate(keys=None):
+    """Forget probe results for one key set, or all of them"""
+    with _lock:
+        if keys is None:
+            _memory_cache.clear()
+        else:
+            _memory_cache.pop(key_set_fingerprint(keys), None)
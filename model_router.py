@@ -0,0 +1,135 @@
+import threading
+import time
+
+# Smoothing for the moving averages: higher reacts faster to recent calls
+EWMA_ALPHA = 0.3
+HEALTHY_SUCCESS_RATE = 0.6  # below this a model drops behind healthier ones
+SLOW_LATENCY_FACTOR = 2.0  # a healthy model this many times slower than the fastest one drops behind it
+FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+BASE_BACKOFF = 30  # seconds before the first half-open probe
+MAX_BACKOFF = 600
+PROBE_TIMEOUT = 120  # a claimed probe that never reports back is released after this
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class _ModelHealth:
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_count = 0
+        self.retry_at = 0.0
+        self.probe_claimed_at = None
+        self.calls = 0
+
+
+class ModelRouter:
+    """Orders models by recent health and keeps failing models behind a circuit breaker"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model_name):
+        health = self._health.get(model_name)
+        if health is None:
+            health = self._health[model_name] = _ModelHealth()
+        return health
+
+    def order(self, models):
+        """Models to try for the next call, healthiest first
+
+        Healthy models come first in the configured preference order, except that
+        one much slower than the fastest healthy model (SLOW_LATENCY_FACTOR) goes
+        after the others. Degraded models follow, ranked by success rate and then
+        latency. An open circuit whose backoff has elapsed goes first, as a single
+        half-open probe. Models still cooling down are only returned at the end as
+        a last resort.
+        """
+        with self._lock:
+            now = time.monotonic()
+            ready = []
+            cooling = []
+            healthy_latencies = [
+                health.latency for health in (self._get(name) for name in models)
+                if health.state == CLOSED and health.success_rate >= HEALTHY_SUCCESS_RATE and health.latency is not None
+            ]
+            slow_after = min(healthy_latencies) * SLOW_LATENCY_FACTOR if healthy_latencies else None
+
+            for preference, model_name in enumerate(models):
+                health = self._get(model_name)
+
+                if health.state != CLOSED:
+                    probe_stale = health.probe_claimed_at is None or now - health.probe_claimed_at > PROBE_TIMEOUT
+                    if now >= health.retry_at and probe_stale:
+                        health.state = HALF_OPEN
+                        health.probe_claimed_at = now
+                        # The probe goes first; behind healthy fallbacks it would never be sent
+                        ready.append((-1, 0.0, 0.0, preference, model_name))
+                    else:
+                        cooling.append((health.retry_at, preference, model_name))
+                    continue
+
+                # A model without a measured latency yet counts as fast, so it gets measured
+                latency = health.latency or 0.0
+                if health.success_rate >= HEALTHY_SUCCESS_RATE:
+                    slow = slow_after is not None and latency > slow_after
+                    ready.append((0, float(slow), 0.0, preference, model_name))
+                else:
+                    ready.append((1, -health.success_rate, latency, preference, model_name))
+
+            ready.sort()
+            cooling.sort()
+            return [entry[-1] for entry in ready] + [entry[-1] for entry in cooling]
+
+    def record_success(self, model_name, latency):
+        with self._lock:
+            health = self._get(model_name)
+            health.calls += 1
+            if health.state == CLOSED:
+                health.success_rate = (1 - EWMA_ALPHA) * health.success_rate + EWMA_ALPHA
+            else:
+                # A successful probe closes the circuit with a clean slate, so the model regains its rank
+                health.success_rate = 1.0
+            health.latency = latency if health.latency is None else (1 - EWMA_ALPHA) * health.latency + EWMA_ALPHA * latency
+            health.consecutive_failures = 0
+            health.state = CLOSED
+            health.opened_count = 0
+            health.probe_claimed_at = None
+
+    def record_failure(self, model_name, permanent=False):
+        """Count a model-level failure; `permanent` (e.g. model not found) opens the circuit at once"""
+        with self._lock:
+            health = self._get(model_name)
+            health.calls += 1
+            health.success_rate = (1 - EWMA_ALPHA) * health.success_rate
+            health.consecutive_failures += 1
+
+            if permanent or health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                health.opened_count += 1
+                backoff = min(self.base_backoff * (2 ** (health.opened_count - 1)), self.max_backoff)
+                health.state = OPEN
+                health.retry_at = time.monotonic() + backoff
+                health.probe_claimed_at = None
+                print(f"Circuit opened for {model_name} for {backoff}s")
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                name: {
+                    "state": health.state,
+                    "success_rate": round(health.success_rate, 2),
+                    "latency": round(health.latency, 2) if health.latency is not None else None,
+                    "retry_in": round(max(0.0, health.retry_at - now), 1) if health.state != CLOSED else 0.0,
+                    "calls": health.calls,
+                }
+                for name, health in self._health.items()
+            }
@@ -0,0 +1,216 @@
+"""Streaming .docx writer: word/document.xml goes straight into the zip, chapter by chapter
+
+create_ebook builds the whole python-docx tree in memory and then serializes it,
+so a big book exists twice at the end. write_ebook produces the same document
+(same parts, styles, A5 section, TOC and PAGE fields, byte-identical body XML)
+while holding only one chapter's XML at a time. The styled parts (styles.xml,
+footer1.xml, numbering.xml, ...) come from a skeleton opened once from
+document_maker's cached template, so both backends always share one style setup.
+"""
+import re
+import threading
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import markdown_ir
+import tracing
+
+DOCUMENT_PART = "word/document.xml"
+
+# Characters XML 1.0 cannot hold (python-docx raises on them); dropped from text
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_RUN_SPECIALS = re.compile(r"(\t|\r|\n)")
+
+_HEADING_COLOR = "003366"
+
+_PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+_SPACER = '<w:p><w:pPr><w:spacing w:after="240"/></w:pPr></w:p>'
+_HORIZONTAL_LINE = (
+    '<w:p><w:pPr><w:spacing w:before="240" w:after="240"/>'
+    '<w:pBdr><w:bottom w:val="single" w:sz="12" w:color="0066CC"/></w:pBdr></w:pPr></w:p>'
+)
+_QUOTE_BORDER = "<w:pBdr>" + "".join(
+    f'<w:{side} w:val="single" w:sz="4" w:color="B0C4DE"/>' for side in ("top", "left", "bottom", "right")
+) + "</w:pBdr>"
+_TABLE_OF_CONTENTS = (
+    '<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Daftar Isi</w:t></w:r></w:p>'
+    '<w:p><w:r><w:fldChar w:fldCharType="begin"/>'
+    '<w:instrText xml:space="preserve">TOC \\o "1-3" \\h \\z \\u</w:instrText>'
+    '<w:fldChar w:fldCharType="end"/></w:r></w:p>'
+    '<w:p><w:r><w:rPr><w:i/><w:color w:val="808080"/><w:sz w:val="18"/></w:rPr>'
+    "<w:t>(Klik kanan dan pilih 'Update Field' untuk memperbarui)</w:t></w:r></w:p>"
+)
+
+_skeleton = None
+_skeleton_lock = threading.Lock()
+
+
+# ========== SKELETON ==========
+def _load_skeleton():
+    """Parts of an empty styled ebook, plus document.xml split around its body"""
+    global _skeleton
+    # Imported here so the streaming path only loads python-docx when it needs a skeleton
+    from document_maker import new_styled_document, template_fingerprint, _add_page_numbers
+
+    fingerprint = template_fingerprint()
+    with _skeleton_lock:
+        if _skeleton is None or _skeleton["fingerprint"] != fingerprint:
+            doc = new_styled_document()
+            _add_page_numbers(doc)
+            buffer = BytesIO()
+            doc.save(buffer)
+
+            with zipfile.ZipFile(buffer) as package:
+                parts = [(info.filename, package.read(info.filename)) for info in package.infolist()]
+
+            document_xml = dict(parts)[DOCUMENT_PART].decode("utf-8")
+            body_start = document_xml.index("<w:body>") + len("<w:body>")
+            body_end = document_xml.index("<w:sectPr")
+            _skeleton = {
+                "fingerprint": fingerprint,
+                "parts": parts,
+                "head": document_xml[:body_start],
+                # The empty template body holds only the section properties
+                "tail": document_xml[body_end:],
+            }
+        return _skeleton
+
+
+# ========== RUNS AND PARAGRAPHS ==========
+def _run(text, props=""):
+    """A <w:r> exactly as python-docx's add_run writes it (tabs and line breaks as elements)"""
+    content = []
+    for piece in _RUN_SPECIALS.split(_INVALID_XML_CHARS.sub("", text)):
+        if not piece:
+            continue
+        if piece == "\t":
+            content.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            content.append("<w:br/>")
+        elif len(piece.strip()) < len(piece):
+            content.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+        else:
+            content.append(f"<w:t>{escape(piece)}</w:t>")
+
+    rpr = f"<w:rPr>{props}</w:rPr>" if props else ""
+    if not rpr and not content:
+        return "<w:r/>"
+    return f"<w:r>{rpr}{''.join(content)}</w:r>"
+
+
+def _paragraph(ppr, runs):
+    if not ppr and not runs:
+        return "<w:p/>"
+    ppr = f"<w:pPr>{ppr}</w:pPr>" if ppr else ""
+    return f"<w:p>{ppr}{runs}</w:p>"
+
+
+def _spans(spans):
+    bold = f'<w:b/><w:color w:val="{_HEADING_COLOR}"/>'
+    return "".join(_run(text, bold if is_bold else "") for text, is_bold in spans)
+
+
+def _heading(text, level, centered=False):
+    ppr = f'<w:pStyle w:val="Heading{level}"/>' + ('<w:jc w:val="center"/>' if centered else "")
+    return _paragraph(ppr, _run(text) if text else "")
+
+
+def _title(text):
+    props = f'<w:b/><w:color w:val="{_HEADING_COLOR}"/><w:sz w:val="44"/>'
+    return _paragraph('<w:pStyle w:val="Title"/><w:jc w:val="center"/>', _run(text, props) if text else "")
+
+
+def _block(block):
+    """WordprocessingML for one markdown_ir block, matching document_maker._render_blocks"""
+    kind = block.kind
+    if kind == markdown_ir.HEADING:
+        return _heading(block.text, block.level)
+
+    if kind == markdown_ir.ACTION_PLAN:
+        heading = _paragraph(
+            '<w:spacing w:before="240" w:after="160"/><w:jc w:val="center"/><w:shd w:fill="E8F4F8"/>',
+            _run(block.text, f'<w:b/><w:color w:val="{_HEADING_COLOR}"/><w:sz w:val="26"/>')
+        )
+        return _HORIZONTAL_LINE + heading
+
+    if kind == markdown_ir.LIST_ITEM:
+        if block.action:
+            checkbox = _run("☐ ", '<w:sz w:val="24"/>')
+            return _paragraph('<w:pStyle w:val="ListBullet"/><w:shd w:fill="F5F5F5"/>', checkbox + _spans(block.spans))
+        return _paragraph('<w:pStyle w:val="ListBullet"/>', _spans(block.spans))
+
+    first_indent = 'w:firstLine="0" ' if block.first else ""
+    if kind == markdown_ir.QUOTE:
+        ppr = (
+            '<w:spacing w:before="240" w:after="240"/>'
+            f'<w:ind {first_indent}w:left="720" w:right="720"/>'
+            '<w:jc w:val="center"/><w:shd w:fill="F0F8FF"/>' + _QUOTE_BORDER
+        )
+        return _paragraph(ppr, _run(f'"{block.text}"', f'<w:i/><w:color w:val="{_HEADING_COLOR}"/><w:sz w:val="24"/>'))
+
+    return _paragraph('<w:ind w:firstLine="0"/>' if block.first else "", _spans(block.spans))
+
+
+def _blocks(blocks):
+    return "".join(_block(block) for block in blocks)
+
+
+def section_xml(section_title, content):
+    """Preface/conclusion body: centered heading, spacer, parsed content"""
+    return (
+        _heading(section_title, 1, centered=True) + _SPACER
+        + _blocks(markdown_ir.parse(content, section_title=section_title))
+    )
+
+
+def chapter_xml(number, chapter_title, content):
+    """One chapter, starting with its page break, ready to drop into the body"""
+    return (
+        _PAGE_BREAK + _heading(f"Bab {number}: {chapter_title}", 1, centered=True) + _SPACER
+        + _blocks(markdown_ir.parse(content, strip_underscores=True))
+    )
+
+
+# ========== PACKAGE ==========
+@tracing.traced("docx.write_package")
+def write_package(target, title, preface_xml, chapter_xmls, conclusion_xml):
+    """Write a .docx from already rendered body fragments; `chapter_xmls` may be lazy"""
+    skeleton = _load_skeleton()
+
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as package:
+        for name, data in skeleton["parts"]:
+            if name != DOCUMENT_PART:
+                package.writestr(name, data)
+                continue
+
+            with package.open(DOCUMENT_PART, "w") as document:
+                def write(xml):
+                    document.write(xml.encode("utf-8"))
+
+                write(skeleton["head"])
+                write(_title(title) + _PAGE_BREAK)
+                write(preface_xml + _PAGE_BREAK)
+                write(_TABLE_OF_CONTENTS)
+                for xml in chapter_xmls:
+                    write(xml)
+                write(_PAGE_BREAK + conclusion_xml)
+                write(skeleton["tail"])
+
+
+def write_ebook(target, title, preface_content, chapters_content, conclusion_content):
+    """Write the ebook as .docx to `target` (a path or binary file), one chapter at a time
+
+    `chapters_content` may be any iterable of (title, content), including a
+    generator, so chapters never need to be held in memory together.
+    """
+    chapter_xmls = (
+        chapter_xml(number, chapter_title, content)
+        for number, (chapter_title, content) in enumerate(chapters_content, 1)
+    )
+    write_package(
+        target, title,
+        section_xml("Kata Pengantar", preface_content),
+        chapter_xmls,
+        section_xml("Penutup", conclusion_content)
+    )
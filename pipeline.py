@@ -0,0 +1,215 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+from generator import generate_outline, generate_preface, generate_conclusion
+from document_maker import EbookBuilder
+
+
+class PipelineError(Exception):
+    """A stage failed; `stage` names it and the original exception is chained"""
+
+    def __init__(self, stage, error):
+        super().__init__(str(error))
+        self.stage = stage
+        self.error = error
+
+
+class _Node:
+    def __init__(self, name, fn, deps, inline):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.inline = inline
+
+
+class Pipeline:
+    """Small DAG executor: each stage runs as soon as its dependencies are done
+
+    Stages run on a thread pool, except `inline` stages, which run on the calling
+    thread (for stages that drive UI). A stage function receives the results of its
+    dependencies as positional arguments, in the order they were declared.
+    on_node_start(name) and on_node_done(name, seconds, error) are always called on
+    the calling thread, and the durations are kept in `timings`.
+    """
+
+    def __init__(self, max_workers=4, initializer=None, on_node_start=None, on_node_done=None):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.on_node_start = on_node_start
+        self.on_node_done = on_node_done
+        self.timings = {}
+        self._nodes = {}
+
+    def add(self, name, fn, deps=(), inline=False):
+        for dep in deps:
+            if dep not in self._nodes:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._nodes[name] = _Node(name, fn, deps, inline)
+        return self
+
+    def _call(self, node, args):
+        with tracing.span(f"stage.{node.name}"):
+            return node.fn(*args)
+
+    def _start(self, node):
+        if self.on_node_start:
+            self.on_node_start(node.name)
+        return time.monotonic()
+
+    def _finish(self, node, started, error=None):
+        self.timings[node.name] = time.monotonic() - started
+        if self.on_node_done:
+            self.on_node_done(node.name, self.timings[node.name], error)
+
+    def run(self):
+        """Run every stage; returns {stage: result} or raises PipelineError for the first failure"""
+        results = {}
+        pending = dict(self._nodes)
+        running = {}
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.initializer) as executor:
+            while pending or running:
+                ready = [] if failure else [
+                    node for node in pending.values()
+                    if all(dep in results for dep in node.deps)
+                ]
+
+                for node in ready:
+                    if not node.inline:
+                        del pending[node.name]
+                        args = [results[dep] for dep in node.deps]
+                        # Pool stages still nest under the caller's span
+                        future = executor.submit(tracing.bind(self._call), node, args)
+                        running[future] = (node, self._start(node))
+
+                inline_ready = [node for node in ready if node.inline]
+                if inline_ready:
+                    node = inline_ready[0]
+                    del pending[node.name]
+                    started = self._start(node)
+                    try:
+                        results[node.name] = self._call(node, [results[dep] for dep in node.deps])
+                        self._finish(node, started)
+                    except Exception as e:
+                        self._finish(node, started, e)
+                        failure = failure or PipelineError(node.name, e)
+                    collected_failure = self._collect(running, results, block=False)
+                    failure = failure or collected_failure
+                    continue
+
+                if not running:
+                    # Nothing in flight and nothing runnable: the rest depends on a failed stage
+                    break
+
+                collected_failure = self._collect(running, results, block=True)
+                failure = failure or collected_failure
+
+        if failure:
+            raise failure from failure.error
+        return results
+
+    def _collect(self, running, results, block):
+        """Record finished pool stages; returns a PipelineError if one of them failed"""
+        failure = None
+        if not running:
+            return failure
+
+        done, _ = wait(list(running), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            node, started = running.pop(future)
+            try:
+                results[node.name] = future.result()
+                self._finish(node, started)
+            except Exception as e:
+                self._finish(node, started, e)
+                failure = failure or PipelineError(node.name, e)
+        return failure
+
+
+def build_ebook_pipeline(job, chapters_stage, build_document=True, use_cache=None, **pipeline_options):
+    """Wire the ebook stages with their real dependencies
+
+    metadata -> outline -> chapters, while preface and conclusion only need the
+    metadata (topic and form), so they run alongside the outline and chapters.
+    Every stage reuses what the job journal already holds and saves what it makes,
+    and hands its text to an EbookBuilder right away, so the document is rendered
+    while the rest is still being generated. `chapters_stage(metadata, outline,
+    on_chapter)` returns the ordered (title, content) list and should call
+    on_chapter(index, title, content) as each chapter is written. The "ebook"
+    result is the finished builder; call .save(path_or_file) on it. With
+    build_document=False there is no builder and no "ebook" stage: the journal
+    holds the book, to be written out later (e.g. only when it is downloaded).
+    `use_cache` is passed to the outline, preface and conclusion calls (None:
+    generator.cache_enabled); chapters_stage handles its own.
+    """
+    pipeline = Pipeline(**pipeline_options)
+    builder = None
+
+    def metadata_stage():
+        nonlocal builder
+        metadata = job.load_metadata()
+        if build_document:
+            builder = EbookBuilder(metadata["topic"], metadata["form_data"]["num_chapters"])
+        return metadata
+
+    def outline_stage(metadata):
+        outline = job.load_outline()
+        if not outline:
+            form_data = metadata["form_data"]
+            outline = generate_outline(metadata["topic"], form_data["num_chapters"], use_cache)
+            if not outline:
+                raise RuntimeError("Gagal membuat outline.")
+            job.save_outline(outline)
+        # The document numbers its chapters after the outline actually used
+        if builder:
+            builder.num_chapters = len(outline)
+        return outline
+
+    def preface_stage(metadata):
+        preface = job.load_preface()
+        if preface is None:
+            preface = generate_preface(metadata["topic"], metadata["form_data"], use_cache)
+            if preface:
+                job.save_preface(preface)
+        if preface and builder:
+            builder.add_preface(preface)
+        return preface
+
+    def conclusion_stage(metadata):
+        conclusion = job.load_conclusion()
+        if conclusion is None:
+            conclusion = generate_conclusion(metadata["topic"], metadata["form_data"], use_cache)
+            if conclusion:
+                job.save_conclusion(conclusion)
+        if conclusion and builder:
+            builder.add_conclusion(conclusion)
+        return conclusion
+
+    def on_chapter(index, chapter_title, content):
+        job.save_chapter(index, chapter_title, content)
+        if builder:
+            builder.add_chapter(index + 1, chapter_title, content)
+
+    def chapters_with_builder(metadata, outline):
+        chapters_content = chapters_stage(metadata, outline, on_chapter)
+        if not builder:
+            return chapters_content
+        # Chapters resumed from the journal never pass through on_chapter
+        for i, (chapter_title, content) in enumerate(chapters_content):
+            if not builder.has_chapter(i + 1):
+                builder.add_chapter(i + 1, chapter_title, content)
+        return chapters_content
+
+    def ebook_stage(metadata, preface, chapters_content, conclusion):
+        return builder.finalize()
+
+    pipeline.add("metadata", metadata_stage)
+    pipeline.add("outline", outline_stage, deps=["metadata"])
+    pipeline.add("preface", preface_stage, deps=["metadata"])
+    pipeline.add("conclusion", conclusion_stage, deps=["metadata"])
+    pipeline.add("chapters", chapters_with_builder, deps=["metadata", "outline"], inline=True)
+    if build_document:
+        pipeline.add("ebook", ebook_stage, deps=["metadata", "preface", "chapters", "conclusion"])
+    return pipeline
@@ -0,0 +1,97 @@
+"""HTML preview of an ebook, rendered from the same markdown_ir blocks as the .docx
+
+Cheap enough to redraw after every chapter, so users can read the book in the
+page and only build the .docx when they actually download it.
+"""
+import html
+
+import markdown_ir
+
+STYLE = """
+<style>
+.ebook-preview { font-family: Calibri, 'Segoe UI', sans-serif; font-size: 15px; line-height: 1.5; }
+.ebook-preview h1, .ebook-preview h2, .ebook-preview h3 { color: #003366; }
+.ebook-preview h1 { text-align: center; font-size: 1.5em; margin-top: 1.2em; }
+.ebook-preview h2 { font-size: 1.25em; }
+.ebook-preview h3 { font-size: 1.1em; }
+.ebook-preview .title { text-align: center; font-size: 2em; font-weight: bold; color: #003366; }
+.ebook-preview b { color: #003366; }
+.ebook-preview .quote { text-align: center; font-style: italic; color: #003366; background: #F0F8FF;
+    border: 1px solid #B0C4DE; margin: 1em 2.5em; padding: 0.6em; }
+.ebook-preview hr { border: 0; border-bottom: 2px solid #0066CC; margin: 1em 0; }
+.ebook-preview .action-plan { text-align: center; font-weight: bold; color: #003366; background: #E8F4F8;
+    padding: 0.4em; }
+.ebook-preview li.action { list-style: none; background: #F5F5F5; }
+.ebook-preview .page-break { border-top: 1px dashed #ccc; margin: 2em 0; }
+</style>
+"""
+
+
+def _spans(spans):
+    return "".join(
+        f"<b>{html.escape(text)}</b>" if bold else html.escape(text)
+        for text, bold in spans
+    )
+
+
+def blocks_html(blocks):
+    """HTML for a list of markdown_ir blocks; consecutive list items share one <ul>"""
+    parts = []
+    in_list = False
+    for block in blocks:
+        kind = block.kind
+        if kind != markdown_ir.LIST_ITEM and in_list:
+            parts.append("</ul>")
+            in_list = False
+
+        if kind == markdown_ir.HEADING:
+            # Level 1 is reserved for chapter titles, like in the .docx
+            parts.append(f"<h{block.level}>{html.escape(block.text)}</h{block.level}>")
+        elif kind == markdown_ir.ACTION_PLAN:
+            parts.append(f'<hr><div class="action-plan">{html.escape(block.text)}</div>')
+        elif kind == markdown_ir.LIST_ITEM:
+            if not in_list:
+                parts.append("<ul>")
+                in_list = True
+            if block.action:
+                parts.append(f'<li class="action">☐ {_spans(block.spans)}</li>')
+            else:
+                parts.append(f"<li>{_spans(block.spans)}</li>")
+        elif kind == markdown_ir.QUOTE:
+            parts.append(f'<div class="quote">"{html.escape(block.text)}"</div>')
+        else:
+            parts.append(f"<p>{_spans(block.spans)}</p>")
+
+    if in_list:
+        parts.append("</ul>")
+    return "".join(parts)
+
+
+def section_html(section_title, content):
+    return f"<h1>{html.escape(section_title)}</h1>" + blocks_html(markdown_ir.parse(content, section_title=section_title))
+
+
+def chapter_html(number, chapter_title, content):
+    return (
+        f"<h1>Bab {number}: {html.escape(chapter_title)}</h1>"
+        + blocks_html(markdown_ir.parse(content, strip_underscores=True))
+    )
+
+
+def wrap(body):
+    """Add the preview stylesheet and container around rendered HTML"""
+    return f'{STYLE}<div class="ebook-preview">{body}</div>'
+
+
+def book_html(title, preface_content, chapters_content, conclusion_content):
+    """The whole ebook in reading order, with dashed lines where the .docx breaks pages"""
+    page_break = '<div class="page-break"></div>'
+    parts = [f'<div class="title">{html.escape(title)}</div>', page_break]
+    if preface_content:
+        parts += [section_html("Kata Pengantar", preface_content), page_break]
+    for number, chapter in enumerate(chapters_content, 1):
+        if chapter is not None:
+            parts += [chapter_html(number, *chapter), page_break]
+    if conclusion_content:
+        parts.append(section_html("Penutup", conclusion_content))
+    return wrap("".join(parts))
@@ -64,20 +64,53 @@ ATURAN JUDUL BAB:
 3. Gunakan kata-kata power: "Rahasia", "Terbongkar", "Strategi", "Jalan Pintas", "Fatal", "Wajib Tahu"
 4. Hindari judul yang terlalu panjang (maksimal 10 kata)
 
-Format output: Hanya daftar judul, tanpa pengantar.
+Format output: JSON dengan daftar "chapters" berisi TEPAT {num_chapters} judul, tanpa pengantar
+dan tanpa awalan "Bab X:".
 Contoh format:
-Bab 1: [Judul]
-Bab 2: [Judul]
+{{"chapters": ["[Judul pertama]", "[Judul kedua]"]}}
 """
 
-CHAPTER_PROMPT_TEMPLATE = """
-=== INFORMASI BAB ===
+# Follow-up when the outline came back with the wrong number of chapters: the model
+# only fixes the list it already wrote, instead of writing a whole new outline
+OUTLINE_REPAIR_PROMPT_TEMPLATE = """
 Topik Ebook: {topic}
-Judul Bab: {chapter_title}
-Nomor Bab: {chapter_num}
+Jumlah Bab: {num_chapters}
 
-INSTRUKSI KHUSUS BAB INI:
-{special_instruction}
+Outline berikut berisi {actual} judul, padahal harus TEPAT {num_chapters} bab:
+{outline}
+
+Perbaiki outline ini menjadi TEPAT {num_chapters} judul bab.
+- Pertahankan judul yang sudah bagus dan urutannya.
+- Jika kelebihan: gabungkan atau buang judul yang tumpang tindih.
+- Jika kekurangan: tambahkan judul solusi yang melengkapi alur.
+- Bab 1 tetap membahas masalah/keresahan, bukan langkah-langkah.
+
+Format output: JSON {{"chapters": [...]}} tanpa awalan "Bab X:".
+"""
+
+# Choices offered by the form; the metadata suggestion must pick one of each
+TONE_OPTIONS = ["Lucu, Santai, dan Mengena", "Formal & Profesional", "Motivasi Menggebu-gebu", "Sarkas & Humoris", "Empatik & Lembut"]
+CASE_STUDY_OPTIONS = ["Kantoran umum (HR, atasan, tim)", "Bisnis Online / UMKM", "Kehidupan Rumah Tangga", "Mahasiswa / Akademik", "Freelancer / Remote Work"]
+EMOTIONAL_TONE_OPTIONS = ["Satir tajam (menyindir realitas)", "Optimis & Membangun", "Realistis & Logis", "Provokatif & Menantang"]
+
+METADATA_PROMPT_TEMPLATE = """
+Analisis topik ebook ini: "{topic}"
+
+Berikan rekomendasi metadata dalam format JSON:
+- target_audience: Siapa target pembaca spesifiknya?
+- tone: Pilih satu: {tone_options}
+- core_problem: Apa masalah utama yang diselesaikan (1-2 kalimat)?
+- core_message: Apa pesan utama ebook ini (1 kalimat)?
+- case_study_type: Pilih satu: {case_study_options}
+- emotional_tone: Pilih satu: {emotional_tone_options}
+"""
+
+# Everything a chapter prompt shares with the other chapters of the same book. It is
+# sent once per book as cached context (or as a fixed prefix when caching is not
+# available); CHAPTER_PROMPT_TEMPLATE below only carries what differs per chapter.
+BOOK_CONTEXT_TEMPLATE = """
+=== KONTEKS EBOOK ===
+Topik Ebook: {topic}
 
 Outline Lengkap Ebook:
 {outline}
@@ -151,6 +184,95 @@ LANGKAH NYATA:
 8. Akhiri dengan action plan yang jelas
 """
 
+CHAPTER_PROMPT_TEMPLATE = """
+=== INFORMASI BAB ===
+Judul Bab: {chapter_title}
+Nomor Bab: {chapter_num}
+
+INSTRUKSI KHUSUS BAB INI:
+{special_instruction}
+
+Tulis bab ini sesuai KONTEKS EBOOK di atas.
+"""
+
+# Long chapters are written as sections in parallel: first a plan of section headings,
+# then one call per section with the book context and the chapter's CHAPTER_PROMPT_TEMPLATE
+SECTION_PLAN_PROMPT_TEMPLATE = """
+=== RENCANA BAGIAN BAB ===
+Judul Bab: {chapter_title}
+Nomor Bab: {chapter_num}
+Jumlah Bagian: {section_count}
+
+INSTRUKSI KHUSUS BAB INI:
+{special_instruction}
+
+Bab ini akan ditulis dalam TEPAT {section_count} bagian yang dibaca berurutan.
+Buat subjudul untuk setiap bagian:
+- Bagian 1 adalah pembuka bab (hook dan masalah), bagian terakhir menutup bab.
+- Setiap bagian membahas satu ide yang berbeda, tanpa tumpang tindih.
+- Subjudul singkat dan jelas (maksimal 8 kata), JANGAN pakai label struktur seperti HOOK, ISI, PENUTUP, GOLDEN QUOTE atau ACTION PLAN.
+
+Format output: Hanya daftar subjudul, tanpa pengantar.
+Contoh format:
+Bagian 1: [Subjudul]
+Bagian 2: [Subjudul]
+"""
+
+SECTION_PROMPT_TEMPLATE = """
+=== MODE PENULISAN PER BAGIAN ===
+Bab ini ditulis per bagian secara terpisah, lalu digabung berurutan menjadi satu bab.
+Jika bertentangan, instruksi di sini MENGGANTIKAN "STRUKTUR BAB YANG DIHARAPKAN" dan "INSTRUKSI EKSEKUSI" di atas.
+
+Urutan bagian bab ini:
+{section_list}
+
+TUGAS ANDA: Tulis HANYA Bagian {section_num} dari {section_count}: {section_title}
+- Target panjang bagian ini: MINIMAL {word_count} kata.
+- JANGAN tulis judul bab atau subjudul bagian, langsung mulai dengan isi.
+- JANGAN membahas isi bagian lain, karena bagian lain ditulis terpisah.
+{position_instruction}
+"""
+
+SECTION_POSITION_FIRST = (
+    "- Ini bagian PEMBUKA: mulai dengan THE HOOK (cerita pendek/fakta mengejutkan).\n"
+    "- JANGAN tulis Golden Quote dan JANGAN tulis LANGKAH NYATA. Keduanya hanya ada di akhir bagian terakhir."
+)
+SECTION_POSITION_MIDDLE = (
+    "- Ini bagian TENGAH: lanjutkan alur bagian sebelumnya tanpa pembukaan ulang atau sapaan.\n"
+    "- JANGAN tulis Golden Quote dan JANGAN tulis LANGKAH NYATA. Keduanya hanya ada di akhir bagian terakhir."
+)
+SECTION_POSITION_LAST = (
+    "- Ini bagian TERAKHIR: lanjutkan alur bagian sebelumnya tanpa pembukaan ulang atau sapaan.\n"
+    "- TUTUP bab dengan GOLDEN QUOTE (1 kalimat dengan **bold**) lalu LANGKAH NYATA "
+    "(3-5 langkah konkret yang merangkum seluruh bab, bukan hanya bagian ini)."
+)
+
+# Follow-up for a chapter (or section) that was cut off by the output limit or came back too
+# short: only the tail of the text travels, and only the new part is appended to it
+CONTINUATION_PROMPT_TEMPLATE = """
+{prompt}
+
+=== LANJUTAN TULISAN ===
+Tulisan di atas sudah dimulai. Bagian akhirnya sejauh ini:
+\"\"\"
+{tail}
+\"\"\"
+
+{instruction}
+- Target tambahan: MINIMAL {word_count} kata.
+- JANGAN ulangi teks yang sudah ada, JANGAN tulis ulang judul, JANGAN beri pengantar seperti "Berikut lanjutannya".
+- Tulis HANYA lanjutannya, mulai tepat dari kata berikutnya.
+"""
+
+CONTINUATION_TRUNCATED_INSTRUCTION = (
+    "Tulisan terpotong karena batas panjang jawaban. Lanjutkan dari kalimat yang terpotong sampai tulisan selesai, "
+    "termasuk penutup yang diminta di atas."
+)
+CONTINUATION_SHORT_INSTRUCTION = (
+    "Tulisan baru {words} kata dari target {target} kata. Lanjutkan pembahasannya dengan poin, contoh dan studi kasus baru "
+    "sampai target tercapai, lalu tutup sesuai struktur yang diminta di atas."
+)
+
 PREFACE_PROMPT_TEMPLATE = """
 Topik Ebook: {topic}
 Target Pembaca: {target_audience}
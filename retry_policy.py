@@ -0,0 +1,157 @@
+"""When and how long to retry a failed Gemini call
+
+classify() sorts an exception into one of four classes, retry_after() reads the
+server's retry hint from it, and RetryPolicy turns both into a decision: rotate
+to another key right away (quota), retry the same model after a jittered
+exponential backoff (transient), or move on to the next model (permanent, blocked).
+Every call gets a RetryBudget, so the time spent sleeping is bounded per call.
+"""
+import random
+import re
+import threading
+import time
+
+QUOTA = "quota"  # 429: the key is out of quota for this model; another key may not be
+TRANSIENT = "transient"  # 5xx, deadline exceeded, dropped connection: the same request may work soon
+PERMANENT = "permanent"  # 4xx: the same request to this model will fail again
+BLOCKED = "blocked"  # the answer was withheld by the safety filter
+
+TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+TRANSIENT_MARKERS = (
+    "deadline exceeded", "deadlineexceeded", "timed out", "timeout", "temporarily unavailable",
+    "service unavailable", "serviceunavailable", "internal error", "internalservererror",
+    "connection reset", "connection aborted", "connection refused", "remote end closed",
+)
+QUOTA_MARKERS = ("resource has been exhausted", "quota exceeded", "exceeded your current quota", "rate limit")
+
+# Defaults: a few quick retries, and no call sleeps more than a minute and a half in total
+BASE_DELAY = 1.0
+MAX_DELAY = 20.0
+TRANSIENT_RETRIES = 2  # per model, before falling back to the next one
+RETRY_BUDGET = 90.0  # seconds of backoff and quota waiting per call
+MAX_ATTEMPTS = 30  # attempts per call across every key and model
+
+
+def status_code(error):
+    """HTTP status of an API error: its `code` attribute, or the number google.api_core puts first in the message"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 100 <= code < 600:
+        return code
+    match = re.match(r"\s*(\d{3})\b", str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify(error):
+    """QUOTA, TRANSIENT, PERMANENT or BLOCKED for an exception raised by a call"""
+    message = str(error).lower()
+    code = status_code(error)
+    if code == 429 or any(marker in message for marker in QUOTA_MARKERS):
+        return QUOTA
+    if "safety" in message or "blocked" in message:
+        return BLOCKED
+    if code in TRANSIENT_STATUS or any(marker in message for marker in TRANSIENT_MARKERS):
+        return TRANSIENT
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, or None
+
+    Reads a Retry-After header (REST transport), a RetryInfo retry_delay in the
+    error details (gRPC), or the "Please retry in 17.5s" sentence Gemini adds to
+    quota errors.
+    """
+    hint = getattr(error, "retry_after", None)
+    if isinstance(hint, (int, float)):
+        return float(hint)
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+
+    message = str(error)
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)(?:\s*nanos:\s*(\d+))?", message)
+    if match:
+        return int(match.group(1)) + int(match.group(2) or 0) / 1e9
+    match = re.search(r"retry in ([\d.]+)\s*(ms|s)\b", message, re.IGNORECASE)
+    if match:
+        seconds = float(match.group(1))
+        return seconds / 1000 if match.group(2).lower() == "ms" else seconds
+    return None
+
+
+class RetryBudget:
+    """What one call may still spend on retries: sleep time and attempts (None: no limit)"""
+
+    def __init__(self, seconds, max_attempts=None):
+        self.remaining = seconds
+        self.attempts_left = max_attempts
+
+    @property
+    def exhausted(self):
+        return self.attempts_left is not None and self.attempts_left <= 0
+
+    def use_attempt(self):
+        if self.attempts_left is not None:
+            self.attempts_left -= 1
+
+    def can_wait(self, seconds):
+        return not self.exhausted and seconds <= self.remaining
+
+    def spend(self, seconds):
+        self.remaining = max(0.0, self.remaining - seconds)
+
+
+class RetryPolicy:
+    """Backoff settings shared by every call; budget() starts the allowance of one call
+
+    Delays use "full jitter" (a uniform draw up to the exponential cap), so callers
+    that failed together do not retry together. A server hint replaces the
+    computed delay when it is longer.
+    """
+
+    def __init__(self, base_delay=BASE_DELAY, max_delay=MAX_DELAY, transient_retries=TRANSIENT_RETRIES,
+                 budget=RETRY_BUDGET, max_attempts=MAX_ATTEMPTS, seed=None, sleep=time.sleep):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.transient_retries = transient_retries
+        self.budget_seconds = budget
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def budget(self):
+        return RetryBudget(self.budget_seconds, self.max_attempts)
+
+    def backoff(self, retry_number, hint=None):
+        """Delay before retry number `retry_number` (0-based) of the same request"""
+        cap = min(self.max_delay, self.base_delay * (2 ** retry_number))
+        with self._lock:
+            delay = self._random.uniform(0, cap)
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+    def should_retry(self, error_class, retry_number):
+        """Whether to retry the same model after a failure of this class"""
+        return error_class == TRANSIENT and retry_number < self.transient_retries
+
+    def wait(self, budget, seconds):
+        """Sleep `seconds` out of the call's budget; False (without sleeping) if it cannot afford them"""
+        if seconds < 0 or not budget.can_wait(seconds):
+            return False
+        budget.spend(seconds)
+        if seconds:
+            self.sleep(seconds)
+        return True
+
+
+# Rotate keys and models at once and never sleep: the behavior before this module existed
+NO_RETRY = RetryPolicy(transient_retries=0, budget=0.0, max_attempts=None)
@@ -0,0 +1,151 @@
+import pytest
+
+import generator
+import metrics
+from fake_gemini import FakeGeminiBackend
+from key_pool import KeyPool
+from model_router import ModelRouter
+from response_cache import ResponseCache
+from generator import _continue_text, _merge_continuation, _strip_chapter_ending
+
+BODY = (
+    "Saat itu, **Budi** sadar bahwa ia sudah menunda terlalu lama.\n"
+    "\n"
+    "Ia pun membuka **laptop** dan mulai menulis."
+)
+
+
+# ========== _strip_chapter_ending ==========
+def test_strip_keeps_paragraphs_with_inline_bold():
+    text = "Paragraph with **bold** only.\n\nAnother **bold** sentence."
+    assert _strip_chapter_ending(text) == text
+
+
+def test_strip_keeps_body_without_ending():
+    assert _strip_chapter_ending(BODY + "\n\n") == BODY
+
+
+def test_strip_removes_quote_and_plan():
+    text = BODY + "\n\n**Mulai dari langkah kecil.**\n\nLANGKAH NYATA:\n- Tulis satu paragraf\n- Matikan notifikasi\n"
+    assert _strip_chapter_ending(text) == BODY
+
+
+def test_strip_removes_plan_with_heading_and_numbered_items():
+    text = BODY + "\n\n## Rencana Aksi\n1. Tulis satu paragraf\n2) Matikan notifikasi"
+    assert _strip_chapter_ending(text) == BODY
+
+
+def test_strip_removes_trailing_quote_only_once():
+    text = BODY + "\n\n**Kutipan pertama.**\n\n**Kutipan kedua.**"
+    assert _strip_chapter_ending(text) == BODY + "\n\n**Kutipan pertama.**"
+
+
+def test_strip_keeps_bold_paragraph_before_plan():
+    paragraph = "Ini **penting**, tapi bukan kutipan."
+    text = f"{BODY}\n\n{paragraph}\n\n**LANGKAH NYATA:**\n- Satu"
+    assert _strip_chapter_ending(text) == f"{BODY}\n\n{paragraph}"
+
+
+def test_strip_ignores_plan_phrase_inside_body():
+    text = "Kita akan menyusun langkah nyata: mulai kecil.\n\nRencana aksi:\n- poin tengah\n\nParagraf penutup."
+    assert _strip_chapter_ending(text) == text
+
+
+# ========== _continue_text ==========
+ENDING = "\n\n**Mulai dari langkah kecil.**\n\nLANGKAH NYATA:\n- Tulis satu paragraf\n- Matikan notifikasi"
+
+
+def answer_with(monkeypatch, *answers):
+    """Make the continuation calls return `answers` in order"""
+    answers = iter(answers)
+
+    def fake_call(prompt, use_cache=None, context=None, on_finish=None, **kwargs):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        if on_finish:
+            on_finish("STOP")
+        return answer
+
+    monkeypatch.setattr(generator, "generate_content_with_fallback", fake_call)
+
+
+def test_short_continuation_starts_a_new_paragraph(monkeypatch):
+    answer_with(monkeypatch, "Tambahan paragraf baru yang cukup panjang untuk menutup bab ini dengan baik." + ENDING)
+    text = BODY + ENDING
+    continued = _continue_text("prompt", text, "STOP", None, target_words=400)
+    assert continued.startswith(BODY + "\n\nTambahan paragraf baru")
+    assert continued.count("LANGKAH NYATA") == 1
+
+
+def test_short_continuation_is_never_shorter(monkeypatch):
+    # A brief answer would not make up for the quote and plan taken off before it
+    answer_with(monkeypatch, "Singkat.", "Juga singkat.")
+    text = BODY + ENDING
+    continued = _continue_text("prompt", text, "STOP", None, target_words=400)
+    assert len(continued.split()) >= len(text.split())
+    assert continued == text
+
+
+def test_failed_continuation_keeps_the_text(monkeypatch):
+    answer_with(monkeypatch, RuntimeError("503 Service Unavailable"))
+    text = BODY + ENDING
+    assert _continue_text("prompt", text, "STOP", None, target_words=400) == text
+
+
+def test_truncated_continuation_joins_mid_sentence():
+    merged, added = _merge_continuation("Ia membuka laptop dan", "mulai menulis.")
+    assert merged == "Ia membuka laptop dan mulai menulis."
+    assert added == " mulai menulis."
+
+
+def test_merge_drops_repeated_tail():
+    merged, _ = _merge_continuation("Ia membuka laptop dan mulai terpo", "laptop dan mulai terpotong di tengah.")
+    assert merged == "Ia membuka laptop dan mulai terpotong di tengah."
+
+
+# ========== response cache ==========
+@pytest.fixture
+def fake_backend(monkeypatch, tmp_path):
+    """generator.py wired to a FakeGeminiBackend with one key and an empty response cache"""
+    def install(**options):
+        monkeypatch.chdir(tmp_path)
+        fake = FakeGeminiBackend(median_latency=0.0, first_token_latency=0.0, time_scale=0.001, seed=1, **options)
+        monkeypatch.setattr(generator, "backend", fake)
+        monkeypatch.setattr(generator, "response_store", ResponseCache(str(tmp_path / "responses.db")))
+        monkeypatch.setattr(generator, "model_router", ModelRouter())
+        monkeypatch.setattr(generator, "call_metrics", metrics.Metrics())
+        monkeypatch.setattr(generator, "api_keys", [])
+        monkeypatch.setattr(generator, "key_pool", KeyPool(["fake-key-1"], rpm=100000))
+        generator.configure_genai(["fake-key-1"])
+        return fake
+    return install
+
+
+def generate_twice(prompt):
+    finish_reasons = []
+    for _ in range(2):
+        generator.generate_content_with_fallback(prompt, use_cache=True, on_finish=finish_reasons.append)
+    return finish_reasons
+
+
+def test_truncated_response_is_not_served_from_cache(fake_backend):
+    fake_backend(truncate_rate=1.0)
+    # Served from the cache, the second answer would come back without MAX_TOKENS and never be continued
+    assert generate_twice("Tulis bab\nTarget Panjang: 200 kata") == ["MAX_TOKENS", "MAX_TOKENS"]
+
+
+def test_finished_response_is_served_from_cache(fake_backend):
+    fake_backend()
+    assert generate_twice("Tulis bab\nTarget Panjang: 200 kata") == ["STOP", None]
+
+
+def test_stream_shares_the_fallback_loop(fake_backend):
+    fake_backend(truncate_rate=1.0)
+    finish_reasons = []
+    for _ in range(2):
+        chunks = list(generator.generate_content_stream(
+            "Tulis bab\nTarget Panjang: 200 kata", use_cache=True, on_finish=finish_reasons.append
+        ))
+        assert len(chunks) > 1
+    assert finish_reasons == ["MAX_TOKENS", "MAX_TOKENS"]
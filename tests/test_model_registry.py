@@ -0,0 +1,55 @@
+import pytest
+
+import model_registry
+
+KEYS = ["fake-key-1"]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    model_registry.invalidate()
+    yield str(tmp_path / "models.json")
+    model_registry.invalidate()
+
+
+class Probe:
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+
+    def __call__(self, api_key):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return ["models/gemini-2.0-flash", "models/gemini-2.5-flash"]
+
+
+def test_probe_result_is_cached(cache_path):
+    probe = Probe()
+    for _ in range(3):
+        assert model_registry.get_available_models(KEYS, probe, cache_path=cache_path) == {"gemini-2.0-flash", "gemini-2.5-flash"}
+    assert probe.calls == 1
+
+
+def test_failed_probe_is_not_repeated_within_failure_ttl(cache_path):
+    probe = Probe(error=TimeoutError("Deadline exceeded"))
+    for _ in range(3):
+        assert model_registry.get_available_models(KEYS, probe, cache_path=cache_path) is None
+    assert probe.calls == 1
+    assert model_registry.cached_models(KEYS) is None
+
+
+def test_failure_is_shared_through_the_registry_file(cache_path):
+    model_registry.get_available_models(KEYS, Probe(error=TimeoutError("Deadline exceeded")), cache_path=cache_path)
+    model_registry.invalidate()
+    probe = Probe()
+    assert model_registry.get_available_models(KEYS, probe, cache_path=cache_path) is None
+    assert probe.calls == 0
+
+
+def test_failed_probe_is_retried_after_failure_ttl(cache_path):
+    model_registry.get_available_models(KEYS, Probe(error=TimeoutError("Deadline exceeded")), cache_path=cache_path)
+    probe = Probe()
+    models = model_registry.get_available_models(KEYS, probe, cache_path=cache_path, failure_ttl=0)
+    assert models == {"gemini-2.0-flash", "gemini-2.5-flash"}
+    assert probe.calls == 1
@@ -0,0 +1,42 @@
+import time
+
+from model_router import ModelRouter
+
+MODELS = ["preferred", "second", "third"]
+
+
+def test_healthy_models_keep_preference_order():
+    router = ModelRouter()
+    for model_name, latency in zip(MODELS, (10.0, 8.0, 12.0)):
+        router.record_success(model_name, latency)
+    assert router.order(MODELS) == MODELS
+
+
+def test_slow_healthy_model_drops_behind_faster_ones():
+    router = ModelRouter()
+    router.record_success("preferred", 30.0)
+    router.record_success("second", 10.0)
+    router.record_success("third", 12.0)
+    assert router.order(MODELS) == ["second", "third", "preferred"]
+
+
+def test_degraded_models_rank_by_success_rate_then_latency():
+    router = ModelRouter(failure_threshold=10)
+    for model_name, latency in (("second", 20.0), ("third", 5.0)):
+        router.record_success(model_name, latency)
+        router.record_failure(model_name)
+        router.record_failure(model_name)
+    assert router.order(MODELS) == ["preferred", "third", "second"]
+
+
+def test_half_open_model_is_probed_first():
+    router = ModelRouter(base_backoff=0.01)
+    for _ in range(3):
+        router.record_failure("preferred")
+    assert router.order(MODELS) == ["second", "third", "preferred"]
+    time.sleep(0.02)
+    assert router.order(MODELS)[0] == "preferred"
+    # Only one call gets the probe
+    assert router.order(MODELS)[0] == "second"
+    router.record_success("preferred", 1.0)
+    assert router.order(MODELS)[0] == "preferred"
@@ -0,0 +1,206 @@
+"""Lightweight tracing: nested spans written as JSONL, viewable as a timeline
+
+Enable it with configure(path) or the EBOOK_TRACE_FILE environment variable.
+Each finished span becomes one JSON line (trace and parent IDs, start, duration,
+thread and attributes). Convert a trace file for chrome://tracing, Perfetto or
+speedscope with:
+
+    python tracing.py trace.jsonl trace.json
+
+While disabled, span() returns a shared no-op object, so instrumented code only
+pays for one attribute check.
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+_path = None
+_file = None
+_lock = threading.Lock()
+
+# Spans are timed with the monotonic clock and stamped with wall time via this offset
+_EPOCH_OFFSET = time.time() - time.monotonic()
+
+
+def configure(path):
+    """Write spans to `path` (appending), or stop tracing when `path` is None"""
+    global _path, _file
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+        _path = path
+
+
+def enabled():
+    return _path is not None
+
+
+def _write(entry):
+    global _file
+    line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        if _path is None:
+            return
+        if _file is None:
+            os.makedirs(os.path.dirname(_path) or ".", exist_ok=True)
+            _file = open(_path, "a", encoding="utf-8")
+        _file.write(line)
+        _file.flush()
+
+
+class Span:
+    """One timed operation; use through span(), or start_span() for leaf spans"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "attrs", "_token")
+
+    def __init__(self, name, parent, attrs, start=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.monotonic() if start is None else start
+        self.attrs = attrs
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, error=None, **attrs):
+        end = time.monotonic()
+        self.attrs.update(attrs)
+        entry = {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round((self.start + _EPOCH_OFFSET) * 1e6),
+            "duration": round((end - self.start) * 1e6),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        }
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+        _write(entry)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(exc)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing a block as a child of the current span"""
+    if _path is None:
+        return _NOOP
+    return Span(name, _current.get(), attrs)
+
+
+def start_span(name, start=None, **attrs):
+    """A child of the current span that is ended explicitly with .end(); never becomes current
+
+    For operations that cannot wrap a `with` block, such as an attempt inside a
+    generator that yields to its caller. `start` is a time.monotonic() value.
+    """
+    if _path is None:
+        return _NOOP
+    return Span(name, _current.get(), attrs, start)
+
+
+def annotate(**attrs):
+    """Add attributes to the current span, if there is one"""
+    if _path is None:
+        return
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def traced(name):
+    """Decorator running every call of the function inside span(name)"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _path is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn):
+    """Wrap `fn` to run in a copy of the current context, so spans on worker threads nest correctly"""
+    if _path is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# ========== EXPORT ==========
+def to_chrome_trace(jsonl_path, output_path):
+    """Convert a span JSONL file to the Chrome trace event format (complete "X" events)"""
+    events = []
+    threads = {}
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            tid = threads.setdefault((entry["pid"], entry["thread"]), len(threads) + 1)
+            args = dict(entry.get("attrs") or {})
+            args.update(trace_id=entry["trace_id"], span_id=entry["span_id"], parent_id=entry["parent_id"])
+            if "error" in entry:
+                args["error"] = entry["error"]
+            events.append({
+                "name": entry["name"], "ph": "X", "ts": entry["start"], "dur": entry["duration"],
+                "pid": entry["pid"], "tid": tid, "args": args,
+            })
+
+    for (pid, thread_name), tid in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return len(events)
+
+
+configure(os.getenv("EBOOK_TRACE_FILE") or None)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python tracing.py trace.jsonl trace.json", file=sys.stderr)
+        sys.exit(2)
+    print(f"Wrote {to_chrome_trace(sys.argv[1], sys.argv[2])} events to {sys.argv[2]}")